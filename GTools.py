@@ -5,70 +5,154 @@ import getopt, re
 import os, sys, shutil
 import subprocess, time
 # SubModules
-from modules import downloader, logparser, mkssdt
+from modules import analysis, cache, downloader, mkssdt, nsdiff, profiler, query, watcher
 
 version = 'v1.2'
 rootdir = os.getcwd()
 ssdt_dir = os.path.join(rootdir, 'SSDTs')
 dsdt_dsl_path = None
 
-parser = argparse.ArgumentParser(description=f'Generates SSDTs + useful infos starting from a SysReport. Version {version}.', prog='GTools.py')
-parser.add_argument('SysReport', help='SysReport folder full path.', nargs='?', type=str)
+parser = argparse.ArgumentParser(description=f'Generates SSDTs + useful infos starting from a SysReport. Version {version}.', prog='GTools.py',
+	formatter_class=argparse.RawDescriptionHelpFormatter, epilog='''subcommands, see GTools.py <subcommand> --help (a SysReport named like one, if there is any, is processed as a SysReport):
+  query   Looks objects up in the ACPI namespace of a SysReport, printing them as JSON.
+  diff    Compares the ACPI namespace of two DSDTs or SysReports, telling which SSDTs need regenerating.
+  watch   Watches a drop directory, processing the SysReports (folders or archives) put into it.''')
+parser.add_argument('SysReport', help='SysReport folder full path, or a zip/tar archive of it. More than one (or --batch) enables batch mode.', nargs='*', type=str)
+parser.add_argument('--batch', action='store_true', help='Batch mode: each SysReport argument can also be a folder containing many SysReports (folders or archives).')
+parser.add_argument('--workers', help='How many SysReports to process at once in batch mode. Defaults to the number of CPUs.', metavar='N', type=int)
+parser.add_argument('--output', default=ssdt_dir, help='Where the generated SSDTs are put - in batch mode, one subfolder per SysReport.', metavar='folder', type=str)
 parser.add_argument('--cleanup', action='store_true', help='Cleans up utils/iasl folder and exits.')
+parser.add_argument('--clear-cache', action='store_true', help='Clears the decompiled DSDTs cache and exits.')
+parser.add_argument('--no-cache', action='store_true', help='Neither reads nor writes the cache of decompiled DSDTs and generated SSDTs.')
 parser.add_argument('--iasl-bin', default='iasl-stable', help='Changes the default used iasl binary.', metavar='iasl_binary', type=str)
 parser.add_argument('--rebuild-iasl', action='store_true', help='Rebuild iasl module.')
 parser.add_argument('--skip-ssdtgen', action='store_true', help='Skips decompilation of DSDT and SSDTs generation.')
-args = parser.parse_args()
+parser.add_argument('--dsdt-only', action='store_true', help='Only looks into DSDT.aml, ignoring the OEM SSDTs of the SysReport.')
+parser.add_argument('--only', help='Comma separated list of the only SSDTs to generate, e.g. SSDT-PLUG,SSDT-EC.', metavar='SSDTs', type=lambda x: x.split(','))
+parser.add_argument('--skip', help='Comma separated list of SSDTs not to generate.', metavar='SSDTs', type=lambda x: x.split(','))
+parser.add_argument('--jobs', help='How many SSDTs to generate at once. Defaults to the number of CPUs.', metavar='N', type=int)
+parser.add_argument('--full-listing', action='store_true', help='Decompiles DSDT.aml with its hex listing right away, rather than only when needed.')
+parser.add_argument('--native-aml', action='store_true', help='Parses DSDT.aml directly instead of decompiling it with iasl.')
+parser.add_argument('--stream-decompile', action='store_true', help='Scans DSDT.aml while iasl decompiles it, through a FIFO rather than a .dsl file.')
+parser.add_argument('--aml-emitter', action='store_true', help='Builds the SSDTs with the built-in AML emitter, using iasl only for what it doesn\'t support.')
+parser.add_argument('--aml-crosscheck', action='store_true', help='With --aml-emitter, compiles with iasl as well and reports any difference.')
+parser.add_argument('--profile', action='store_true', help='Prints the wall time, CPU time and peak memory of each stage and subprocess at the end.')
+parser.add_argument('--trace', help='Implies --profile, and writes the stages and subprocesses as a Chrome trace (chrome://tracing, Perfetto) too.', metavar='trace.json', type=str)
+parser.add_argument('--cprofile', help='Implies --profile, and profiles the Python side of each stage with cProfile, writing the stats to the given file.', metavar='stats.prof', type=str)
 
-if args.cleanup:
-	if not downloader.is_iasl_compiled():
-		shutil.rmtree(downloader.iasl_bin_path)
-		print('Existing bin folder has been removed.')
-		sys.exit()
-	else:
-		print('No previous binary files were found.')
+def print_profile(args: argparse.Namespace, events: list = None) -> None:
+	profiler.print_summary(events)
+	if args.trace:
+		profiler.write_trace(args.trace, events)
+		print(f'\nTrace written to {args.trace}')
+	if args.cprofile:
+		print(f'\ncProfile stats written to {args.cprofile}, slowest mkssdt functions:')
+		profiler.dump_cprofile(args.cprofile)
+
+def get_subcommand(argv: list) -> str or None:
+	# A SysReport folder (or archive) named like a subcommand is still a SysReport
+	if len(argv) > 1 and argv[1] in ('query', 'diff', 'watch') and not os.path.exists(argv[1]):
+		return argv[1]
+	return None
+
+def main() -> None:
+	### Subcommands - query and diff don't need iasl to be (re)built, nor any SSDT to be generated
+	subcommand = get_subcommand(sys.argv)
+	if subcommand == 'query':
+		sys.exit(query.main(sys.argv[2:], downloader.iasl_bin_path))
+	if subcommand == 'diff':
+		sys.exit(nsdiff.main(sys.argv[2:], downloader.iasl_bin_path))
+	if subcommand == 'watch':
+		downloader.build_iasl() if downloader.is_iasl_compiled() else ... # Built once, then used by every report
+		sys.exit(watcher.main(sys.argv[2:], downloader.iasl_bin_path))
+
+	args = parser.parse_args()
+	profiling = args.profile or args.trace != None or args.cprofile != None
+	profiler.enable(args.cprofile != None) if profiling else ...
+
+	if args.cleanup:
+		if not downloader.is_iasl_compiled():
+			shutil.rmtree(downloader.iasl_bin_path)
+			print('Existing bin folder has been removed.')
+			sys.exit()
+		else:
+			print('No previous binary files were found.')
+			sys.exit()
+
+	if args.clear_cache:
+		print('The cache has been cleared.') if cache.clear() else print('No cache was found.')
 		sys.exit()
 
-if args.rebuild_iasl:
-	if not downloader.is_iasl_compiled():
-		shutil.rmtree(downloader.iasl_bin_path)
-		print('Existing bin folder has been removed.')
-	else:
-		print('No previous binary files were found.')
+	if args.rebuild_iasl:
+		if not downloader.is_iasl_compiled():
+			shutil.rmtree(downloader.iasl_bin_path)
+			print('Existing bin folder has been removed.')
+		else:
+			print('No previous binary files were found.')
+
+	''' Recompile IASL, if necessary '''
+	with profiler.stage('build_iasl'):
+		downloader.build_iasl() if downloader.is_iasl_compiled() else ...
+
+	iasl_bin = args.iasl_bin if os.path.exists(f'{args.iasl_bin}') else f'{downloader.iasl_bin_path}/{args.iasl_bin}' if os.path.exists(f'{downloader.iasl_bin_path}/{args.iasl_bin}') else sys.exit(1) if not args.iasl_bin in ('iasl-stable', 'iasl-legacy', 'iasl-dev') and args.rebuild_iasl else print('Invalid selected iasl binary. Exiting...') + sys.exit(1)
 
-''' Recompile IASL, if necessary '''
-downloader.build_iasl() if downloader.is_iasl_compiled() else ...
+	print('You must specify a SysReport folder. Exiting.') + sys.exit(1) if not args.SysReport else ...
 
-iasl_bin = args.iasl_bin if os.path.exists(f'{args.iasl_bin}') else f'{downloader.iasl_bin_path}/{args.iasl_bin}' if os.path.exists(f'{downloader.iasl_bin_path}/{args.iasl_bin}') else sys.exit(1) if not args.iasl_bin in ('iasl-stable', 'iasl-legacy', 'iasl-dev') and args.rebuild_iasl else print('Invalid selected iasl binary. Exiting...') + sys.exit(1)
+	try:
+		mkssdt.select_generators(args.only, args.skip)
+	except ValueError as e:
+		print(f'{e}. Known ones are: {", ".join(x["name"] for x in mkssdt.generators)}. Exiting.')
+		sys.exit(1)
 
-print('You must specify a SysReport folder. Exiting.') + sys.exit(1) if args.SysReport is None else ...
-print('SysReport path doesn\'t exist. Exiting.') + sys.exit(1) if not os.path.exists(args.SysReport) else ...
+	### Batch mode
+	if args.batch or len(args.SysReport) > 1:
+		if args.skip_ssdtgen or args.cprofile:
+			print(f'--{"skip-ssdtgen" if args.skip_ssdtgen else "cprofile"} is not supported in batch mode. Exiting.')
+			sys.exit(1)
+		reports = analysis.find_reports(args.SysReport)
+		if not reports:
+			print('No SysReports found. Exiting.')
+			sys.exit(1)
+		print(f'Processing {len(reports)} SysReports...')
+		# Each report already runs in its own process, keep a single SSDT per report at a time by default
+		options = {'native': args.native_aml, 'cache': not args.no_cache, 'lean': not args.full_listing, 'jobs': args.jobs or 1, 'emitter': args.aml_emitter, 'crosscheck': args.aml_crosscheck, 'ssdts': not args.dsdt_only, 'stream': args.stream_decompile, 'only': args.only, 'skip': args.skip, 'profile': profiling}
+		summaries = analysis.run_batch(reports, iasl_bin, os.path.abspath(args.output), options, args.workers)
+		analysis.print_summary(summaries)
+		# Each worker profiled the reports it got, all of them are put together
+		print_profile(args, profiler.events + [y for x in summaries for y in x.pop('profile', [])]) if profiling else ...
+		sys.exit(1 if any(x['error'] for x in summaries) else 0)
 
-sr_path = args.SysReport
-acpi_path = os.path.join(sr_path, 'SysReport', 'ACPI')
-dsdt_path = os.path.join(acpi_path, 'DSDT.aml')
+	print('SysReport path doesn\'t exist. Exiting.') + sys.exit(1) if not os.path.exists(args.SysReport[0]) else ...
 
-''' Get OC logs and get CFG Lock / MAT statuses '''
-os.chdir(sr_path)
-oc_log = logparser.get_opencore_log_filename()
-mat_status = logparser.get_mat_support_status(oc_log)
-cfg_lock_status = logparser.cfg_lock_status(oc_log)
-os.chdir(rootdir)
+	sr_path = args.SysReport[0]
+	ssdt_dir = os.path.abspath(args.output)
+	report = analysis.Analysis(sr_path, iasl_bin, ssdt_dir, {'native': args.native_aml, 'cache': not args.no_cache, 'lean': not args.full_listing, 'jobs': args.jobs, 'emitter': args.aml_emitter, 'crosscheck': args.aml_crosscheck, 'ssdts': not args.dsdt_only, 'stream': args.stream_decompile, 'only': args.only, 'skip': args.skip}, log=print)
 
-print('No DSDT.aml or ACPI folder found into the SysReport folder. Unable to proceed.') + sys.exit(1) if not os.path.exists(acpi_path) or not os.path.exists(dsdt_path) and args.skip_ssdtgen is False else ...
+	''' Get OC logs and get CFG Lock / MAT statuses '''
+	mat_status, cfg_lock_status = report.read_log()
+
+	print('No DSDT.aml or ACPI folder found into the SysReport folder. Unable to proceed.') + sys.exit(1) if not report.source.exists(analysis.acpi_folder) or not report.has_dsdt() and args.skip_ssdtgen is False else ...
+
+	### SSDT Generation
+	if args.skip_ssdtgen is False:
+		try:
+			report.generate()
+		except (FileNotFoundError, ValueError) as e:
+			print(f'Unable to generate the SSDTs: {e}')
+	else:
+		print('DSDT decompilation and SSDT generation has been disabled via flag.')
+	report.close()
 
-### SSDT Generation
-if args.skip_ssdtgen is False:
-	shutil.rmtree(ssdt_dir) if os.path.exists(ssdt_dir) else os.mkdir(ssdt_dir)
-	tbp = {'dsdt': f'{dsdt_path}', 'iasl_bin': f'{iasl_bin}'}
-	mkssdt.main(tbp)
-else:
-	print('DSDT decompilation and SSDT generation has been disabled via flag.')
+	os.system('clear') if not profiling else ... # That would wipe the profile out
 
-os.system('clear')
+	os.system(f'open {ssdt_dir}') and print('The generated SSDT folder has been opened.') if args.skip_ssdtgen is False else ...
+	print(f'Useful infos regarding this SysReport:')
+	print(f'''- MAT Status is: {'1' if mat_status else '0'}''')
+	print(f'''- CFG Lock Status is: {'1' if cfg_lock_status else '0'}''')
+	print(f'- Peak memory usage: {analysis.format_rss(analysis.get_peak_rss())}')
+	print_profile(args) if profiling else ...
+	print('Finished! Have a good day :)')
 
-os.system(f'open {ssdt_dir}') and print('The generated SSDT folder has been opened.') if args.skip_ssdtgen is False else ...
-print(f'Useful infos regarding this SysReport:')
-print(f'''- MAT Status is: {'1' if mat_status else '0'}''')
-print(f'''- CFG Lock Status is: {'1' if cfg_lock_status else '0'}''')
-print('Finished! Have a good day :)')
\ No newline at end of file
+# Only when run as a script - batch and watch workers import it again when started through spawn (macOS)
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,141 @@
+'''
+Times every stage of mkssdt on synthetic DSDTs of growing size, writing the results as JSON.
+Runs anywhere - stub_iasl.py stands in for iasl - e.g. python3 benchmarks/run.py --sizes 1000,10000,100000
+'''
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import analysis, mkssdt
+import synthetic
+
+stub_iasl = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_iasl.py')
+results_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+samples = 1000 # Objects looked at by the per-object stages, spread over the whole namespace
+hids = ('PNP0C09', 'ACPI000E', 'PNP0B00', 'PNP0A08')
+
+def timed(stages: dict, name: str, func: callable, *args):
+	start = time.perf_counter()
+	result = func(*args)
+	stages[name] = time.perf_counter() - start
+	return result
+
+def spread(items: list, count: int = samples) -> list:
+	# Up to count items evenly picked all over items
+	step = max(1, len(items) // count)
+	return items[::step][:count]
+
+def run_once(aml: bytes, folder: str) -> dict:
+	'''Runs every stage once over the given synthetic DSDT, returning {stage: seconds}'''
+	stages = {}
+	dsl = timed(stages, 'decompile', mkssdt.decompile, aml, stub_iasl)
+	tables = [{'name': 'DSDT.aml', 'start': 0, 'aml': aml}]
+
+	# The steps of DsdtContext.load_dsl(), one by one
+	lines = timed(stages, 'lines', mkssdt.DslLines, dsl)
+	code, spans, next_open, scope = timed(stages, 'scope_extraction', mkssdt.build_spans, lines, True)
+	paths = timed(stages, 'resolve_paths', lambda: mkssdt.resolve_paths((lines[x], x) for x in scope))
+	timed(stages, 'namespace_index', mkssdt.build_namespace_index, paths)
+	ctx = mkssdt.DsdtContext()
+	ctx.iasl_bin = stub_iasl
+	timed(stages, 'load_dsl', ctx.load_dsl, dsl, True, None, tables)
+	# Both at once - the DSL is scanned while being decompiled
+	table = {'name': 'DSDT.aml', 'aml': aml}
+	timed(stages, 'decompile_and_load_dsl_streamed', mkssdt.DsdtContext().load_dsl, mkssdt.DslStream([(table, mkssdt.decompile_stream(aml, stub_iasl))]), True, None, [table])
+
+	# Lookups - each get_path_starting_at() call walks the scope backwards up to the top of the table, a hundred of them say enough
+	objects = spread(range(len(ctx.scope)), 100)
+	timed(stages, f'get_path_starting_at[{len(objects)}]', lambda: [ctx.get_path_starting_at(x) for x in objects])
+	devices = spread(ctx.index['type'].get('device', []))
+	timed(stages, f'get_device_paths[{len(devices)}]', lambda: [ctx.get_device_paths(x[0].split('.')[-1]) for x in devices])
+	timed(stages, 'hid_index', ctx.get_hid_index)
+	timed(stages, f'get_device_paths_with_hid[{len(hids)}]', lambda: [ctx.get_device_paths_with_hid(x) for x in hids])
+	timed(stages, f'get_scope[{len(devices)}]', lambda: [ctx.get_scope(x[1], strip_comments=True) for x in devices])
+	timed(stages, 'get_listing', ctx.get_listing)
+	timed(stages, f'get_scope_hex[{len(devices)}]', lambda: [ctx.get_scope(x[1], add_hex=True) for x in devices])
+
+	# Platform facts first, so that each generator is timed on its own
+	for name in mkssdt.platform_facts:
+		timed(stages, f'fact:{name}', ctx.get_fact, name)
+	dsls = []
+	for generator in mkssdt.generators:
+		ssdt = timed(stages, f'generator:{generator["name"]}', generator['func'], ctx, lambda *x: None)
+		if ssdt:
+			dsls.append(os.path.join(folder, f'{generator["name"]}.dsl'))
+			with open(dsls[-1], 'w') as f:
+				f.write(ssdt)
+	timed(stages, f'compile[{len(dsls)}]', mkssdt.compile_ssdts, dsls, stub_iasl)
+
+	# And the whole of it, as a user would run it
+	with open(os.path.join(folder, 'DSDT.aml'), 'wb') as f:
+		f.write(aml)
+	with contextlib.redirect_stdout(io.StringIO()):
+		timed(stages, 'main', mkssdt.main, {'dsdt': os.path.join(folder, 'DSDT.aml'), 'iasl_bin': stub_iasl, 'cache': False, 'results_folder': os.path.join(folder, 'SSDTs')})
+	return stages
+
+def run(sizes: list, depth: int, repeat: int, seed: int) -> dict:
+	results = {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'version': mkssdt.version, 'commit': get_commit(),
+		'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(), 'depth': depth, 'repeat': repeat, 'seed': seed, 'sizes': []}
+	for size in sizes:
+		dsl = synthetic.generate_dsl(size, depth, seed)
+		aml = synthetic.wrap_aml(dsl)
+		runs = []
+		for i in range(repeat):
+			folder = tempfile.mkdtemp(prefix='gtools-bench-')
+			try:
+				runs.append(run_once(aml, folder))
+			finally:
+				shutil.rmtree(folder, ignore_errors=True)
+		# The best run is the least disturbed by anything else going on
+		stages = {x: {'min': min(y[x] for y in runs), 'runs': [y[x] for y in runs]} for x in runs[0]}
+		results['sizes'].append({'objects': size, 'lines': dsl.count('\n') + 1, 'stages': stages})
+		print(f'\n{size} objects, {dsl.count(chr(10)) + 1} lines - best of {repeat}:')
+		for x in stages:
+			print(f' - {x}: {stages[x]["min"] * 1000:.1f} ms')
+	results['peak_rss'] = analysis.get_peak_rss()
+	return results
+
+def compare(results: dict, baseline: dict) -> None:
+	# Prints how much each stage changed since the baseline run, for the sizes both have
+	old = {x['objects']: x['stages'] for x in baseline['sizes']}
+	for size in results['sizes']:
+		if size['objects'] not in old: continue
+		print(f'\n{size["objects"]} objects, against {baseline.get("commit") or baseline["date"]}:')
+		for x,y in size['stages'].items():
+			if x not in old[size['objects']] or not old[size['objects']][x]['min']: continue
+			print(f' - {x}: {(y["min"] / old[size["objects"]][x]["min"] - 1) * 100:+.0f}%')
+
+def get_commit() -> str or None:
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+if __name__=='__main__':
+	parser = argparse.ArgumentParser(description='Times every stage of the SSDT generation on synthetic DSDTs.', prog='run.py')
+	parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated number of objects of each DSDT.', metavar='N,N', type=lambda x: [int(y) for y in x.split(',')])
+	parser.add_argument('--depth', default=4, help='How deep PCI bridges get nested.', metavar='N', type=int)
+	parser.add_argument('--repeat', default=3, help='How many times each size is run, the best run being kept.', metavar='N', type=int)
+	parser.add_argument('--seed', default=0, help='Seed of the synthetic DSDTs - the same one always gives the same tables.', metavar='N', type=int)
+	parser.add_argument('--output', help='JSON file the results are written to. Defaults to benchmarks/results/<date>.json.', metavar='file', type=str)
+	parser.add_argument('--baseline', help='JSON file of an earlier run to compare against.', metavar='file', type=str)
+	args = parser.parse_args()
+	results = run(args.sizes, args.depth, args.repeat, args.seed)
+	output = args.output or os.path.join(results_path, results['date'].replace(':', '-') + '.json')
+	os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+	with open(output, 'w') as f:
+		json.dump(results, f, indent=2)
+	print(f'\nResults written to {output}')
+	if args.baseline:
+		with open(args.baseline) as f:
+			compare(results, json.load(f))
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+'''
+Stands in for iasl in the benchmarks, so they run without building it. Tables are the ones written
+by synthetic.wrap_aml(): "decompiling" one gives its DSL back (-l adding the hex listing), and "compiling"
+an SSDT gives a mere table header. Either way it launches like iasl does, one process per run.
+'''
+
+import os
+import struct
+import sys
+import synthetic
+
+args = sys.argv[1:]
+files = [x for x in args if not x.startswith('-')]
+if '-da' in args or '-d' in args:
+	for x in files:
+		with open(x, 'rb') as f:
+			dsl = synthetic.unwrap_aml(f.read())
+		with open(os.path.splitext(x)[0] + '.dsl', 'w') as f:
+			f.write(synthetic.add_listing(dsl) if '-l' in args else dsl)
+else:
+	for x in files:
+		with open(x, 'rb') as f:
+			size = len(f.read())
+		with open(os.path.splitext(x)[0] + '.aml', 'wb') as f:
+			f.write(struct.pack('<4sI', b'SSDT', size) + bytes(synthetic.header_size - 8))
@@ -0,0 +1,156 @@
+'''Generates synthetic decompiled DSDTs of any size, shaped like real ones, for the benchmarks'''
+
+import random
+import struct
+
+header_size = 36
+
+def add_listing(dsl: str) -> str:
+	# What iasl -l adds - a hex line after each line of code, with its offset in the AML
+	lines = []
+	offset = header_size
+	for line in dsl.split('\n'):
+		lines.append(line)
+		if line.strip() and not line.lstrip().startswith(('/*', '*', '//')):
+			lines.append(f'        {offset:08X}:  5B 82 4B 04 45 43 30 5F  // [.K.EC0_')
+			offset += 8
+	return '\n'.join(lines)
+
+def wrap_aml(dsl: str, signature: str = 'DSDT') -> bytes:
+	'''
+	A table header followed by the DSL itself - not actual AML, but what the stub iasl (see stub_iasl.py)
+	"decompiles" back, and a different DSL is a different table as far as the cache is concerned.
+	'''
+	body = dsl.encode()
+	return struct.pack('<4sIBB6s8sI4sI', signature.encode(), header_size + len(body), 2, 0, b'GTOOLS', b'SYNTH   ', 1, b'INTL', 0x20200925) + body
+
+def unwrap_aml(aml: bytes) -> str:
+	return aml[header_size:].decode()
+
+def generate_dsl(objects: int = 1000, depth: int = 4, seed: int = 0, listing: bool = False) -> str:
+	'''
+	Decompiled DSDT with about the given number of objects (Device/Method/Name/Processor), as iasl -da -dl prints it.
+	PCI bridges nest up to depth levels, and beneath them sit plain devices along with ECs (PNP0C09),
+	USB controllers with their RHUB, AWAC clocks (ACPI000E) and objects defined through ^ (caret) paths.
+	The same arguments always give the same DSL.
+	'''
+	rng = random.Random(seed)
+	lines = []
+	count = [0]
+	names = {}
+	def emit(pad: int, text: str, obj: bool = False) -> None:
+		lines.append('    '*pad + text)
+		if obj: count[0] += 1
+	def name(prefix: str) -> str:
+		# Unique 4 chars names, a letter followed by a base 36 counter
+		number = names[prefix] = names.get(prefix, -1) + 1
+		digits = ''
+		for i in range(3):
+			number, digit = divmod(number, 36)
+			digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'[digit] + digits
+		return prefix + digits
+	def status(pad: int, value: str = '0x0F') -> None:
+		emit(pad, 'Method (_STA, 0, NotSerialized)  // _STA: Status', True)
+		emit(pad, '{')
+		emit(pad+1, f'Return ({value})')
+		emit(pad, '}')
+	def leaf(pad: int) -> None:
+		kind = rng.random()
+		if kind < 0.02:
+			emit(pad, f'Device ({name("E")})', True)
+			emit(pad, '{')
+			emit(pad+1, 'Name (_HID, EisaId ("PNP0C09") /* Embedded Controller Device */)  // _HID: Hardware ID', True)
+			emit(pad+1, 'Name (_GPE, 0x17)  // _GPE: General Purpose Events', True)
+			status(pad+1)
+			emit(pad, '}')
+		elif kind < 0.03:
+			emit(pad, f'Device ({name("A")})', True)
+			emit(pad, '{')
+			emit(pad+1, 'Name (_HID, "ACPI000E")  // _HID: Hardware ID', True)
+			emit(pad+1, 'Method (_STA, 0, NotSerialized)  // _STA: Status', True)
+			emit(pad+1, '{')
+			emit(pad+2, 'If ((STAS == Zero))')
+			emit(pad+2, '{')
+			emit(pad+3, 'Return (0x0F)')
+			emit(pad+2, '}')
+			emit(pad+2, 'Return (Zero)')
+			emit(pad+1, '}')
+			emit(pad, '}')
+		elif kind < 0.08:
+			emit(pad, f'Device ({name("X")})', True)
+			emit(pad, '{')
+			emit(pad+1, f'Name (_ADR, 0x{rng.randrange(1 << 32):08X})  // _ADR: Address', True)
+			emit(pad+1, 'Device (RHUB)', True)
+			emit(pad+1, '{')
+			emit(pad+2, 'Name (_ADR, Zero)  // _ADR: Address', True)
+			emit(pad+1, '}')
+			emit(pad, '}')
+		elif kind < 0.1:
+			emit(pad, f'Device ({name("C")})', True)
+			emit(pad, '{')
+			emit(pad+1, f'Method (^^{name("M")}, 0, NotSerialized)', True)
+			emit(pad+1, '{')
+			emit(pad+1, '}')
+			emit(pad+1, f'Name (^{name("N")}, One)', True)
+			emit(pad, '}')
+		else:
+			emit(pad, f'Device ({name("D")})', True)
+			emit(pad, '{')
+			emit(pad+1, f'Name (_ADR, 0x{rng.randrange(1 << 32):08X})  // _ADR: Address', True)
+			if rng.random() < 0.1:
+				emit(pad+1, 'Name (_CID, Package (0x02)  // _CID: Compatible ID', True)
+				emit(pad+1, '{')
+				emit(pad+2, 'EisaId ("PNP0C02"), ')
+				emit(pad+2, '"PNP0C01"')
+				emit(pad+1, '})')
+			status(pad+1)
+			emit(pad, '}')
+	def bridge(pad: int, level: int) -> None:
+		emit(pad, f'Device ({name("B")})', True)
+		emit(pad, '{')
+		emit(pad+1, f'Name (_ADR, 0x{rng.randrange(1 << 32):08X})  // _ADR: Address', True)
+		for i in range(rng.randrange(4, 16)):
+			if count[0] >= objects: break
+			bridge(pad+1, level+1) if level < depth and rng.random() < 0.2 else leaf(pad+1)
+		emit(pad, '}')
+
+	lines.extend(['/*', ' * Intel ACPI Component Architecture', ' * Synthetic DSDT, see benchmarks/synthetic.py', ' */'])
+	emit(0, 'DefinitionBlock ("", "DSDT", 2, "GTOOLS", "SYNTH", 0x00000001)')
+	emit(0, '{')
+	emit(1, 'External (_SB_.PCI0.XHC1, DeviceObj)')
+	emit(1, 'Name (PICM, Zero)', True)
+	emit(1, 'Scope (_PR)')
+	emit(1, '{')
+	for i in range(8):
+		emit(2, f'Processor (CPU{i}, 0x{i+1:02X}, 0x00000410, 0x06) {{}}', True)
+	emit(1, '}')
+	emit(1, 'Scope (_SB)')
+	emit(1, '{')
+	emit(2, 'Device (PCI0)', True)
+	emit(2, '{')
+	emit(3, 'Name (_HID, EisaId ("PNP0A08") /* PCI Express Bus */)  // _HID: Hardware ID', True)
+	emit(3, 'Name (_CID, EisaId ("PNP0A03") /* PCI Bus */)  // _CID: Compatible ID', True)
+	emit(3, 'Device (LPCB)', True)
+	emit(3, '{')
+	emit(4, 'Name (_ADR, 0x001F0000)  // _ADR: Address', True)
+	emit(4, 'Device (RTC)', True)
+	emit(4, '{')
+	emit(5, 'Name (_HID, EisaId ("PNP0B00") /* AT Real-Time Clock */)  // _HID: Hardware ID', True)
+	emit(4, '}')
+	emit(3, '}')
+	emit(3, 'Device (XHC1)', True)
+	emit(3, '{')
+	emit(4, 'Name (_ADR, 0x00140000)  // _ADR: Address', True)
+	emit(4, 'Device (RHUB)', True)
+	emit(4, '{')
+	emit(5, 'Name (_ADR, Zero)  // _ADR: Address', True)
+	emit(4, '}')
+	emit(3, '}')
+	while count[0] < objects:
+		bridge(3, 1)
+	emit(2, '}')
+	emit(1, '}')
+	emit(0, '}')
+	emit(0, '')
+	dsl = '\n'.join(lines)
+	return add_listing(dsl) if listing else dsl
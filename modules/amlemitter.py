@@ -0,0 +1,363 @@
+# Copyright (C) 2021-2022 Giovix92
+
+'''
+Minimal in-process ASL compiler, covering only what the SSDT templates in mkssdt use.
+Anything outside of that raises EmitError, and the caller falls back to iasl.
+'''
+
+import re
+import struct
+try:
+	from modules.amlparser import (ZERO_OP, ONE_OP, ONES_OP, BYTE_PREFIX, WORD_PREFIX, DWORD_PREFIX, STRING_PREFIX, QWORD_PREFIX, NAME_OP, SCOPE_OP, BUFFER_OP, PACKAGE_OP, METHOD_OP, EXTERNAL_OP, DUAL_NAME_PREFIX, MULTI_NAME_PREFIX, EXT_OP_PREFIX, IF_OP, ELSE_OP, RETURN_OP, EXT_COND_REF_OF_OP, EXT_DEVICE_OP)
+except ImportError: # Called from within modules/
+	from amlparser import (ZERO_OP, ONE_OP, ONES_OP, BYTE_PREFIX, WORD_PREFIX, DWORD_PREFIX, STRING_PREFIX, QWORD_PREFIX, NAME_OP, SCOPE_OP, BUFFER_OP, PACKAGE_OP, METHOD_OP, EXTERNAL_OP, DUAL_NAME_PREFIX, MULTI_NAME_PREFIX, EXT_OP_PREFIX, IF_OP, ELSE_OP, RETURN_OP, EXT_COND_REF_OF_OP, EXT_DEVICE_OP)
+
+LOCAL0_OP, ARG0_OP, LNOT_OP, STORE_OP = 0x60, 0x68, 0x92, 0x70
+
+# Reported in the table header, as iasl would
+CREATOR_ID, CREATOR_REVISION = b'INTL', 0x20200925
+
+OBJECT_TYPES = {
+	'UnknownObj': 0, 'IntObj': 1, 'StrObj': 2, 'BuffObj': 3, 'PkgObj': 4, 'FieldUnitObj': 5, 'DeviceObj': 6, 'EventObj': 7,
+	'MethodObj': 8, 'MutexObj': 9, 'OpRegionObj': 10, 'PowerResObj': 11, 'ProcessorObj': 12, 'ThermalZoneObj': 13,
+	'BuffFieldObj': 14, 'DDBHandleObj': 15,
+}
+
+TOKENS = re.compile(r'''
+	(?P<skip>\s+|//[^\n]*|/\*.*?\*/) |
+	(?P<string>"[^"]*") |
+	(?P<number>0[xX][0-9A-Fa-f]+|\d+) |
+	(?P<name>[\\^]*[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*) |
+	(?P<punct>[(){},;=!])
+''', re.VERBOSE | re.DOTALL)
+NAME_SEG = re.compile(r'[A-Z_][A-Z0-9_]{0,3}')
+
+class EmitError(Exception):
+	pass
+
+def pkg_length(content: bytes) -> bytes:
+	# Prefixes content with the shortest PkgLength able to hold it - the length counts its own bytes too
+	size = len(content) + 1
+	if size < 0x40: return bytes([size]) + content
+	for count in (2, 3, 4):
+		size = len(content) + count
+		if size < 1 << (4 + 8*(count-1)):
+			return bytes([((count-1) << 6) | (size & 0x0F)]) + (size >> 4).to_bytes(count-1, 'little') + content
+	raise EmitError('Package too long')
+
+def integer(value: int) -> bytes:
+	if value == 0: return bytes([ZERO_OP])
+	if value == 1: return bytes([ONE_OP])
+	if value == 0xFFFFFFFFFFFFFFFF: return bytes([ONES_OP])
+	for prefix,fmt,limit in ((BYTE_PREFIX, '<B', 0xFF), (WORD_PREFIX, '<H', 0xFFFF), (DWORD_PREFIX, '<I', 0xFFFFFFFF), (QWORD_PREFIX, '<Q', 0xFFFFFFFFFFFFFFFF)):
+		if value <= limit: return bytes([prefix]) + struct.pack(fmt, value)
+	raise EmitError(f'Integer out of range: {value:#x}')
+
+def encode_eisa_id(eisa_id: str) -> int:
+	if not re.fullmatch(r'[A-Z]{3}[0-9A-F]{4}', eisa_id):
+		raise EmitError(f'Invalid EisaId: {eisa_id}')
+	vendor = sum((ord(x) - 0x40) << y for x,y in zip(eisa_id[:3], (10, 5, 0)))
+	return int.from_bytes(bytes([vendor >> 8, vendor & 0xFF, int(eisa_id[3:5], 16), int(eisa_id[5:], 16)]), 'little')
+
+def name_string(path: str) -> bytes:
+	prefix = re.match(r'[\\^]*', path).group()
+	segments = path[len(prefix):].split('.') if path[len(prefix):] else []
+	for x in segments:
+		if not NAME_SEG.fullmatch(x):
+			raise EmitError(f'Invalid name: {path}')
+	segments = [x.ljust(4, '_').encode() for x in segments]
+	if not segments: body = b'\x00'
+	elif len(segments) == 1: body = segments[0]
+	elif len(segments) == 2: body = bytes([DUAL_NAME_PREFIX]) + b''.join(segments)
+	else: body = bytes([MULTI_NAME_PREFIX, len(segments)]) + b''.join(segments)
+	return prefix.encode() + body
+
+def checksum(table: bytes) -> int:
+	return (-sum(table)) & 0xFF
+
+class AslCompiler:
+	'''
+	Recursive descent over the tokens of the source, emitting AML as it goes.
+	External declarations are gathered aside and emitted at the top of the table, like iasl does.
+	'''
+
+	def __init__(self, dsl: str) -> None:
+		self.tokens = []
+		pos = 0
+		while pos < len(dsl):
+			match = TOKENS.match(dsl, pos)
+			if not match:
+				raise EmitError(f'Unexpected character {dsl[pos]!r} at offset {pos}')
+			if match.lastgroup != 'skip':
+				self.tokens.append((match.lastgroup, match.group()))
+			pos = match.end()
+		self.pos = 0
+		self.externals = []
+
+	def peek(self, offset: int = 0) -> str or None:
+		return self.tokens[self.pos + offset][1] if self.pos + offset < len(self.tokens) else None
+
+	def next(self, kind: str = None) -> str:
+		if self.pos >= len(self.tokens):
+			raise EmitError('Unexpected end of source')
+		token_kind, value = self.tokens[self.pos]
+		if kind and token_kind != kind:
+			raise EmitError(f'Expected {kind}, got {value!r}')
+		self.pos += 1
+		return value
+
+	def expect(self, value: str) -> None:
+		if self.next() != value:
+			raise EmitError(f'Expected {value!r}, got {self.tokens[self.pos-1][1]!r}')
+
+	def accept(self, value: str) -> bool:
+		if self.peek() == value:
+			self.pos += 1
+			return True
+		return False
+
+	def args(self) -> list:
+		# ( a, b, , c ) - omitted arguments come back as None
+		self.expect('(')
+		args = []
+		if self.accept(')'): return args
+		while True:
+			args.append(None if self.peek() in (',', ')') else self.tokens[self.pos])
+			if args[-1]: self.pos += 1
+			if self.accept(')'): return args
+			self.expect(',')
+
+	def number(self) -> int:
+		value = self.next()
+		if value in ('Zero', 'One', 'Ones'): return {'Zero': 0, 'One': 1, 'Ones': 0xFFFFFFFFFFFFFFFF}[value]
+		try: return int(value, 0) if not value.isdigit() else int(value)
+		except ValueError: raise EmitError(f'Expected an integer, got {value!r}')
+
+	def string(self) -> str:
+		return self.next('string')[1:-1]
+
+	def compile(self) -> bytes:
+		if self.next() != 'DefinitionBlock':
+			raise EmitError('Missing DefinitionBlock')
+		self.expect('(')
+		self.string()
+		header = []
+		for parse in (self.string, self.number, self.string, self.string, self.number):
+			self.expect(',')
+			header.append(parse())
+		self.expect(')')
+		signature, revision, oem_id, table_id, oem_revision = header
+		if len(signature) != 4 or len(oem_id) > 6 or len(table_id) > 8:
+			raise EmitError('Invalid DefinitionBlock header')
+		body = self.block()
+		if self.pos != len(self.tokens):
+			raise EmitError(f'Unexpected {self.peek()!r} after the DefinitionBlock')
+		if self.externals:
+			body = bytes([IF_OP]) + pkg_length(bytes([ZERO_OP]) + b''.join(self.externals)) + body
+		table = bytearray(signature.encode() + struct.pack('<IBB', 36 + len(body), revision, 0))
+		table += oem_id.encode().ljust(6, b'\0') + table_id.encode().ljust(8, b'\0')
+		table += struct.pack('<I', oem_revision) + CREATOR_ID + struct.pack('<I', CREATOR_REVISION) + body
+		table[9] = checksum(table)
+		return bytes(table)
+
+	def block(self) -> bytes:
+		self.expect('{')
+		out = b''
+		while not self.accept('}'):
+			out += self.term()
+		return out
+
+	def term(self) -> bytes:
+		keyword = self.peek()
+		if keyword == ';':
+			self.pos += 1
+			return b''
+		if keyword == 'External':
+			self.pos += 1
+			args = self.args()
+			if len(args) < 2 or not args[0] or not args[1] or args[1][1] not in OBJECT_TYPES:
+				raise EmitError('Unsupported External declaration')
+			self.externals.append(bytes([EXTERNAL_OP]) + name_string(args[0][1]) + bytes([OBJECT_TYPES[args[1][1]], 0]))
+			return b''
+		if keyword in ('Scope', 'Device'):
+			self.pos += 1
+			self.expect('(')
+			name = name_string(self.next('name'))
+			self.expect(')')
+			op = bytes([SCOPE_OP]) if keyword == 'Scope' else bytes([EXT_OP_PREFIX, EXT_DEVICE_OP])
+			return op + pkg_length(name + self.block())
+		if keyword == 'Method':
+			self.pos += 1
+			self.expect('(')
+			name = name_string(self.next('name'))
+			flags = 0
+			if self.accept(','): flags = self.number()
+			if self.accept(','):
+				serialize = self.next()
+				if serialize not in ('Serialized', 'NotSerialized'):
+					raise EmitError(f'Unsupported method flag {serialize}')
+				flags |= 0x08 if serialize == 'Serialized' else 0
+			if self.accept(','): flags |= self.number() << 4
+			self.expect(')')
+			if flags > 0xFF: raise EmitError('Invalid method flags')
+			return bytes([METHOD_OP]) + pkg_length(name + bytes([flags]) + self.block())
+		if keyword == 'Name':
+			self.pos += 1
+			self.expect('(')
+			name = name_string(self.next('name'))
+			self.expect(',')
+			value = self.expression()
+			self.expect(')')
+			return bytes([NAME_OP]) + name + value
+		if keyword == 'If':
+			self.pos += 1
+			self.expect('(')
+			predicate = self.expression()
+			self.expect(')')
+			out = bytes([IF_OP]) + pkg_length(predicate + self.block())
+			if self.accept('Else'):
+				out += bytes([ELSE_OP]) + pkg_length(self.term() if self.peek() == 'If' else self.block())
+			return out
+		if keyword == 'Return':
+			self.pos += 1
+			self.expect('(')
+			value = bytes([ZERO_OP]) if self.peek() == ')' else self.expression()
+			self.expect(')')
+			return bytes([RETURN_OP]) + value
+		if keyword == 'Store':
+			self.pos += 1
+			self.expect('(')
+			value = self.expression()
+			self.expect(',')
+			target = self.super_name()
+			self.expect(')')
+			return bytes([STORE_OP]) + value + target
+		if self.peek(1) == '=':
+			# ASL+ assignment - Store with the operands swapped
+			target = self.super_name()
+			self.expect('=')
+			return bytes([STORE_OP]) + self.expression() + target
+		return self.expression()
+
+	def super_name(self) -> bytes:
+		value = self.next('name')
+		if re.fullmatch(r'Local[0-7]', value): return bytes([LOCAL0_OP + int(value[-1])])
+		if re.fullmatch(r'Arg[0-6]', value): return bytes([ARG0_OP + int(value[-1])])
+		return name_string(value)
+
+	def expression(self) -> bytes:
+		kind, value = self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+		if value == '(':
+			self.pos += 1
+			out = self.expression()
+			self.expect(')')
+			return out
+		if value == '!':
+			self.pos += 1
+			return bytes([LNOT_OP]) + self.expression()
+		if kind == 'number' or value in ('Zero', 'One', 'Ones'):
+			return integer(self.number())
+		if kind == 'string':
+			return bytes([STRING_PREFIX]) + self.string().encode() + b'\0'
+		if value == 'EisaId':
+			self.pos += 1
+			self.expect('(')
+			eisa_id = encode_eisa_id(self.string())
+			self.expect(')')
+			return integer(eisa_id)
+		if value == 'Buffer':
+			self.pos += 1
+			self.expect('(')
+			size = None if self.peek() == ')' else self.number()
+			self.expect(')')
+			data = bytes(self.byte_list())
+			size = len(data) if size == None else size
+			if size < len(data): raise EmitError('Buffer initializer longer than its size')
+			return bytes([BUFFER_OP]) + pkg_length(integer(size) + data)
+		if value == 'Package':
+			self.pos += 1
+			self.expect('(')
+			count = None if self.peek() == ')' else self.number()
+			self.expect(')')
+			self.expect('{')
+			elements = []
+			while not self.accept('}'):
+				elements.append(self.expression())
+				if not self.accept(','):
+					self.expect('}')
+					break
+			count = len(elements) if count == None else count
+			if not len(elements) <= count <= 0xFF: raise EmitError('Invalid Package size')
+			return bytes([PACKAGE_OP]) + pkg_length(bytes([count]) + b''.join(elements))
+		if value == 'ResourceTemplate':
+			self.pos += 1
+			self.expect('(')
+			self.expect(')')
+			data = self.resource_template()
+			return bytes([BUFFER_OP]) + pkg_length(integer(len(data)) + data)
+		if value == 'CondRefOf':
+			self.pos += 1
+			self.expect('(')
+			out = bytes([EXT_OP_PREFIX, EXT_COND_REF_OF_OP]) + self.super_name() + b'\x00'
+			self.expect(')')
+			return out
+		if kind == 'name':
+			target = self.super_name()
+			if self.peek() != '(' or LOCAL0_OP <= target[0] <= ARG0_OP + 6:
+				return target
+			# Method invocation
+			self.pos += 1
+			out = target
+			while not self.accept(')'):
+				out += self.expression()
+				if not self.accept(','):
+					self.expect(')')
+					break
+			return out
+		raise EmitError(f'Unsupported construct {value!r}')
+
+	def byte_list(self) -> list:
+		self.expect('{')
+		data = []
+		while not self.accept('}'):
+			value = self.number()
+			if value > 0xFF: raise EmitError('Buffer byte out of range')
+			data.append(value)
+			if not self.accept(','):
+				self.expect('}')
+				break
+		return data
+
+	def resource_template(self) -> bytes:
+		self.expect('{')
+		data = b''
+		while not self.accept('}'):
+			descriptor = self.next('name')
+			args = self.args()
+			values = [x[1] if x else None for x in args]
+			if descriptor == 'Memory32Fixed' and len(values) in (3, 4) and values[0] in ('ReadWrite', 'ReadOnly'):
+				numbers = [int(x, 0) for x in values[1:3]]
+				data += struct.pack('<BHBII', 0x86, 9, 1 if values[0] == 'ReadWrite' else 0, *numbers)
+			elif descriptor == 'IO' and len(values) in (5, 6) and values[0] in ('Decode16', 'Decode10'):
+				numbers = [int(x, 0) for x in values[1:5]]
+				data += struct.pack('<BBHHBB', 0x47, 1 if values[0] == 'Decode16' else 0, *numbers)
+			elif descriptor == 'IRQNoFlags' and len(values) <= 1:
+				irqs = self.byte_list()
+				if any(x > 15 for x in irqs): raise EmitError('IRQ out of range')
+				data += struct.pack('<BH', 0x22, sum(1 << x for x in set(irqs)))
+			else:
+				raise EmitError(f'Unsupported resource descriptor {descriptor}')
+		# End tag, with a zero checksum
+		return data + b'\x79\x00'
+
+def compile_dsl(dsl: str) -> bytes:
+	'''Compiles the DSL into a whole AML table, raising EmitError on anything it doesn't support'''
+	try:
+		return AslCompiler(dsl).compile()
+	except (ValueError, struct.error) as e:
+		raise EmitError(str(e))
+
+def same_aml(a: bytes, b: bytes) -> bool:
+	# Compares two tables, ignoring the checksum and the creator fields - those differ between iasl versions
+	strip = lambda x: x[:9] + x[10:28] + x[36:]
+	return len(a) >= 36 and len(b) >= 36 and strip(a) == strip(b)
@@ -0,0 +1,339 @@
+# Copyright (C) 2021-2022 Giovix92
+
+'''Minimal AML byte-code walker, used to build the ACPI namespace straight from DSDT.aml without decompiling it'''
+
+import struct
+
+# Opcodes we have to know about to walk the namespace
+ZERO_OP, ONE_OP, ONES_OP = 0x00, 0x01, 0xFF
+BYTE_PREFIX, WORD_PREFIX, DWORD_PREFIX, STRING_PREFIX, QWORD_PREFIX = 0x0A, 0x0B, 0x0C, 0x0D, 0x0E
+ALIAS_OP, NAME_OP, SCOPE_OP, BUFFER_OP, PACKAGE_OP, VAR_PACKAGE_OP, METHOD_OP, EXTERNAL_OP = 0x06, 0x08, 0x10, 0x11, 0x12, 0x13, 0x14, 0x15
+DUAL_NAME_PREFIX, MULTI_NAME_PREFIX, ROOT_CHAR, PARENT_PREFIX = 0x2E, 0x2F, 0x5C, 0x5E
+EXT_OP_PREFIX = 0x5B
+IF_OP, ELSE_OP, WHILE_OP, RETURN_OP = 0xA0, 0xA1, 0xA2, 0xA4
+EXT_MUTEX_OP, EXT_EVENT_OP, EXT_COND_REF_OF_OP, EXT_CREATE_FIELD_OP = 0x01, 0x02, 0x12, 0x13
+EXT_REVISION_OP, EXT_DEBUG_OP = 0x30, 0x31
+EXT_OP_REGION_OP, EXT_FIELD_OP, EXT_DEVICE_OP, EXT_PROCESSOR_OP, EXT_POWER_RES_OP, EXT_THERMAL_ZONE_OP = 0x80, 0x81, 0x82, 0x83, 0x84, 0x85
+EXT_INDEX_FIELD_OP, EXT_BANK_FIELD_OP, EXT_DATA_REGION_OP = 0x86, 0x87, 0x88
+
+# Expression opcodes, mapped to the number of TermArgs and Targets they take
+EXPRESSIONS = {
+	0x70: (1, 1), 0x72: (2, 1), 0x73: (2, 1), 0x74: (2, 1), 0x77: (2, 1), 0x78: (2, 2), # Store, Add, Concatenate, Subtract, Multiply, Divide
+	0x79: (2, 1), 0x7A: (2, 1), 0x7B: (2, 1), 0x7C: (2, 1), 0x7D: (2, 1), 0x7E: (2, 1), # ShiftLeft, ShiftRight, And, Nand, Or, Nor
+	0x7F: (2, 1), 0x80: (1, 1), 0x81: (1, 1), 0x82: (1, 1), 0x83: (1, 0), 0x84: (2, 1), # Xor, Not, FindSetLeftBit, FindSetRightBit, DerefOf, ConcatenateResTemplate
+	0x85: (2, 1), 0x88: (2, 1), 0x90: (2, 0), 0x91: (2, 0), 0x92: (1, 0), 0x93: (2, 0), # Mod, Index, LAnd, LOr, LNot, LEqual
+	0x94: (2, 0), 0x95: (2, 0), 0x96: (1, 1), 0x97: (1, 1), 0x98: (1, 1), 0x99: (1, 1), # LGreater, LLess, ToBuffer, ToDecimalString, ToHexString, ToInteger
+	0x9C: (2, 1), 0x9D: (1, 1), 0x9E: (3, 1), # ToString, CopyObject, Mid
+}
+
+# Ops taking a single SuperName (RefOf, Increment, Decrement, SizeOf, ObjectType)
+SUPERNAME_OPS = (0x71, 0x75, 0x76, 0x87, 0x8E)
+
+# Methods we know the argument count of without having seen their definition
+KNOWN_METHODS = {'_OSI': 1}
+
+class AmlError(Exception):
+	pass
+
+def decode_eisa_id(value: int) -> str:
+	# Turns a compressed EisaId back into its PNPxxxx form
+	b = value.to_bytes(4, 'little')
+	vendor = (b[0] << 8) | b[1]
+	return ''.join(chr(((vendor >> x) & 0x1F) + 0x40) for x in (10, 5, 0)) + f'{b[2]:02X}{b[3]:02X}'
+
+def is_eisa_id(value: int) -> bool:
+	if not 0 <= value <= 0xFFFFFFFF or value & 0x80: return False
+	return decode_eisa_id(value)[:3].isalpha()
+
+def format_path(segments: list) -> str:
+	# Same notation iasl uses when decompiling - trailing underscores are dropped
+	return '\\' + '.'.join(x.rstrip('_') or '_' for x in segments)
+
+def format_integer(value: int, prefix: int) -> str:
+	if prefix == ZERO_OP: return 'Zero'
+	if prefix == ONE_OP: return 'One'
+	if prefix == ONES_OP: return 'Ones'
+	width = {BYTE_PREFIX: 2, WORD_PREFIX: 4, DWORD_PREFIX: 8, QWORD_PREFIX: 16}.get(prefix, 2)
+	return f'0x{value:0{width}X}'
+
+class AmlWalker:
+	'''
+	Walks the TermLists of a single definition block, recording every Device, Processor, Method and Name.
+	Method bodies are never executed nor decoded, only skipped - the only things read from them are the
+	values returned by _HID/_CID methods. Anything we don't understand ends the current block, and gets
+	recorded in errors. Whatever ends the table's own block early makes the whole table unusable.
+	'''
+
+	def __init__(self, data: bytes) -> None:
+		self.data = memoryview(data)
+		self.raw = data
+		self.records = []
+		self.devices = {}
+		self.errors = [] # {'offset', 'scope', 'error'} of every block left unfinished
+		self.method_args = dict(KNOWN_METHODS)
+
+	def walk(self) -> list:
+		if len(self.data) < 36 or bytes(self.data[:4]) not in (b'DSDT', b'SSDT'):
+			raise AmlError('Not a DSDT/SSDT table')
+		length = min(struct.unpack_from('<I', self.data, 4)[0], len(self.data))
+		known = len(self.method_args)
+		complete = self.term_list(36, length, [])
+		if self.errors and len(self.method_args) > known:
+			# Calls to methods defined further down were taken as taking no arguments, which may well be what
+			# threw the walk off - once more, now that every method met along the way is known
+			self.records, self.devices, self.errors = [], {}, []
+			complete = self.term_list(36, length, [])
+		if not complete:
+			raise AmlError(f'Unable to parse past 0x{self.errors[-1]["offset"]:X}: {self.errors[-1]["error"]}')
+		return self.records
+
+	### Encodings
+
+	def pkg_length(self, pos: int) -> tuple:
+		# Returns the end of the package and the position right after its PkgLength
+		lead = self.data[pos]
+		count = lead >> 6
+		if not count:
+			return (pos + (lead & 0x3F), pos + 1)
+		length = lead & 0x0F
+		for i in range(count):
+			length |= self.data[pos + 1 + i] << (4 + 8*i)
+		return (pos + length, pos + 1 + count)
+
+	def is_name_start(self, pos: int) -> bool:
+		x = self.data[pos]
+		return x in (ROOT_CHAR, PARENT_PREFIX, DUAL_NAME_PREFIX, MULTI_NAME_PREFIX) or x == 0x5F or 0x41 <= x <= 0x5A
+
+	def name_string(self, pos: int) -> tuple:
+		# Returns (prefix, segments, new position) - prefix is '\\', a run of '^' or empty
+		prefix = ''
+		if self.data[pos] == ROOT_CHAR:
+			prefix = '\\'
+			pos += 1
+		while self.data[pos] == PARENT_PREFIX:
+			prefix += '^'
+			pos += 1
+		lead = self.data[pos]
+		if lead == 0x00:
+			return (prefix, [], pos + 1)
+		if lead == DUAL_NAME_PREFIX:
+			count, pos = 2, pos + 1
+		elif lead == MULTI_NAME_PREFIX:
+			count, pos = self.data[pos + 1], pos + 2
+		else:
+			count = 1
+		segments = [bytes(self.data[pos + 4*i:pos + 4*i + 4]).decode('ascii', 'replace') for i in range(count)]
+		return (prefix, segments, pos + 4*count)
+
+	@staticmethod
+	def resolve(scope: list, prefix: str, segments: list) -> list:
+		if prefix.startswith('\\'): return segments
+		return (scope[:len(scope)-len(prefix)] if prefix else scope) + segments
+
+	### Expressions
+
+	def data_object(self, pos: int) -> tuple:
+		# Returns (value, encoding, new position) for constants - value is None for anything else
+		op = self.data[pos]
+		if op in (ZERO_OP, ONE_OP): return (op, op, pos + 1)
+		if op == ONES_OP: return (0xFFFFFFFFFFFFFFFF, op, pos + 1)
+		if op in (BYTE_PREFIX, WORD_PREFIX, DWORD_PREFIX, QWORD_PREFIX):
+			size = {BYTE_PREFIX: 1, WORD_PREFIX: 2, DWORD_PREFIX: 4, QWORD_PREFIX: 8}[op]
+			return (int.from_bytes(self.data[pos + 1:pos + 1 + size], 'little'), op, pos + 1 + size)
+		if op == STRING_PREFIX:
+			end = self.raw.index(b'\x00', pos + 1)
+			return (bytes(self.data[pos + 1:end]).decode('ascii', 'replace'), op, end + 1)
+		if op == PACKAGE_OP:
+			end, start = self.pkg_length(pos + 1)
+			return (self.package(start + 1, end, self.data[start]), op, end)
+		if op in (BUFFER_OP, VAR_PACKAGE_OP):
+			return (None, op, self.pkg_length(pos + 1)[0])
+		raise AmlError(f'Unexpected data object 0x{op:02X} at 0x{pos:X}')
+
+	def package(self, pos: int, end: int, count: int) -> list:
+		# Only the constant elements are kept, which is all _CID packages hold
+		elements = []
+		while pos < end and len(elements) < count:
+			try:
+				value, encoding, pos = self.data_object(pos)
+			except AmlError:
+				if not self.is_name_start(pos): break
+				pos = self.name_string(pos)[2]
+				value = None
+			elements.append(value)
+		return elements
+
+	def super_name(self, pos: int) -> int:
+		op = self.data[pos]
+		if 0x60 <= op <= 0x6E: return pos + 1 # LocalX/ArgX
+		if op == EXT_OP_PREFIX and self.data[pos + 1] == EXT_DEBUG_OP: return pos + 2
+		if op in (0x71, 0x83, 0x88): return self.term_arg(pos) # RefOf, DerefOf, Index
+		if self.is_name_start(pos): return self.name_string(pos)[2]
+		raise AmlError(f'Unexpected SuperName 0x{op:02X} at 0x{pos:X}')
+
+	def target(self, pos: int) -> int:
+		return pos + 1 if self.data[pos] == 0x00 else self.super_name(pos)
+
+	def term_arg(self, pos: int) -> int:
+		# Skips a TermArg, returning the position right after it
+		op = self.data[pos]
+		if op in (ZERO_OP, ONE_OP, ONES_OP, BYTE_PREFIX, WORD_PREFIX, DWORD_PREFIX, QWORD_PREFIX, STRING_PREFIX, BUFFER_OP, PACKAGE_OP, VAR_PACKAGE_OP):
+			return self.data_object(pos)[2]
+		if 0x60 <= op <= 0x6E: return pos + 1
+		if op == EXT_OP_PREFIX:
+			ext = self.data[pos + 1]
+			if ext in (EXT_REVISION_OP, EXT_DEBUG_OP): return pos + 2
+			if ext == EXT_COND_REF_OF_OP: return self.target(self.super_name(pos + 2))
+			raise AmlError(f'Unexpected extended opcode 0x{ext:02X} at 0x{pos:X}')
+		if op in SUPERNAME_OPS: return self.super_name(pos + 1)
+		if op in EXPRESSIONS:
+			args, targets = EXPRESSIONS[op]
+			pos += 1
+			for i in range(args):
+				pos = self.term_arg(pos)
+			for i in range(targets):
+				pos = self.target(pos)
+			return pos
+		if self.is_name_start(pos):
+			# Method invocation, or a plain reference when we don't know it as a method
+			prefix, segments, pos = self.name_string(pos)
+			for i in range(self.method_args.get(segments[-1] if segments else '', 0)):
+				pos = self.term_arg(pos)
+			return pos
+		raise AmlError(f'Unexpected opcode 0x{op:02X} at 0x{pos:X}')
+
+	### Namespace
+
+	def add(self, scope: list, obj_type: str, start: int, end: int) -> dict:
+		record = {'path': format_path(scope), 'type': obj_type, 'start': start, 'end': end, 'hid': [], 'value': None}
+		self.records.append(record)
+		if obj_type in ('Device', 'Processor'):
+			self.devices[tuple(scope)] = record
+		return record
+
+	def add_hids(self, scope: list, values: list) -> None:
+		owner = self.devices.get(tuple(scope))
+		if owner == None: return
+		for value in values:
+			hid = decode_eisa_id(value) if isinstance(value, int) and is_eisa_id(value) else value
+			if isinstance(hid, str) and not hid in owner['hid']:
+				owner['hid'].append(hid)
+
+	def method_hids(self, start: int, end: int) -> list:
+		# Collect whatever constants _HID/_CID methods return
+		values = []
+		pos = self.raw.find(bytes((RETURN_OP,)), start, end)
+		while pos != -1:
+			try:
+				value = self.data_object(pos + 1)[0]
+				values.extend(value if isinstance(value, list) else [value])
+			except (AmlError, ValueError, IndexError): pass
+			pos = self.raw.find(bytes((RETURN_OP,)), pos + 1, end)
+		return values
+
+	def term_list(self, pos: int, end: int, scope: list) -> bool:
+		# Returns False if the block couldn't be walked to its end
+		try:
+			while pos < end:
+				pos = self.term_obj(pos, end, scope)
+		except (AmlError, IndexError, ValueError) as e:
+			# Can't make sense of the rest of this block - move on with the enclosing one
+			self.errors.append({'offset': pos, 'scope': format_path(scope), 'error': str(e) or type(e).__name__})
+			return False
+		return True
+
+	def term_obj(self, pos: int, end: int, scope: list) -> int:
+		start = pos
+		op = self.data[pos]
+		if op == SCOPE_OP:
+			pkg_end, pos = self.pkg_length(pos + 1)
+			prefix, segments, pos = self.name_string(pos)
+			self.term_list(pos, pkg_end, self.resolve(scope, prefix, segments))
+			return pkg_end
+		if op == NAME_OP:
+			prefix, segments, pos = self.name_string(pos + 1)
+			path = self.resolve(scope, prefix, segments)
+			value, encoding, pos = self.data_object(pos)
+			record = self.add(path, 'Name', start, pos)
+			record['value'] = (value, encoding)
+			if segments[-1] in ('_HID', '_CID'):
+				self.add_hids(path[:-1], value if isinstance(value, list) else [value])
+			return pos
+		if op == METHOD_OP:
+			pkg_end, pos = self.pkg_length(pos + 1)
+			prefix, segments, pos = self.name_string(pos)
+			path = self.resolve(scope, prefix, segments)
+			self.method_args[segments[-1]] = self.data[pos] & 0x07
+			self.add(path, 'Method', start, pkg_end)
+			if segments[-1] in ('_HID', '_CID'):
+				self.add_hids(path[:-1], self.method_hids(pos + 1, pkg_end))
+			return pkg_end
+		if op == ALIAS_OP:
+			return self.name_string(self.name_string(pos + 1)[2])[2]
+		if op == EXTERNAL_OP:
+			prefix, segments, pos = self.name_string(pos + 1)
+			if self.data[pos] == 0x08 and segments: # MethodObj
+				self.method_args.setdefault(segments[-1], self.data[pos + 1] & 0x07)
+			return pos + 2
+		if op == IF_OP:
+			pkg_end, pos = self.pkg_length(pos + 1)
+			self.term_list(self.term_arg(pos), pkg_end, scope)
+			return pkg_end
+		if op == ELSE_OP:
+			pkg_end, pos = self.pkg_length(pos + 1)
+			self.term_list(pos, pkg_end, scope)
+			return pkg_end
+		if op == WHILE_OP:
+			return self.pkg_length(pos + 1)[0]
+		if op in (0x8A, 0x8B, 0x8C, 0x8D, 0x8F): # CreateXField (SourceBuff, Index, Name)
+			return self.name_string(self.term_arg(self.term_arg(pos + 1)))[2]
+		if op == 0x86: # Notify
+			return self.term_arg(self.super_name(pos + 1))
+		if op == EXT_OP_PREFIX:
+			return self.ext_term_obj(pos, scope)
+		if op in EXPRESSIONS or op in SUPERNAME_OPS or self.is_name_start(pos):
+			return self.term_arg(pos)
+		raise AmlError(f'Unexpected opcode 0x{op:02X} at 0x{pos:X}')
+
+	def ext_term_obj(self, pos: int, scope: list) -> int:
+		start = pos
+		op = self.data[pos + 1]
+		if op in (EXT_DEVICE_OP, EXT_PROCESSOR_OP, EXT_POWER_RES_OP, EXT_THERMAL_ZONE_OP):
+			pkg_end, pos = self.pkg_length(pos + 2)
+			prefix, segments, pos = self.name_string(pos)
+			path = self.resolve(scope, prefix, segments)
+			# Skip the fixed Processor/PowerResource fields
+			pos += {EXT_PROCESSOR_OP: 6, EXT_POWER_RES_OP: 3}.get(op, 0)
+			if op in (EXT_DEVICE_OP, EXT_PROCESSOR_OP):
+				self.add(path, 'Device' if op == EXT_DEVICE_OP else 'Processor', start, pkg_end)
+			self.term_list(pos, pkg_end, path)
+			return pkg_end
+		if op in (EXT_FIELD_OP, EXT_INDEX_FIELD_OP, EXT_BANK_FIELD_OP):
+			return self.pkg_length(pos + 2)[0]
+		if op == EXT_OP_REGION_OP:
+			pos = self.name_string(pos + 2)[2]
+			return self.term_arg(self.term_arg(pos + 1))
+		if op == EXT_DATA_REGION_OP:
+			pos = self.name_string(pos + 2)[2]
+			return self.term_arg(self.term_arg(self.term_arg(pos)))
+		if op == EXT_MUTEX_OP:
+			return self.name_string(pos + 2)[2] + 1
+		if op == EXT_EVENT_OP:
+			return self.name_string(pos + 2)[2]
+		if op == EXT_CREATE_FIELD_OP:
+			return self.name_string(self.term_arg(self.term_arg(self.term_arg(pos + 2))))[2]
+		raise AmlError(f'Unexpected extended opcode 0x{op:02X} at 0x{pos:X}')
+
+def parse_aml(data: bytes, errors: list = None) -> list:
+	'''
+	Returns a record for every Device, Processor, Method and Name found in the table:
+	{'path', 'type', 'start', 'end', 'hid', 'value'} - start/end delimit the object's bytes in data,
+	hid lists the _HID/_CID values of devices, value holds the (value, encoding) pair of Names.
+	errors, if given, gets an {'offset', 'scope', 'error'} for each block whose end was skipped.
+	Raises AmlError if the table itself can't be walked to its end.
+	'''
+	walker = AmlWalker(data)
+	try:
+		return walker.walk()
+	finally:
+		if errors != None: errors.extend(walker.errors)
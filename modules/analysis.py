@@ -0,0 +1,196 @@
+# Copyright (C) 2021-2022 Giovix92
+
+'''Runs whole SysReport analyses - either one at a time, or in batches through a pool of workers'''
+
+import concurrent.futures
+import os
+import traceback
+try:
+	from modules import cache, logparser, mkssdt, profiler, sysreport
+except ImportError: # Called from within modules/
+	import cache, logparser, mkssdt, profiler, sysreport
+
+acpi_folder = 'SysReport/ACPI'
+dsdt_file = f'{acpi_folder}/DSDT.aml'
+
+def is_report(path: str) -> bool:
+	return os.path.isdir(os.path.join(path, 'SysReport')) or sysreport.is_archive(path)
+
+def find_reports(paths: list) -> list:
+	'''Expands the given paths into SysReports (folders or archives) - a folder that isn't a SysReport itself is searched for them'''
+	reports = []
+	for path in paths:
+		path = os.path.abspath(path)
+		if is_report(path) or not os.path.isdir(path):
+			reports.append(path)
+			continue
+		reports.extend(sorted(os.path.join(path, x) for x in os.listdir(path) if is_report(os.path.join(path, x))))
+	return reports
+
+def get_output_folders(reports: list, output_root: str) -> list:
+	# One subfolder per report, named after it - duplicated names get a numeric suffix
+	folders = []
+	for report in reports:
+		name = sysreport.get_name(report)
+		folder, count = os.path.join(output_root, name), 1
+		while folder in folders:
+			count += 1
+			folder = os.path.join(output_root, f'{name}-{count}')
+		folders.append(folder)
+	return folders
+
+get_peak_rss = profiler.get_peak_rss
+
+def format_rss(rss: int or None) -> str:
+	return '-' if rss == None else f'{rss / (1024 * 1024):.0f} MB'
+
+class Analysis:
+	'''
+	A single SysReport analysis. All of its state lives here and every path is explicit - no working
+	directory changes, no shared folders - so several analyses can run in threads of the same process.
+	Output goes through log, which defaults to collecting it into self.output.
+	sr_path can also be a zip/tar archive of the SysReport, which is read without being extracted.
+	'''
+
+	def __init__(self, sr_path: str, iasl_bin: str, results_folder: str, options: dict = None, log: callable = None) -> None:
+		self.sr_path = os.path.abspath(sr_path)
+		self.iasl_bin = iasl_bin
+		self.results_folder = os.path.abspath(results_folder)
+		self.options = options or {}
+		self.output = []
+		self.log = log or (lambda *x: self.output.append(' '.join(str(y) for y in x)))
+		self.source = None
+		self.ctx = None
+		self.facts = {}
+		self.summary = {'report': self.sr_path, 'mat': None, 'cfg_lock': None, 'ssdts': [], 'error': None, 'peak_rss': None, 'store': None}
+
+	def open(self) -> sysreport.FolderReport:
+		# The report contents, opened once - an archive only has its member list read at this point
+		if self.source == None:
+			if not os.path.exists(self.sr_path):
+				raise FileNotFoundError('SysReport path doesn\'t exist')
+			self.source = sysreport.open_report(self.sr_path)
+		return self.source
+
+	def close(self) -> None:
+		if self.source != None: self.source.close()
+
+	def has_dsdt(self) -> bool:
+		return self.open().isfile(dsdt_file)
+
+	def read_log(self) -> tuple:
+		# Returns the MAT and CFG Lock statuses out of the OpenCore log, None if there's no log
+		with profiler.stage('log'):
+			oc_log = logparser.get_opencore_log_filename(source=self.open())
+			if oc_log:
+				with self.source.open(oc_log) as f:
+					self.facts = logparser.scan_log(f)
+				self.summary['mat'] = logparser.get_mat_support_status(oc_log, self.facts)
+				self.summary['cfg_lock'] = logparser.cfg_lock_status(oc_log, self.facts)
+		return (self.summary['mat'], self.summary['cfg_lock'])
+
+	def read_tables(self) -> dict:
+		# The AML of the DSDT, followed by the OEM SSDTs unless disabled - {path within the report: bytes}
+		if not self.has_dsdt():
+			raise FileNotFoundError('No DSDT.aml or ACPI folder found into the SysReport folder')
+		# Objects may as well be defined in the OEM SSDTs, so they're merged into the same namespace
+		with profiler.stage('read_tables'):
+			ssdts = mkssdt.find_ssdts(acpi_folder, self.source.listdir) if self.options.get('ssdts', True) else []
+			return {x: self.source.read(x) for x in [dsdt_file] + ssdts}
+
+	def load(self, amls: dict = None) -> mkssdt.DsdtContext:
+		# Builds the namespace of the given tables (see read_tables()), through the cache if possible
+		amls = amls or self.read_tables()
+		paths = list(amls)
+		with profiler.stage('load'):
+			self.ctx = mkssdt.load_context(paths[0], self.iasl_bin, self.options.get('native', False), self.options.get('cache', True), self.log, self.options.get('cache_dir', None), self.options.get('lean', True), paths[1:], amls.__getitem__, self.options.get('stream', False))
+		if self.ctx == None:
+			raise ValueError('No objects found into the DSDT')
+		return self.ctx
+
+	def generate(self) -> list:
+		# Loads the DSDT and generates the SSDTs, returning the ones produced
+		amls = self.read_tables()
+		# Reports of identical firmware get the very same SSDTs - those are generated once and stored
+		key = mkssdt.get_result_key(list(amls.values()), self.iasl_bin, self.options.get('native', False), self.options.get('emitter', False), self.options.get('crosscheck', False), self.options.get('only', None), self.options.get('skip', None)) if self.options.get('cache', True) else None
+		with profiler.stage('result_store'):
+			stored = key and self.load_result(key)
+		if stored: return self.summary['ssdts']
+		self.load(amls)
+		with profiler.stage('generate'):
+			results = mkssdt.generate_ssdts(self.ctx, self.iasl_bin, self.results_folder, self.options.get('jobs', None), self.log, self.options.get('emitter', False), self.options.get('crosscheck', False), self.options.get('only', None), self.options.get('skip', None))
+		self.summary['ssdts'] = [x for x in results if results[x]]
+		if key:
+			self.summary['store'] = 'miss'
+			files = [os.path.join(self.results_folder, f'{x}{y}') for x in self.summary['ssdts'] for y in ('.dsl', '.aml')]
+			error = cache.store_result(key, {'ssdts': self.summary['ssdts'], 'facts': dict(self.ctx.facts)}, [x for x in files if os.path.exists(x)], self.options.get('cache_dir', None))
+			if error: self.log(error)
+		return self.summary['ssdts']
+
+	def load_result(self, key: str) -> bool:
+		# Copies the SSDTs stored under key into the results folder, False if there are none
+		mkssdt.clear_results(self.results_folder)
+		stored = cache.load_result(key, self.results_folder, self.options.get('cache_dir', None))
+		if stored == None: return False
+		self.log('Identical ACPI tables were already processed, reusing the SSDTs generated back then: ' + (', '.join(stored['ssdts']) or 'none'))
+		self.summary['ssdts'] = stored['ssdts']
+		self.summary['store'] = 'hit'
+		return True
+
+	def run(self) -> dict:
+		'''
+		Does the whole analysis, returning its summary: {'report', 'mat', 'cfg_lock', 'ssdts', 'error', 'peak_rss', 'store'}.
+		peak_rss is the high-water mark of the whole process - in a batch, of the worker that ran it.
+		store is whether the SSDTs were found in the result store ('hit') or not ('miss'), None if it wasn't looked into.
+		'''
+		try:
+			self.read_log()
+			self.generate()
+		except Exception as e:
+			self.summary['error'] = str(e)
+			self.log(traceback.format_exc())
+		finally:
+			self.close()
+		self.summary['peak_rss'] = get_peak_rss()
+		return self.summary
+
+def process_report(sr_path: str, iasl_bin: str, results_folder: str, options: dict) -> dict:
+	'''
+	Analyses a single SysReport, writing its SSDTs and the full log into results_folder.
+	With the profile option, the summary gets the profiler events of the analysis as 'profile'.
+	'''
+	if options.get('profile', False): profiler.enable()
+	report = Analysis(sr_path, iasl_bin, results_folder, options)
+	summary = report.run()
+	if options.get('profile', False): summary['profile'] = profiler.events
+	os.makedirs(results_folder, exist_ok=True)
+	with open(os.path.join(results_folder, 'GTools.log'), 'w') as f:
+		f.write('\n'.join(report.output))
+	return summary
+
+def run_batch(reports: list, iasl_bin: str, output_root: str, options: dict, workers: int = None) -> list:
+	'''Processes every report in a pool of worker processes, returning their summaries in the given order'''
+	folders = get_output_folders(reports, output_root)
+	summaries = [None]*len(reports)
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+		futures = {pool.submit(process_report, report, iasl_bin, folder, options): i for i,(report,folder) in enumerate(zip(reports, folders))}
+		for done,future in enumerate(concurrent.futures.as_completed(futures), 1):
+			i = futures[future]
+			try:
+				summaries[i] = future.result()
+			except Exception as e: # The worker itself died
+				summaries[i] = {'report': reports[i], 'mat': None, 'cfg_lock': None, 'ssdts': [], 'error': str(e), 'peak_rss': None, 'store': None}
+			print(f'[{done}/{len(reports)}] {os.path.basename(reports[i])}' + (f' - {summaries[i]["error"]}' if summaries[i]['error'] else ''))
+	return summaries
+
+def print_summary(summaries: list) -> None:
+	flag = lambda x: '-' if x == None else '1' if x else '0'
+	names = [os.path.basename(os.path.normpath(x['report'])) for x in summaries]
+	width = max([len(x) for x in names] + [len('Report')])
+	print(f'\n{"Report".ljust(width)}  MAT  CFG Lock  Peak RSS  SSDTs')
+	for name,x in zip(names, summaries):
+		ssdts = ', '.join(x['ssdts']) if x['ssdts'] else '-'
+		print(f'{name.ljust(width)}  {flag(x["mat"]).ljust(3)}  {flag(x["cfg_lock"]).ljust(8)}  {format_rss(x.get("peak_rss")).rjust(8)}  ' + (f'ERROR: {x["error"]}' if x['error'] else ssdts))
+	hits, misses = [sum(1 for x in summaries if x.get('store') == y) for y in ('hit', 'miss')]
+	if hits or misses:
+		print(f'\nResult store: {hits} hits, {misses} misses ({hits * 100 // (hits + misses)}% of the reports reused already generated SSDTs)')
@@ -0,0 +1,137 @@
+'''Persistent, content-addressed cache of parsed DSDTs, so the same table is never decompiled twice - and of the SSDTs generated out of them'''
+
+import hashlib
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+cache_path = os.path.join(os.getcwd(), 'cache')
+max_cache_size = 512 * 1024 * 1024 # Bytes, oldest entries get evicted past this
+format_version = 4 # Bumped whenever what gets stored changes shape, so older entries are never loaded
+_identities = {}
+_sizes = {} # Size of each cache folder as last known to this process - see store()
+_sizes_lock = threading.Lock()
+
+def iasl_identity(iasl_bin: str) -> str:
+	'''Hash of the iasl binary - a different build may decompile things differently'''
+	st = os.stat(iasl_bin)
+	stamp = (os.path.realpath(iasl_bin), st.st_size, st.st_mtime)
+	if stamp not in _identities:
+		with open(iasl_bin, 'rb') as f:
+			_identities[stamp] = hashlib.sha256(f.read()).hexdigest()
+	return _identities[stamp]
+
+def get_key(aml: bytes, iasl_bin: str = None, mode: str = 'iasl') -> str:
+	key = hashlib.sha256(aml)
+	key.update(f'|{format_version}|{mode}|{iasl_identity(iasl_bin) if iasl_bin else ""}'.encode())
+	return key.hexdigest()
+
+def load(key: str, cache_dir: str = None, name: str = 'namespace.pickle') -> dict or None:
+	cache_dir = cache_dir or cache_path
+	entry = os.path.join(cache_dir, key, name)
+	try:
+		with open(entry, 'rb') as f:
+			data = pickle.load(f)
+		# Mark it as recently used
+		os.utime(os.path.join(cache_dir, key))
+	except Exception:
+		return None
+	return data
+
+def load_file(key: str, name: str, cache_dir: str = None) -> mmap.mmap or bytes or None:
+	'''Maps a file stored along with an entry (see store()), so it never has to be read into memory'''
+	cache_dir = cache_dir or cache_path
+	try:
+		with open(os.path.join(cache_dir, key, name), 'rb') as f:
+			return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+	except OSError:
+		return None
+
+def store(key: str, data: dict, cache_dir: str = None, name: str = 'namespace.pickle', files: list = (), buffers: dict = None) -> str or None:
+	'''
+	Stores data, the given files being copied into the entry along with it, and each of buffers ({name: buffer}) written
+	into a file of its own - straight from the buffer, an mmap is never read into memory. Returns why it couldn't, if so - left to the caller to log.
+	The cache folder is only looked through the first time, from then on its size is kept up to date with what
+	gets written, and entries are only evicted once that goes past max_cache_size.
+	'''
+	cache_dir = cache_dir or cache_path
+	entry = os.path.join(cache_dir, key)
+	try:
+		os.makedirs(entry, exist_ok=True)
+		for x in files:
+			shutil.copyfile(x, os.path.join(entry, os.path.basename(x)))
+		written = sum(os.path.getsize(x) for x in files)
+		# Written aside and moved in place, so concurrent readers never see a partial entry - data last, as it's what tells the entry is there
+		for x,y in (buffers or {}).items():
+			with tempfile.NamedTemporaryFile(dir=entry, suffix='.tmp', delete=False) as f:
+				f.write(y)
+				written += f.tell()
+			os.replace(f.name, os.path.join(entry, x))
+		with tempfile.NamedTemporaryFile(dir=entry, suffix='.tmp', delete=False) as f:
+			pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+			written += f.tell()
+		os.replace(f.name, os.path.join(entry, name))
+	except Exception as e:
+		return f'Unable to write the cache entry: {e}'
+	with _sizes_lock:
+		total = _sizes[cache_dir] = _sizes[cache_dir] + written if cache_dir in _sizes else sum(x[1] for x in get_entries(cache_dir))
+	if total > max_cache_size: evict(max_cache_size, cache_dir)
+	return None
+
+def load_result(key: str, dest: str, cache_dir: str = None) -> dict or None:
+	'''
+	Copies the files of a stored result (see store_result()) into dest, returning the data stored along with them.
+	Copied rather than linked, so editing an output never alters the stored one.
+	'''
+	data = load(key, cache_dir, 'result.pickle')
+	if data == None: return None
+	entry = os.path.join(cache_dir or cache_path, key)
+	try:
+		os.makedirs(dest, exist_ok=True)
+		for x in data['files']:
+			shutil.copyfile(os.path.join(entry, x), os.path.join(dest, x))
+	except OSError: # Evicted meanwhile
+		return None
+	return data
+
+def store_result(key: str, data: dict, files: list, cache_dir: str = None) -> str or None:
+	'''Stores the given output files, along with data - whose 'files' is set to their names. Returns why it couldn't, if so'''
+	return store(key, dict(data, files=[os.path.basename(x) for x in files]), cache_dir, 'result.pickle', files)
+
+def get_entries(cache_dir: str = None) -> list:
+	# (last use, size, path) of every entry
+	cache_dir = cache_dir or cache_path
+	if not os.path.exists(cache_dir): return []
+	entries = []
+	for key in os.listdir(cache_dir):
+		entry = os.path.join(cache_dir, key)
+		try:
+			size = sum(os.path.getsize(os.path.join(entry, x)) for x in os.listdir(entry))
+			entries.append((os.path.getmtime(entry), size, entry))
+		except OSError: # Not an entry, or evicted by someone else meanwhile
+			continue
+	return entries
+
+def evict(max_size: int = max_cache_size, cache_dir: str = None) -> None:
+	'''Removes the least recently used entries until the cache fits in max_size bytes'''
+	cache_dir = cache_dir or cache_path
+	# Looked through again - other processes may well have written into it meanwhile
+	entries = get_entries(cache_dir)
+	total = sum(x[1] for x in entries)
+	for mtime, size, entry in sorted(entries):
+		if total <= max_size: break
+		shutil.rmtree(entry, ignore_errors=True)
+		total -= size
+	with _sizes_lock:
+		_sizes[cache_dir] = total
+
+def clear(cache_dir: str = None) -> bool:
+	cache_dir = cache_dir or cache_path
+	if not os.path.exists(cache_dir): return False
+	shutil.rmtree(cache_dir)
+	with _sizes_lock:
+		_sizes.pop(cache_dir, None)
+	return True
@@ -1,35 +1,76 @@
+import functools
+import io
 import linecache
+import mmap
 import os
 import re
 
-def search_log(log_filename: str, pattern: str) -> str or None:
-	pattern = re.compile(pattern)
-	opencore_log_file = open(log_filename, 'r')
-	result = ''
+# Facts extracted from the OpenCore log - name: pattern, the first group being the value.
+# Adding a fact is just a matter of adding its line here.
+LOG_FACTS = {
+	'mat': rb'OCABC: MAT support is (\d)',
+	'cfg_lock': rb'EIST CFG Lock (\d)',
+	'oc_version': rb'OC: OpenCore (\S+) is loading',
+	'smbios': rb'OCSMB: Current SMBIOS: .*? model (\S+)',
+	'secureboot': rb'OC: Loading Apple Secure Boot with (\S+)',
+	'booted_os': rb'OCB: Should boot from \d+\. (.+?) \(T:',
+}
 
-	for line in opencore_log_file.readlines():
-		if (re.search(pattern, line) != None):
-			result = re.search(pattern, line).group(1)
+@functools.lru_cache(maxsize=None)
+def get_combined_pattern(facts: tuple) -> re.Pattern:
+	# One alternation of named groups, so a single pass over the log looks for every fact at once
+	return re.compile(b'|'.join(b'(?:' + re.sub(rb'(?<!\\)\((?!\?)', b'(?P<' + x.encode() + b'>', LOG_FACTS[x], count=1) + b')' for x in facts))
 
-	opencore_log_file.close()
-	return result
-	
-def get_mat_support_status(filename: str):
-	return True if search_log(filename, 'OCABC: MAT support is (\d)') == '1' else False
+def scan_log(log, facts: list = None) -> dict:
+	'''
+	Scans the log once for all the requested facts (all of LOG_FACTS by default).
+	log is either its filename or an already opened binary file, such as an archive member.
+	Returns {fact: value}, value being the last match as a string or None if missing - a fact logged
+	more than once (e.g. MAT support, once per boot attempt) is worth what it was last.
+	'''
+	if isinstance(log, str):
+		with open(log, 'rb') as f:
+			return scan_log(f, facts)
+	facts = tuple(facts or LOG_FACTS)
+	result = dict.fromkeys(facts)
+	pattern = get_combined_pattern(facts)
+	try:
+		fileno = log.fileno()
+	except (AttributeError, io.UnsupportedOperation): # Not backed by a file of its own, read it whole
+		data = log.read()
+	else:
+		try:
+			data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+		except ValueError: # Empty file
+			return result
+	for match in pattern.finditer(data):
+		result[match.lastgroup] = match.group(match.lastgroup)
+	if isinstance(data, mmap.mmap): data.close()
+	return {x: y.decode(errors='replace') if y != None else None for x,y in result.items()}
+
+def get_mat_support_status(filename: str, facts: dict = None):
+	facts = facts or scan_log(filename, ['mat'])
+	return True if facts.get('mat') == '1' else False
 	
-def cfg_lock_status(filename: str):
-	return True if search_log(filename, 'EIST CFG Lock (\d)') == '1' else False
+def cfg_lock_status(filename: str, facts: dict = None):
+	facts = facts or scan_log(filename, ['cfg_lock'])
+	return True if facts.get('cfg_lock') == '1' else False
 
-def get_opencore_log_filename():
+def get_opencore_log_filename(path: str = None, source = None):
 	'''
 	What can distinguish the opencore log from the other files is the fact that it starts with opencore-xxxxxxxxxx.txt AND is a file.
 	More validation can be added but to be fair i'm a little bit stoned rn and don't have much brain cells functioning kekw
+	When a path is given, the log is searched there rather than in the working directory, and its full path is returned.
+	When a SysReport source is given, the log is searched at its root, and its path within it is returned.
 	'''
 
-	cwd = os.getcwd()
+	if source != None:
+		return next((x for x in source.listdir() if x.startswith('opencore-') and source.isfile(x)), '')
+
+	cwd = path or os.getcwd()
 	ls_dir = os.listdir(cwd)
 	for log in ls_dir:
 		if log.startswith('opencore-'):
-			if os.path.isfile(log):
-				return log
+			if os.path.isfile(os.path.join(cwd, log)):
+				return os.path.join(path, log) if path else log
 	return ''
@@ -1,16 +1,25 @@
 # Copyright (C) 2021-2022 Giovix92
 
 import argparse
+import array
+import bisect
+import concurrent.futures
+import heapq
+import mmap
 import os
+import re
 import shutil
+import stat
 import subprocess
 import sys
+import tempfile
+import threading
+try:
+	from modules import amlemitter, amlparser, cache, profiler
+except ImportError: # Called as a script from within modules/
+	import amlemitter, amlparser, cache, profiler
 
 version = 'v1.2'
-dsdt       = None
-dsdt_raw   = None
-dsdt_lines = None
-dsdt_paths = []
 
 ### FUNCTIONS - START ###
 
@@ -23,57 +32,215 @@ def get_line(line: str) -> str:
 	line = line.split('//')[0]
 	return line.split(':')[1] if ':' in line else line
 
-def get_path_of_type(obj_type: str = 'Device', obj: str = 'HPET') -> list:
-	return sorted([path for path in dsdt_paths if path[2].lower() == obj_type.lower() and path[0].upper().endswith(obj.upper())])
+class DslLines:
+	'''
+	The decompiled DSL as a read-only sequence of lines. The text stays in a single buffer - usually the
+	mmap of the .dsl file - with an array of line offsets into it, and each line is only decoded when accessed.
+	'''
+	__slots__ = ('data', 'offsets')
 
-def get_device_paths(obj: str = 'HPET') -> list:
-	return get_path_of_type(obj_type='Device',obj=obj)
+	def __init__(self, data: bytes or str, offsets: array.array = None) -> None:
+		self.data = data.encode() if isinstance(data, str) else data
+		if offsets == None:
+			offsets = array.array('I', [0])
+			pos = self.data.find(b'\n')
+			while pos != -1:
+				offsets.append(pos + 1)
+				pos = self.data.find(b'\n', pos + 1)
+			offsets.append(len(self.data) + 1) # Past the end, as if the last line had a \n too
+		self.offsets = offsets
 
-def get_method_paths(obj: str = '_STA') -> list:
-	return get_path_of_type(obj_type='Method',obj=obj)
+	def __len__(self) -> int:
+		return len(self.offsets) - 1
 
-def get_name_paths(obj: str = 'CPU0') -> list:
-	return get_path_of_type(obj_type='Name',obj=obj)
+	def __getitem__(self, index: int or slice) -> str or list:
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+		offsets = self.offsets
+		if index < 0: index += len(offsets) - 1
+		if not 0 <= index < len(offsets) - 1: raise IndexError('line index out of range')
+		return self.data[offsets[index]:offsets[index+1]-1].decode(errors='replace')
 
-def get_processor_paths(obj: str = 'Processor') -> list:
-	return get_path_of_type(obj_type='Processor',obj=obj)
+	def __iter__(self):
+		data, offsets = self.data, self.offsets
+		for i in range(len(offsets) - 1):
+			yield data[offsets[i]:offsets[i+1]-1].decode(errors='replace')
 
-def get_device_paths_with_hid(hid: str = 'ACPI000E') -> list:
-	starting_indexes = []
-	for index,line in enumerate(dsdt_lines):
-		if is_hex(line): continue
-		if hid.upper() in line.upper():
-			starting_indexes.append(index)
-	if not starting_indexes: return starting_indexes
+	def __reduce__(self) -> tuple:
+		# An mmap can't be pickled - its contents can
+		return (DslLines, (bytes(self.data), self.offsets))
+
+class DslStream:
+	'''
+	Lines of decompiled tables, each one yielded as soon as it's read - while iasl is still decompiling, see decompile_stream().
+	parts yields (table, chunks of its DSL): the table gets its first line as 'start' once reached, and ends with a single
+	newline, same as when decompiled tables get joined. Once iterated over, lines is the DslLines of the whole text -
+	its buffer and line offsets are filled along the way, so it's never split into lines twice.
+	'''
+	__slots__ = ('parts', 'lines')
+
+	def __init__(self, parts) -> None:
+		self.parts = parts
+		self.lines = None
+
+	def __iter__(self):
+		data, offsets = bytearray(), array.array('I', [0])
+		for table,chunks in self.parts:
+			table['start'] = len(offsets) - 1
+			blank = 0 # Empty lines are held back, those ending the table are dropped
+			for chunk in chunks:
+				pos = len(data)
+				data += chunk
+				pos = data.find(b'\n', pos)
+				while pos != -1:
+					if pos == offsets[-1]:
+						blank += 1
+					else:
+						for i in range(blank): yield ''
+						blank = 0
+						yield data[offsets[-1]:pos].decode(errors='replace')
+					offsets.append(pos + 1)
+					pos = data.find(b'\n', pos + 1)
+			if len(data) > offsets[-1]: # No newline at the very end
+				for i in range(blank): yield ''
+				blank = 0
+				yield data[offsets[-1]:].decode(errors='replace')
+				data += b'\n'
+				offsets.append(len(data))
+			if blank: # Dropped along with their newlines
+				del offsets[len(offsets)-blank:]
+				del data[offsets[-1]:]
+			if len(offsets) - 1 == table['start']: # An empty table still gets its line
+				yield ''
+				data += b'\n'
+				offsets.append(len(data))
+		# Past the end, as if the last line had a \n too
+		offsets.append(len(data) + 1)
+		yield ''
+		self.lines = DslLines(data, offsets)
+
+class DslCode:
+	'''Comment-stripped view over DslLines, None for hex listing lines'''
+	__slots__ = ('lines', 'hex')
+
+	def __init__(self, lines: DslLines, hex_lines: bytearray = None) -> None:
+		self.lines = lines
+		self.hex = hex_lines # One byte per line, None if there's no listing at all
+
+	def __len__(self) -> int:
+		return len(self.lines)
+
+	def __getitem__(self, index: int or slice) -> str or None or list:
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+		if self.hex != None and self.hex[index]: return None
+		# Once hex lines are out of the way, get_line() boils down to this
+		return self.lines[index].split('//')[0]
+
+	def items(self):
+		# (index, line, code) of every line but the hex ones, decoding each line only once
+		hex_lines = self.hex
+		for index,line in enumerate(self.lines):
+			if hex_lines == None or not hex_lines[index]:
+				yield (index, line, line.split('//')[0])
+
+	def __reduce__(self) -> tuple:
+		return (DslCode, (self.lines, self.hex))
+
+class NamespaceEntry:
+	'''(path, index, type) of an object - indexes like the tuple it replaces, in less memory'''
+	__slots__ = ('path', 'index', 'type')
+
+	def __init__(self, path: str, index: int, obj_type: str) -> None:
+		self.path, self.index, self.type = path, index, obj_type
+
+	def __getitem__(self, index: int) -> str or int:
+		return (self.path, self.index, self.type)[index]
+
+	def __len__(self) -> int:
+		return 3
+
+	def __iter__(self):
+		return iter((self.path, self.index, self.type))
+
+	def __eq__(self, other) -> bool:
+		return self.path == other[0] and self.index == other[1] and self.type == other[2]
+
+	def __lt__(self, other) -> bool:
+		return tuple(self) < tuple(other)
+
+	def __hash__(self) -> int:
+		return hash(tuple(self))
+
+	def __repr__(self) -> str:
+		return repr(tuple(self))
+
+	def __reduce__(self) -> tuple:
+		return (NamespaceEntry, (self.path, self.index, self.type))
+
+def build_namespace_index(paths: list) -> dict:
+	# Index the (already sorted) object paths once, so lookups don't have to scan the whole list.
+	# 'suffix' maps each type to every suffix of every last path segment - names are at most
+	# 4 chars long, so that's a handful of keys per object and any endswith() lookup is a single hit.
+	index = {'type': {}, 'path': {}, 'name': {}, 'suffix': {}, 'line': {}}
+	for path in paths:
+		index['line'][path[1]] = path
+		obj_type = path[2].lower()
+		name = path[0].upper().split('.')[-1]
+		index['type'].setdefault(obj_type, []).append(path)
+		index['path'].setdefault(path[0].upper(), []).append(path)
+		index['name'].setdefault(name, []).append(path)
+		suffixes = index['suffix'].setdefault(obj_type, {})
+		for i in range(len(name)+1):
+			suffixes.setdefault(name[i:], []).append(path)
+	return index
+
+def build_hid_index(code: DslCode, index: dict) -> dict:
+	# One pass over the DSL, mapping every _HID/_CID value (plain strings and EisaId ("...") alike)
+	# to the device owning it. Keeps a stack of the Device lines seen so far - the owner is the
+	# closest one with less padding than the _HID/_CID definition, same as walking backwards would find.
+	hids = {}
+	seen = set() # (hid, owner line) pairs already in hids
 	devices = []
-	for i in starting_indexes:
-		# Walk backwards and get the next parent device
-		pad = len(dsdt_lines[i]) - len(dsdt_lines[i].lstrip(' '))
-		for sub,line in enumerate(dsdt_lines[i::-1]):
-			if 'Device (' in line and len(line)-len(line.lstrip(' ')) < pad:
-				# Add it if it's already in our dsdt_paths - if not, add the current line
-				device = next((x for x in dsdt_paths if x[1]==i-sub),None)
-				devices.append(device) if device else devices.append(line,i-sub)
-				break
-	return devices
+	current = None # (owner, depth, waiting) of the _HID/_CID definition being read, waiting for its Method body to open
+	for i,line,line_code in code.items():
+		if line.startswith('DefinitionBlock'): devices = [] # Next table
+		pad = len(line) - len(line.lstrip(' '))
+		if 'Device (' in line:
+			while len(devices) and devices[-1][0] >= pad:
+				devices.pop()
+			devices.append((pad, i))
+		if current == None and any(f'{x} (_{y}' in line_code for x in ('Name','Method') for y in ('HID','CID')):
+			parent = next((x[1] for x in devices[::-1] if x[0] < pad), None)
+			if parent == None: continue
+			owner = index['line'].get(parent, NamespaceEntry(code.lines[parent], parent, 'Device'))
+			current = (owner, 0, 'Name (' not in line_code)
+		if current == None: continue
+		owner, depth, waiting = current
+		for hid in re.findall(r'"([^"]*)"', line_code):
+			if (hid.upper(), owner[1]) in seen: continue
+			seen.add((hid.upper(), owner[1]))
+			hids.setdefault(hid.upper(), []).append(owner)
+		# Name () is done once its parentheses close, Method () once its body has opened and closed again
+		depth += line_code.count('(') + line_code.count('{') - line_code.count(')') - line_code.count('}')
+		waiting = waiting and '{' not in line_code
+		current = None if depth <= 0 and not waiting else (owner, depth, waiting)
+	return hids
 
 def _normalize_types(line: str) -> str:
 	# Replaces Name, Processor, Device, and Method with Scope for splitting purposes
 	return line.replace('Name','Scope').replace('Processor','Scope').replace('Device','Scope').replace('Method','Scope')
 
-def get_path_starting_at(starting_index: int=0) -> tuple:
-	# Walk the scope backwards, keeping track of changes
-	pad = None
-	path = []
-	obj_type = next((x for x in ('Processor','Method','Scope','Device','Name') if f'{x} (' in dsdt_scope[starting_index][0]),'Unknown Type')
-	for scope,original_index in dsdt_scope[starting_index::-1]:
-		new_pad = _normalize_types(scope).split('Scope (')[0]
-		if pad == None or new_pad < pad:
-			pad = new_pad
-			obj = _normalize_types(scope).split('Scope (')[1].split(')')[0].split(',')[0]
-			path.append(obj)
-			if obj in ('_SB','_SB_','_PR','_PR_') or obj.startswith(('\\','_SB.','_SB_.','_PR.','_PR_.')): break # This is a full scope
-	path = path[::-1]
+def _parse_scope(scope: str) -> tuple:
+	# Returns the padding and the object name of a scope line
+	pad, obj = _normalize_types(scope).split('Scope (')[:2]
+	return (pad, obj.split(')')[0].split(',')[0])
+
+def _is_full_scope(obj: str) -> bool:
+	return obj in ('_SB','_SB_','_PR','_PR_') or obj.startswith(('\\','_SB.','_SB_.','_PR.','_PR_.'))
+
+def _join_path(path: list) -> str:
+	# Turns the list of scope names, outermost first, into a full path
 	if len(path) and path[0] == '\\': path.pop(0)
 	if any(('^' in x for x in path)): # Accommodate caret notation
 		new_path = []
@@ -84,95 +251,441 @@ def get_path_starting_at(starting_index: int=0) -> tuple:
 			new_path.append(x.replace('^','')) # Add the original, removing any ^ chars
 		path = new_path
 	path = '.'.join(path)
-	path = f'\\{path}' if path[0] != '\\' else path
-	return (path, dsdt_scope[starting_index][1], obj_type)
-
-def get_scope(starting_index: int = 0, add_hex: bool = False, strip_comments: bool = False) -> list[str]:
-	# Walks the scope starting at starting_index, and returns when
-	# we've exited
-	brackets = None
-	scope = []
-	for line in dsdt_lines[starting_index:]:
-		if is_hex(line):
-			if add_hex:
-				scope.append(line)
-			continue
-		line = get_line(line) if strip_comments else line
-		scope.append(line)
-		if brackets == None:
-			if line.count('{'):
-				brackets = line.count('{')
+	return f'\\{path}' if path[0] != '\\' else path
+
+def _get_obj_type(scope: str) -> str:
+	return next((x for x in ('Processor','Method','Scope','Device','Name') if f'{x} (' in scope),'Unknown Type')
+
+def resolve_paths(scope: list) -> list:
+	# Single forward pass over the scope lines, equivalent to calling get_path_starting_at()
+	# on every object. The stack only ever holds the enclosing scopes (strictly increasing
+	# padding) - exactly the entries the backward walk would pick - and each entry remembers
+	# where its closest full scope (\_SB, \_PR...) sits, which is where the walk would stop.
+	stack = []
+	paths = []
+	for line,index in scope:
+		pad, obj = _parse_scope(line)
+		while len(stack) and stack[-1][0] >= pad:
+			stack.pop()
+		root = len(stack) if _is_full_scope(obj) else stack[-1][2] if len(stack) else 0
+		stack.append((pad, obj, root))
+		if not line.strip().startswith(('Processor (','Device (','Method (','Name (')): continue
+		paths.append((_join_path([x[1] for x in stack[root:]]), index, _get_obj_type(line)))
+	return [NamespaceEntry(*x) for x in sorted(paths)]
+
+def build_spans(lines: DslLines or DslStream, lean: bool = False) -> tuple:
+	# Single pass over the DSL returning:
+	# - the comment-stripped view of the lines, None for hex lines
+	# - the span table, mapping each line opening a brace to the line closing it
+	# - for each line, the first line at or after it that opens a brace (-1 if none)
+	# - the index of every Processor/Scope/Device/Method/Name line
+	# A lean DSL has no hex listing at all, so there's nothing to filter out.
+	# lines can be a DslStream as well, its length is only known once it's over.
+	hex_found = None if lean else array.array('I')
+	spans = {}
+	pending = [] # Max-heap of (-threshold, opening line)
+	depth = 0
+	opening = []
+	scope = array.array('I')
+	for index,line in enumerate(lines):
+		if not lean and is_hex(line):
+			hex_found.append(index)
 			continue
-		brackets = brackets + line.count('{') - line.count('}')
-		if brackets <= 0:
-			# We've exited the scope
-			return scope
-	return scope
-
-def get_unique_device(base_name: str, starting_number: int = 0, used_names: list = []) -> tuple[str, int]:
-	# Appends a hex number until a unique device is found
-	while True:
-		hex_num = hex(starting_number).replace('0x','').upper()
-		name = base_name[:-1*len(hex_num)]+hex_num
-		if not len(get_device_paths(f'.{name}')) and not name in used_names:
-			return (name,starting_number)
-		starting_number += 1
-
-def write_ssdt(ssdt_name: str, ssdt: str, iasl_bin: str, results_folder: str) -> bool:
+		if 'Processor (' in line or 'Scope (' in line or 'Device (' in line or 'Method (' in line or 'Name (' in line:
+			scope.append(index)
+		line = line.split('//')[0]
+		depth += line.count('{') - line.count('}')
+		while len(pending) and -pending[0][0] >= depth:
+			spans[heapq.heappop(pending)[1]] = index
+		if line.count('{'):
+			# The scope is over once we drop below the depth we had before its opening braces
+			heapq.heappush(pending, (-(depth - line.count('{')), index))
+			opening.append(index)
+	lines = lines.lines if isinstance(lines, DslStream) else lines
+	for x in pending:
+		spans[x[1]] = len(lines)-1
+	hex_lines = None
+	if not lean:
+		hex_lines = bytearray(len(lines))
+		for x in hex_found:
+			hex_lines[x] = 1
+	# Every line up to an opening one points to it
+	next_open = array.array('i', [-1])*len(lines)
+	previous = 0
+	for x in opening:
+		next_open[previous:x+1] = array.array('i', [x])*(x+1-previous)
+		previous = x+1
+	return (DslCode(lines, hex_lines), spans, next_open, scope)
+
+class DsdtContext:
+	'''
+	Owns every table parsed out of a single DSDT, along with all the lookups over them.
+	Nothing here touches module state, so several contexts can be used from different threads at once.
+	'''
+
+	def __init__(self) -> None:
+		self.lines = []     # Decompiled DSL lines, see DslLines
+		self.code = []      # Comment-stripped lines, None for hex lines
+		self.spans = {}     # Line opening a brace -> line closing it
+		self.next_open = [] # Line -> first line at or after it opening a brace
+		self.scope = []     # Index of every Processor/Scope/Device/Method/Name line
+		self.paths = []     # Sorted NamespaceEntry (path, index, type) of every object
+		self.index = {}     # See build_namespace_index()
+		self.native = {}    # Byte offset -> amlparser record, when built from the AML
+		self.raw = None     # The AML of every table one after the other, when built from it
+		self.tables = []    # {'name', 'start', 'aml'} of every table, start being its first line or byte offset
+		self.lean = False   # Built from a DSL decompiled without the hex listing
+		self.iasl_bin = None
+		self.cache_key = None # Key of the cache entry it was loaded from or stored into, if any
+		self.listing = None # (listing lines, lean line -> listing line), decompiled on demand
+		self.listing_lock = threading.Lock()
+		self.facts = {}     # Platform facts computed so far, see platform_facts
+		self.fact_locks = {}
+		self.facts_lock = threading.Lock()
+		self.index_lock = threading.Lock()
+
+	def load_dsl(self, dsl: str or bytes or DslStream, lean: bool = False, aml: bytes = None, tables: list = None) -> bool:
+		# Builds every table out of the decompiled DSDT - text, bytes, the mmap of the .dsl file or a DslStream still being decompiled.
+		# Several decompiled tables can be loaded at once, one after the other in dsl, tables telling
+		# where each one starts (a DslStream tells it along the way, tables it never reached are left out).
+		# A lean one keeps its AML around, to get the hex listing out of it if ever needed.
+		self.native, self.facts = {}, {}
+		self.lean, self.raw, self.listing = lean, None, None
+		with profiler.stage('dsl_scope'):
+			self.code, self.spans, self.next_open, self.scope = build_spans(dsl if isinstance(dsl, DslStream) else DslLines(dsl), lean)
+			self.lines = self.code.lines
+		self.tables = [{'name': x['name'], 'start': x['start'], 'aml': x['aml'] if lean else None} for x in tables or [{'name': 'DSDT.aml', 'start': 0, 'aml': aml}] if x.get('start') != None]
+		if not any(self.lines[index].strip().startswith(('Processor (','Device (','Method (','Name (')) for index in self.scope): return False
+		with profiler.stage('dsl_paths'):
+			self.paths = resolve_paths((self.lines[index], index) for index in self.scope)
+			self.index = build_namespace_index(self.paths)
+		# The _HID index is built on first use - see get_hid_index()
+		return True
+
+	def load_aml(self, aml: bytes, log: callable = print, tables: list = None) -> bool:
+		# Builds the namespace straight from the AML, no iasl involved. Entries point at
+		# byte offsets in place of line numbers. Several tables can be loaded at once, as with load_dsl().
+		tables = [{'name': x['name'], 'start': x['start'], 'aml': None} for x in tables or [{'name': 'DSDT.aml', 'start': 0}]]
+		records = []
+		for i,table in enumerate(tables):
+			end = tables[i+1]['start'] if i+1 < len(tables) else len(aml)
+			errors = []
+			try:
+				with profiler.stage('aml_parse', table=table['name']):
+					parsed = amlparser.parse_aml(aml[table['start']:end], errors)
+			except amlparser.AmlError as e:
+				log(f'Unable to parse {table["name"]}: {e}')
+				if i == 0: return False
+				continue
+			finally:
+				# Objects in there are missing from the namespace
+				for x in errors:
+					log(f'{table["name"]}: skipped the rest of {x["scope"]} from 0x{x["offset"]:X} - {x["error"]}')
+			for x in parsed:
+				x['start'] += table['start']
+				x['end'] += table['start']
+			records.extend(parsed)
+		if not len(records): return False
+		self.lines, self.code, self.spans, self.next_open, self.scope = [], [], {}, [], []
+		self.raw, self.tables, self.lean, self.listing, self.facts = aml, tables, False, None, {}
+		self.native = {x['start']: x for x in records}
+		self.paths = [NamespaceEntry(*x) for x in sorted((x['path'], x['start'], x['type']) for x in records)]
+		self.index = build_namespace_index(self.paths)
+		self.index['hid'] = {}
+		for x in records:
+			for hid in x['hid']:
+				self.index['hid'].setdefault(hid.upper(), []).append(self.index['line'][x['start']])
+		return True
+
+	def get_state(self) -> dict:
+		# Everything load_dsl()/load_aml() build, as stored in the cache
+		return {'lines': self.lines, 'code': self.code, 'spans': self.spans, 'next_open': self.next_open, 'scope': self.scope,
+			'paths': self.paths, 'index': self.index, 'native': self.native, 'raw': self.raw, 'tables': self.tables, 'lean': self.lean}
+
+	def set_state(self, state: dict) -> None:
+		self.lines, self.code, self.spans, self.next_open = state['lines'], state['code'], state['spans'], state['next_open']
+		self.scope, self.paths, self.index = state['scope'], state['paths'], state['index']
+		self.native, self.raw, self.tables, self.lean, self.listing = state['native'], state['raw'], state['tables'], state['lean'], None
+		self.facts = {}
+
+	def get_table(self, index: int) -> str:
+		# Name of the table the object at index (a line, or a byte offset) comes from
+		return self.tables[bisect.bisect_right([x['start'] for x in self.tables], index) - 1]['name']
+
+	def get_path_of_type(self, obj_type: str = 'Device', obj: str = 'HPET') -> list:
+		obj_type = obj_type.lower()
+		obj = obj.upper()
+		if obj.startswith('\\'):
+			# Absolute path - the only possible match is the path itself
+			return [path for path in self.index['path'].get(obj, []) if path[2].lower() == obj_type]
+		name = obj.split('.')[-1]
+		candidates = self.index['suffix'].get(obj_type, {}).get(name, [])
+		if '.' in obj:
+			# The last segment has to match as a whole
+			candidates = [path for path in candidates if path[0].upper().split('.')[-1] == name]
+		# Candidates are already sorted, as self.paths is
+		return [path for path in candidates if path[0].upper().endswith(obj)]
+
+	def get_device_paths(self, obj: str = 'HPET') -> list:
+		return self.get_path_of_type(obj_type='Device',obj=obj)
+
+	def get_method_paths(self, obj: str = '_STA') -> list:
+		return self.get_path_of_type(obj_type='Method',obj=obj)
+
+	def get_name_paths(self, obj: str = 'CPU0') -> list:
+		return self.get_path_of_type(obj_type='Name',obj=obj)
+
+	def get_processor_paths(self, obj: str = 'Processor') -> list:
+		return self.get_path_of_type(obj_type='Processor',obj=obj)
+
+	def get_child_paths(self, obj: str = '\\_SB', obj_type: str = None) -> list:
+		# Objects right under the given absolute path, of the given type if any - paths are sorted, so they're all next to each other
+		prefix = obj.upper().rstrip('.') + '.'
+		children = []
+		for path in self.paths[bisect.bisect_left(self.paths, (prefix,)):]:
+			if not path[0].upper().startswith(prefix): break
+			if '.' not in path[0][len(prefix):] and (obj_type == None or path[2].lower() == obj_type.lower()):
+				children.append(path)
+		return children
+
+	def get_device_paths_with_hid(self, hid: str = 'ACPI000E') -> list:
+		return list(self.get_hid_index().get(hid.upper(), []))
+
+	def get_hid_index(self) -> dict:
+		# Maps every _HID/_CID value to its devices. That takes a whole pass over the DSL,
+		# so it's only done once something actually looks a device up by _HID
+		with self.index_lock:
+			if 'hid' not in self.index:
+				with profiler.stage('hid_index'):
+					self.index['hid'] = build_hid_index(self.code, self.index)
+		return self.index['hid']
+
+	def get_path_starting_at(self, starting_index: int=0) -> tuple:
+		# Walk the scope backwards, keeping track of changes
+		pad = None
+		path = []
+		obj_type = _get_obj_type(self.lines[self.scope[starting_index]])
+		for original_index in self.scope[starting_index::-1]:
+			new_pad, obj = _parse_scope(self.lines[original_index])
+			if pad == None or new_pad < pad:
+				pad = new_pad
+				path.append(obj)
+				if _is_full_scope(obj): break # This is a full scope
+		return (_join_path(path[::-1]), self.scope[starting_index], obj_type)
+
+	def get_scope(self, starting_index: int = 0, add_hex: bool = False, strip_comments: bool = False) -> list[str]:
+		# Returns the lines from starting_index up to the end of the scope it opens
+		opening = self.next_open[starting_index]
+		end = self.spans[opening] if opening != -1 else len(self.lines)-1
+		if add_hex and self.lean:
+			listing, positions = self.get_listing()
+			return [get_line(line) if strip_comments and not is_hex(line) else line for line in listing[positions[starting_index]:positions[end]+1]]
+		lines = []
+		for i in range(starting_index, end+1):
+			code = self.code[i]
+			if code != None: lines.append(code if strip_comments else self.lines[i])
+			elif add_hex: lines.append(self.lines[i])
+		return lines
+
+	def get_listing(self) -> tuple:
+		# Decompiles the AML once more, hex listing included, the first time someone asks for it
+		with self.listing_lock, profiler.stage('listing'):
+			if self.listing == None:
+				# Without the hex lines both are the same DSL - the header comments aside, so each table is lined up on its DefinitionBlock
+				first = lambda lines: next((i for i,line in enumerate(lines) if line.startswith('DefinitionBlock')), 0)
+				chunks, positions, base = [], array.array('I'), 0
+				for i,table in enumerate(self.tables):
+					end = self.tables[i+1]['start'] if i+1 < len(self.tables) else len(self.lines)
+					listing = DslLines(decompile(table['aml'], self.iasl_bin, True))
+					code = [i for i,line in enumerate(listing) if not is_hex(line)]
+					shift = first(listing[i] for i in code) - first(self.lines[table['start']:end])
+					positions.extend(base + code[max(0, min(i + shift, len(code)-1))] for i in range(end - table['start']))
+					chunks.append(bytes(listing.data).rstrip(b'\n') + b'\n')
+					base += chunks[-1].count(b'\n')
+				self.listing = (DslLines(b''.join(chunks)), positions)
+		return self.listing
+
+	def scope_contains(self, starting_index: int, *needles: str) -> bool:
+		# True if all needles show up in the comment-stripped scope starting at starting_index
+		if self.native:
+			# Names are always 4 chars in AML, so we can look for them straight in the object's bytes
+			record = self.native[starting_index]
+			return all(self.raw.find(x.encode(), record['start'], record['end']) != -1 for x in needles)
+		opening = self.next_open[starting_index]
+		end = self.spans[opening] if opening != -1 else len(self.lines)-1
+		scope = '\n'.join(line for line in self.code[starting_index:end+1] if line != None)
+		return all(x in scope for x in needles)
+
+	def get_name_line(self, index: int) -> str:
+		# Returns the Name () definition starting at index, as decompiled
+		if not self.native:
+			return self.lines[index].strip()
+		record = self.native[index]
+		name = record['path'].split('.')[-1]
+		value, encoding = record['value']
+		value = amlparser.format_integer(value, encoding) if isinstance(value, int) else f'"{value}"' if isinstance(value, str) else 'Zero'
+		return f'Name ({name}, {value})' + ('  // _ADR: Address' if name == '_ADR' else '')
+
+	def get_fact(self, name: str):
+		# Returns one of the platform_facts, computing it the first time it's asked for.
+		# Each fact has its own lock, so generators running in parallel wait for the one computing it.
+		with self.facts_lock:
+			lock = self.fact_locks.setdefault(name, threading.Lock())
+		with lock:
+			if name not in self.facts:
+				with profiler.stage(f'fact:{name}'):
+					self.facts[name] = platform_facts[name](self)
+		return self.facts[name]
+
+	def get_unique_device(self, base_name: str, starting_number: int = 0, used_names: list = []) -> tuple[str, int]:
+		# Appends a hex number until a unique device is found
+		while True:
+			hex_num = hex(starting_number).replace('0x','').upper()
+			name = base_name[:-1*len(hex_num)]+hex_num
+			if not len(self.get_device_paths(f'.{name}')) and not name in used_names:
+				return (name,starting_number)
+			starting_number += 1
+
+### Platform facts - discovered once per DSDT, and shared by every generator ###
+
+def find_ecs(ctx: DsdtContext) -> list:
+	# Every PNP0C09 device, whether it's a valid EC, and whether it already has an _STA
+	ecs = []
+	for path,index,obj_type in ctx.get_device_paths_with_hid('PNP0C09'):
+		device = '.'.join(path.split('.')[:-1]+['EC0']) if path.split('.')[-1] == 'EC' else path
+		# We need to check for _HID, _CRS, and _GPE
+		valid = ctx.scope_contains(index, '_HID', '_CRS', '_GPE')
+		has_sta = valid and len(ctx.get_method_paths(f'{device}._STA')) > 0
+		ecs.append({'path': path, 'index': index, 'device': device, 'renamed': device != path, 'valid': valid, 'has_sta': has_sta})
+	return ecs
+
+def find_lpc(ctx: DsdtContext) -> str or None:
+	# The LPC bridge is the parent of the first EC - or the first device with a well-known LPC name
+	ecs = ctx.get_fact('ec')
+	if len(ecs): return '.'.join(ecs[0]['path'].split('.')[:-1])
+	for x in ('LPCB', 'LPC0', 'LPC', 'SBRG', 'PX40'):
+		devices = ctx.get_device_paths(x)
+		if len(devices): return devices[0][0]
+	return None
+
+def find_rtcs(ctx: DsdtContext) -> list:
+	return ctx.get_device_paths_with_hid('PNP0B00')
+
+def find_awac(ctx: DsdtContext) -> dict or None:
+	# The first ACPI000E device, along with its _STA/XSTA methods and whether _STA relies on STAS
+	awacs = ctx.get_device_paths_with_hid('ACPI000E')
+	if not len(awacs): return None
+	device = awacs[0]
+	sta = ctx.get_method_paths(f'{device[0]}._STA')
+	xsta = ctx.get_method_paths(f'{device[0]}.XSTA')
+	return {'device': device, 'sta': sta, 'xsta': xsta, 'has_stas': len(sta) > 0 and ctx.scope_contains(sta[0][1], 'STAS')}
+
+def find_cpu(ctx: DsdtContext) -> str or None:
+	processors = ctx.get_processor_paths('')
+	return processors[0][0] if len(processors) else None
+
+def find_rhubs(ctx: DsdtContext) -> list:
+	return ctx.get_device_paths('RHUB') + ctx.get_device_paths('HUBN') + ctx.get_device_paths('URTH')
+
+platform_facts = {
+	'ec': find_ecs,
+	'lpc': find_lpc,
+	'rtc': find_rtcs,
+	'awac': find_awac,
+	'cpu': find_cpu,
+	'rhubs': find_rhubs,
+}
+
+def write_ssdt_source(ssdt_name: str, ssdt: str, results_folder: str, log: callable = print, emitter: bool = False, crosscheck: bool = False) -> tuple:
+	# Writes the DSL of the SSDT - and its AML too, if the built-in emitter takes care of it.
+	# Returns (status, emitted AML), status being False if there's no SSDT, True if done, None if iasl still has to compile it
 	if not ssdt:
-		print(f'Unable to generate {ssdt_name}!')
-		return False
+		log(f'Unable to generate {ssdt_name}!')
+		return (False, None)
 	temporary_dsl_path = os.path.join(results_folder, f'{ssdt_name}.dsl')
 	with open(temporary_dsl_path, 'w') as f:
 		f.write(ssdt)
-	print('Compiling...')
+	aml = None
+	if emitter:
+		try:
+			aml = amlemitter.compile_dsl(ssdt)
+		except amlemitter.EmitError as e:
+			log(f' - Not supported by the built-in emitter ({e}), falling back to iasl')
+		if aml and not crosscheck:
+			log('Emitting...')
+			with open(os.path.join(results_folder, f'{ssdt_name}.aml'), 'wb') as f:
+				f.write(aml)
+			return (True, aml)
+	return (None, aml)
+
+def compile_ssdts(dsl_paths: list, iasl_bin: str) -> dict:
+	'''
+	Compiles all the DSLs with a single iasl run, returning {dsl path: None if compiled, iasl's output otherwise}.
+	iasl doesn't tell which file its errors belong to, so any DSL left without its AML is compiled again on its own.
+	'''
+	if not dsl_paths: return {}
+	aml_paths = {x: os.path.splitext(x)[0] + '.aml' for x in dsl_paths}
+	for x in aml_paths.values():
+		if os.path.exists(x): os.remove(x)
+	results = {}
 	try:
-		subprocess.check_call([f'{iasl_bin}', f'{temporary_dsl_path}'], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-	except:
-		print(f'Unable to compile {ssdt_name}!')
-		return False
+		profiler.run([f'{iasl_bin}'] + list(dsl_paths), 'iasl (compile)')
+	except OSError as e:
+		return {x: str(e) for x in dsl_paths}
+	for dsl in dsl_paths:
+		if os.path.exists(aml_paths[dsl]):
+			results[dsl] = None
+			continue
+		returncode, output = profiler.run([f'{iasl_bin}', dsl], 'iasl (compile retry)', capture=True)
+		results[dsl] = None if returncode == 0 and os.path.exists(aml_paths[dsl]) else output.decode(errors='replace')
+	return results
+
+def check_compiled_ssdt(ssdt_name: str, error: str or None, aml: bytes or None, results_folder: str, log: callable = print) -> bool:
+	# Reports how compiling the SSDT went, error being the iasl output if it failed
+	aml_path = os.path.join(results_folder, f'{ssdt_name}.aml')
+	if error != None:
+		log(f'Unable to compile {ssdt_name}!')
+		for line in [x.strip() for x in error.split('\n') if 'Error' in x][:5]:
+			log(f' - {line}')
+		if not aml: return False
+		# Still got the emitted one
+		with open(aml_path, 'wb') as f:
+			f.write(aml)
+		return True
+	if aml:
+		with open(aml_path, 'rb') as f:
+			if amlemitter.same_aml(aml, f.read()): log(' - Matches the built-in emitter output')
+			else: log(f' - {ssdt_name} differs from the built-in emitter output! Keeping the iasl one')
 	return True
 
-def fake_ec() -> str or bool: 
-	print('\nLocating PNP0C09 (EC) devices...')
-	ec_list = get_device_paths_with_hid('PNP0C09')
+def fake_ec(ctx: DsdtContext, log: callable = print) -> str or bool: 
+	log('\nLocating PNP0C09 (EC) devices...')
+	ec_list = ctx.get_fact('ec')
 	ec_to_patch  = []
-	lpc_name = None
 	if len(ec_list):
-		lpc_name = '.'.join(ec_list[0][0].split('.')[:-1])
-		print(f' - Got {len(ec_list)}')
-		print(' - Validating...')
+		log(f' - Got {len(ec_list)}')
+		log(' - Validating...')
 		for x in ec_list:
-			device = x[0]
-			print(f' --> {device}')
-			if device.split('.')[-1] == 'EC':
-				print(' ----> EC called EC. Renaming')
-				device = '.'.join(device.split('.')[:-1]+['EC0'])
-			scope = '\n'.join(get_scope(x[1], strip_comments=True))
-			# We need to check for _HID, _CRS, and _GPE
-			if all((y in scope for y in ['_HID','_CRS','_GPE'])):
-				print(' ----> Valid EC Device')
-				sta = get_method_paths(f'{device}._STA')
-				if len(sta):
-					print(' ----> Contains _STA method. Skipping')
+			log(f' --> {x["path"]}')
+			if x['renamed']:
+				log(' ----> EC called EC. Renaming')
+			if x['valid']:
+				log(' ----> Valid EC Device')
+				if x['has_sta']:
+					log(' ----> Contains _STA method. Skipping')
 					continue
-				ec_to_patch.append(device)
+				ec_to_patch.append(x['device'])
 			else:
-				print(' ----> NOT Valid EC Device')
+				log(' ----> NOT Valid EC Device')
 	else:
-		print(' - None found - only needs a Fake EC device')
-	print('Locating LPC(B)/SBRG...')
-	if lpc_name == None:
-		for x in ('LPCB', 'LPC0', 'LPC', 'SBRG', 'PX40'):
-			try:
-				lpc_name = get_device_paths(x)[0][0]
-				break
-			except: pass
+		log(' - None found - only needs a Fake EC device')
+	log('Locating LPC(B)/SBRG...')
+	lpc_name = ctx.get_fact('lpc')
 	if not lpc_name:
-		print(' - Could not locate LPC(B)! Aborting!\n')
+		log(' - Could not locate LPC(B)! Aborting!\n')
 		return False
-	print(f' - Found {lpc_name}')
-	print('Creating SSDT-EC...')
+	log(f' - Found {lpc_name}')
+	log('Creating SSDT-EC...')
 	ssdt = '''
 DefinitionBlock ("", "SSDT", 2, "CORP ", "SsdtEC", 0x00001000)
 {
@@ -222,16 +735,15 @@ Scope ([[LPCName]])
 '''.replace('[[LPCName]]',lpc_name)
 	return ssdt
 
-def plugin_type() -> str or bool:
-	print('\nDetermining CPU name scheme...')
-	try: cpu_name = get_processor_paths('')[0][0]
-	except: cpu_name = None
+def plugin_type(ctx: DsdtContext, log: callable = print) -> str or bool:
+	log('\nDetermining CPU name scheme...')
+	cpu_name = ctx.get_fact('cpu')
 	if not cpu_name:
-		print(' - Could not locate Processor object! Aborting!\n')
+		log(' - Could not locate Processor object! Aborting!\n')
 		return False
 	else:
-		print(f' - Found {cpu_name}')
-	print('Creating SSDT-PLUG...')
+		log(f' - Found {cpu_name}')
+	log('Creating SSDT-PLUG...')
 	ssdt = '''
 //
 // Based on the sample found at https://github.com/acidanthera/OpenCorePkg/blob/master/Docs/AcpiSamples/SSDT-PLUG.dsl
@@ -262,21 +774,14 @@ Scope ([[CPUName]])
 }'''.replace('[[CPUName]]',cpu_name)
 	return ssdt
 
-def ssdt_pmc() -> str or bool:
-	print('\nLocating LPC(B)/SBRG...')
-	ec_list = get_device_paths_with_hid('PNP0C09')
-	lpc_name = '.'.join(ec_list[0][0].split('.')[:-1]) if len(ec_list) else None
-	if lpc_name == None:
-		for x in ('LPCB', 'LPC0', 'LPC', 'SBRG', 'PX40'):
-			try:
-				lpc_name = get_device_paths(dsdt_paths, x)[0][0]
-				break
-			except: pass
+def ssdt_pmc(ctx: DsdtContext, log: callable = print) -> str or bool:
+	log('\nLocating LPC(B)/SBRG...')
+	lpc_name = ctx.get_fact('lpc')
 	if not lpc_name:
-		print(' - Could not locate LPC(B)! Aborting!\n')
+		log(' - Could not locate LPC(B)! Aborting!\n')
 		return False
-	print(f' - Found {lpc_name}')
-	print('Creating SSDT-PMC...')
+	log(f' - Found {lpc_name}')
+	log('Creating SSDT-PMC...')
 	ssdt = '''//
 // SSDT-PMC source from Acidanthera
 // Original found here: https://github.com/acidanthera/OpenCorePkg/blob/master/Docs/AcpiSamples/SSDT-PMC.dsl
@@ -314,60 +819,48 @@ Scope ([[LPCName]])
 }'''.replace('[[LPCName]]',lpc_name)
 	return ssdt
 
-def ssdt_awac() -> str or bool:
-	print('\nLocating ACPI000E (AWAC) devices...')
-	awac_list = get_device_paths_with_hid('ACPI000E')
-	if not len(awac_list):
-		print(' - Could not locate any ACPI000E devices!  SSDT-AWAC not needed!\n')
+def ssdt_awac(ctx: DsdtContext, log: callable = print) -> str or bool:
+	log('\nLocating ACPI000E (AWAC) devices...')
+	awac_fact = ctx.get_fact('awac')
+	if awac_fact == None:
+		log(' - Could not locate any ACPI000E devices!  SSDT-AWAC not needed!\n')
 		return False
-	awac = awac_list[0]
+	awac = awac_fact['device']
 	root = awac[0].split('.')[0]
-	print(f' - Found {awac[0]}')
-	print(' --> Verifying _STA...')
-	sta  = get_method_paths(f'{awac[0]}._STA')
-	xsta = get_method_paths(f'{awac[0]}.XSTA')
-	has_stas = False
+	log(f' - Found {awac[0]}')
+	log(' --> Verifying _STA...')
+	sta, xsta, has_stas = awac_fact['sta'], awac_fact['xsta'], awac_fact['has_stas']
 	lpc_name = None
 	if not len(sta) and len(xsta):
-		print(' --> _STA already renamed to XSTA!  Aborting!\n')
+		log(' --> _STA already renamed to XSTA!  Aborting!\n')
 		return False
 	if len(sta):
-		scope = '\n'.join(get_scope(sta[0][1], strip_comments=True))
-		if 'STAS' in scope:
+		if has_stas:
 			# We have an STAS var, and should be able to just leverage it
-			has_stas = True
-			print(' --> Has STAS variable')
-		else: print(' --> Does NOT have STAS variable')
+			log(' --> Has STAS variable')
+		else: log(' --> Does NOT have STAS variable')
 	else:
-		print(' --> No _STA method found')
+		log(' --> No _STA method found')
 
-	print('Locating PNP0B00 (RTC) devices...')
-	rtc_list  = get_device_paths_with_hid('PNP0B00')
+	log('Locating PNP0B00 (RTC) devices...')
+	rtc_list  = ctx.get_fact('rtc')
 	rtc_fake = True
 
 	if len(rtc_list):
 		rtc_fake = False
-		print(f' - Found at {rtc_list[0][0]}')
-	else: print(' - None found - fake needed!')
+		log(f' - Found at {rtc_list[0][0]}')
+	else: log(' - None found - fake needed!')
 	if rtc_fake:
-		print('Locating LPC(B)/SBRG...')
-		ec_list = get_device_paths_with_hid('PNP0C09')
-		if len(ec_list):
-			lpc_name = '.'.join(ec_list[0][0].split('.')[:-1])
-		if lpc_name == None:
-			for x in ('LPCB', 'LPC0', 'LPC', 'SBRG', 'PX40'):
-				try:
-					lpc_name = get_device_paths(x)[0][0]
-					break
-				except: pass
+		log('Locating LPC(B)/SBRG...')
+		lpc_name = ctx.get_fact('lpc')
 		if not lpc_name:
-			print(' - Could not locate LPC(B)! Aborting!\n')
+			log(' - Could not locate LPC(B)! Aborting!\n')
 			return False
 	# At this point - we need to do the following:
 	# 1. Change STAS if needed
 	# 2. Setup _STA with _OSI and call XSTA if needed
 	# 3. Fake RTC if needed
-	print('Creating SSDT-AWAC...')
+	log('Creating SSDT-AWAC...')
 	ssdt = '''//
 // SSDT-AWAC source from Acidanthera
 // Originals found here:
@@ -464,16 +957,14 @@ Scope ([[LPCName]])
 	ssdt += '}'
 	return ssdt
 
-def ssdt_rhub() -> str or bool:
+def ssdt_rhub(ctx: DsdtContext, log: callable = print) -> str or bool:
 	illegal_names = ('XHC1','EHC1','EHC2','PXSX')
-	print('\nGathering RHUB/HUBN/URTH devices...')
-	rhubs = get_device_paths('RHUB')
-	rhubs.extend(get_device_paths('HUBN'))
-	rhubs.extend(get_device_paths('URTH'))
+	log('\nGathering RHUB/HUBN/URTH devices...')
+	rhubs = ctx.get_fact('rhubs')
 	if not len(rhubs):
-		print(' - None found!  Aborting...\n')
+		log(' - None found!  Aborting...\n')
 		return False
-	print(f' - Found {len(rhubs)}')
+	log(f' - Found {len(rhubs)}')
 	# Gather some info
 	tasks = []
 	used_names = []
@@ -481,25 +972,25 @@ def ssdt_rhub() -> str or bool:
 	ehc_num = 1
 	for x in rhubs:
 		task = {'device':x[0]}
-		print(f''' --> {'.'.join(x[0].split('.')[:-1])}''')
+		log(f''' --> {'.'.join(x[0].split('.')[:-1])}''')
 		name = x[0].split('.')[-2]
 		if name in illegal_names or name in used_names:
-			print(' ----> Needs rename!')
+			log(' ----> Needs rename!')
 			# Get the new name, and the path to the device and its parent
 			task['device'] = '.'.join(task['device'].split('.')[:-1])
 			task['parent'] = '.'.join(task['device'].split('.')[:-1])
 			if name.startswith('EHC'):
-				task['rename'],ehc_num = get_unique_device('EH01',ehc_num,used_names)
+				task['rename'],ehc_num = ctx.get_unique_device('EH01',ehc_num,used_names)
 				ehc_num += 1 # Increment the name number
 			else:
-				task['rename'],xhc_num = get_unique_device('XHCI',xhc_num,used_names)
+				task['rename'],xhc_num = ctx.get_unique_device('XHCI',xhc_num,used_names)
 				xhc_num += 1 # Increment the name number
 			used_names.append(task['rename'])
 		else:
 			used_names.append(name)
 		# Let's try to get the _ADR
-		scope_adr = get_name_paths(f"{task['device']}._ADR")
-		task['address'] = dsdt_lines[scope_adr[0][1]].strip() if len(scope_adr) else 'Name (_ADR, Zero)  // _ADR: Address'
+		scope_adr = ctx.get_name_paths(f"{task['device']}._ADR")
+		task['address'] = ctx.get_name_line(scope_adr[0][1]) if len(scope_adr) else 'Name (_ADR, Zero)  // _ADR: Address'
 		tasks.append(task)
 	ssdt = '''//
 // SSDT to disable RHUB/HUBN/URTH devices and rename PXSX, XHC1, EHC1, and EHC2 devices
@@ -574,70 +1065,314 @@ Scope ([[device]])
 	ssdt += '\n}'
 	return ssdt
 
+generator_version = 2 # Bumped whenever what the generators produce changes, so no stored result gets reused past it
+
+# Every SSDT we know how to generate, in the order they're reported, along with the platform facts
+# they read - only those get computed. More can be added through register_generator().
+generators = [
+	{'name': 'SSDT-EC', 'func': fake_ec, 'needs': ('ec', 'lpc')},
+	{'name': 'SSDT-PLUG', 'func': plugin_type, 'needs': ('cpu',)},
+	{'name': 'SSDT-PMC', 'func': ssdt_pmc, 'needs': ('lpc',)},
+	{'name': 'SSDT-AWAC', 'func': ssdt_awac, 'needs': ('awac', 'rtc', 'lpc')},
+	{'name': 'SSDT-USB-Reset', 'func': ssdt_rhub, 'needs': ('rhubs',)},
+]
+
+def register_generator(name: str, func: callable, needs: tuple = ()) -> None:
+	'''
+	Adds a generator - func(ctx, log) returning the SSDT source or False - or replaces the one with the same name.
+	needs lists the platform_facts it reads through ctx.get_fact().
+	'''
+	for x in needs:
+		if x not in platform_facts: raise ValueError(f'Unknown platform fact: {x}')
+	entry = {'name': name, 'func': func, 'needs': tuple(needs)}
+	for i,x in enumerate(generators):
+		if x['name'] == name:
+			generators[i] = entry
+			return
+	generators.append(entry)
+
+def select_generators(only: list = None, skip: list = None) -> list:
+	# Generators to run, in the usual order. Names are case insensitive, and the SSDT- prefix can be left out.
+	normalize = lambda x: x.upper() if x.upper().startswith('SSDT-') else f'SSDT-{x.upper()}'
+	known = {x['name'].upper(): x for x in generators}
+	for x in (only or []) + (skip or []):
+		if normalize(x) not in known: raise ValueError(f'Unknown SSDT: {x}')
+	only = [normalize(x) for x in only] if only else list(known)
+	skip = [normalize(x) for x in skip or []]
+	return [x for x in generators if x['name'].upper() in only and x['name'].upper() not in skip]
+
+def get_result_key(amls: list, iasl_bin: str, native: bool = False, emitter: bool = False, crosscheck: bool = False, only: list = None, skip: list = None) -> str:
+	# Identifies the SSDTs generated out of the given tables - same tables, iasl, generators and options, same SSDTs
+	names = ','.join(x['name'] for x in select_generators(only, skip))
+	return cache.get_key('|'.join(cache.get_key(x) for x in amls).encode(), iasl_bin, f'result-{version}-{generator_version}-{native:d}{emitter:d}{crosscheck:d}-{names}')
+
+def run_generator(ssdt_name: str, generator: callable, ctx: DsdtContext, results_folder: str, emitter: bool = False, crosscheck: bool = False) -> tuple:
+	# Generates a single SSDT, collecting its output rather than printing it, so that SSDTs
+	# built concurrently don't interleave their logs. Returns (status, output, emitted AML) - see write_ssdt_source()
+	output = []
+	log = lambda *x: output.append(' '.join(str(y) for y in x))
+	with profiler.stage(f'generate:{ssdt_name}'):
+		status, aml = write_ssdt_source(ssdt_name, generator(ctx, log), results_folder, log, emitter, crosscheck)
+	return (status, output, aml)
+
 ### FUNCTIONS - END ###
 
 ### BLOCCO MAIN - START ###
 
-def main(args: dict) -> None:
-	dsdt = args['dsdt']
-	iasl_bin = args['iasl_bin']
-	print(f'Decompiling {dsdt}...')
+def decompile(aml: bytes, iasl_bin: str, listing: bool = False) -> mmap.mmap or bytes:
+	# Decompiles the AML into DSL, with the hex listing interleaved if asked to.
+	# The .dsl file is mapped rather than read, so its text never has to live on the heap.
+	# Unique per run, so that several reports can be processed at once
+	tmp_dir = tempfile.mkdtemp(prefix='gtools-')
+	try:
+		with open(os.path.join(tmp_dir, 'DSDT.aml'), 'wb') as f:
+			f.write(aml)
+		args = [f'{iasl_bin}', '-da', '-dl'] + (['-l'] if listing else []) + [f'{tmp_dir}/DSDT.aml']
+		returncode, output = profiler.run(args, 'iasl (decompile with listing)' if listing else 'iasl (decompile)')
+		if returncode: raise subprocess.CalledProcessError(returncode, args)
+		with open(os.path.join(tmp_dir, 'DSDT.dsl'), 'rb') as f:
+			return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+	finally:
+		# The mapping outlives the file where allowed to - elsewhere the folder is left for the OS to clean up
+		shutil.rmtree(tmp_dir, ignore_errors=True)
 
-	tmp_dir = os.path.join(os.getcwd(), 'tmp')
-	shutil.rmtree(tmp_dir) if os.path.exists(tmp_dir) else None
-	os.mkdir(tmp_dir)
+def decompile_stream(aml: bytes, iasl_bin: str, listing: bool = False):
+	'''
+	Decompiles the AML as decompile() does, yielding the DSL in chunks as iasl writes it - its output file is a FIFO,
+	so the DSL can be scanned while iasl is still at it, and never lands on disk. Raises CalledProcessError once over
+	if iasl failed. Without FIFOs (Windows), the whole DSL comes at once out of decompile().
+	'''
+	if not hasattr(os, 'mkfifo'):
+		yield decompile(aml, iasl_bin, listing)
+		return
+	tmp_dir = tempfile.mkdtemp(prefix='gtools-')
+	reader, keeper, waiter, returncode = None, None, None, []
+	try:
+		with open(os.path.join(tmp_dir, 'DSDT.aml'), 'wb') as f:
+			f.write(aml)
+		fifo = os.path.join(tmp_dir, 'DSDT.dsl')
+		os.mkfifo(fifo)
+		# Opened both ways upfront, so that neither end waits for the other. The write end is only closed once iasl
+		# exits, which is what ends the stream - even if iasl failed before opening the FIFO at all.
+		reader = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+		keeper = os.open(fifo, os.O_WRONLY)
+		os.set_blocking(reader, True)
+		args = [f'{iasl_bin}', '-da', '-dl'] + (['-l'] if listing else []) + [f'{tmp_dir}/DSDT.aml']
+		process = profiler.start(args)
+		def reap() -> None:
+			returncode.append(profiler.wait(process, 'iasl (decompile with listing)' if listing else 'iasl (decompile)'))
+			os.close(keeper)
+		waiter = threading.Thread(target=reap, daemon=True)
+		waiter.start()
+		streamed = False
+		chunk = os.read(reader, 1024 * 1024)
+		while chunk:
+			streamed = True
+			yield chunk
+			chunk = os.read(reader, 1024 * 1024)
+		waiter.join()
+		if returncode[0]: raise subprocess.CalledProcessError(returncode[0], args)
+		# An iasl that replaces its output file rather than writing into it still works, just not streamed
+		if not streamed and not stat.S_ISFIFO(os.stat(fifo).st_mode):
+			with open(fifo, 'rb') as f:
+				yield f.read()
+	finally:
+		# Stopped early - iasl gets EPIPE if it's still writing, and is killed if that's not enough
+		if reader != None: os.close(reader)
+		if waiter != None:
+			if not returncode: process.kill()
+			waiter.join()
+		elif keeper != None:
+			os.close(keeper)
+		shutil.rmtree(tmp_dir, ignore_errors=True)
 
-	results_folder = os.path.join(os.getcwd(), 'SSDTs')
-	
-	shutil.rmtree(results_folder) if os.path.exists(results_folder) else None
-	os.mkdir(results_folder)
-	
-	subprocess.check_call(['cp', f'{dsdt}', f'{tmp_dir}'], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-	subprocess.check_call([f'{iasl_bin}', '-da', '-dl', '-l', f'{tmp_dir}/DSDT.aml'], stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+def stream_tables(tables: list, futures: list, iasl_bin: str, lean: bool, cache_dir: str = None, log: callable = print):
+	# (table, chunks) of the DSDT, streamed out of iasl unless cached, then of the SSDTs being decompiled by futures - see DslStream.
+	# The streamed DSDT has no cache entry of its own, the one of the whole namespace covers it.
+	dsdt = tables[0]
+	dsl = load_table(dsdt['key'], cache_dir) if dsdt['key'] else None
+	yield (dsdt, [dsl] if dsl != None else decompile_stream(dsdt['aml'], iasl_bin, not lean))
+	for x,future in zip(tables[1:], futures):
+		try:
+			dsl = future.result()
+		except subprocess.CalledProcessError:
+			log(f'Unable to decompile {x["name"]}, skipping it')
+			continue
+		yield (x, [dsl])
 
-	# dsdt.load() - aml part
-	dsdt_raw_fo = open(dsdt, 'rb')
-	dsdt_raw = dsdt_raw_fo.read()
+def find_ssdts(acpi_folder: str, listdir: callable = os.listdir) -> list:
+	# Every SSDT dumped next to the DSDT, in name order - listdir allows looking into something else than the filesystem
+	join = os.path.join if listdir == os.listdir else lambda *x: '/'.join(x)
+	return [join(acpi_folder, x) for x in sorted(listdir(acpi_folder)) if x.upper().startswith('SSDT') and x.lower().endswith('.aml')]
+
+def load_table(key: str, cache_dir: str = None) -> bytes or mmap.mmap or None:
+	# DSL of a table decompiled before, mapped straight out of the cache - see decompile_table()
+	return cache.load_file(key, 'table.dsl', cache_dir) if cache.load(key, cache_dir) != None else None
+
+def decompile_table(table: dict, iasl_bin: str, lean: bool, cache_dir: str = None, log: callable = print) -> bytes or mmap.mmap:
+	# Decompiles a single table, unless an identical one (same bytes, same iasl) already was.
+	# The DSL is cached as a file of its own, written from the mapped .dsl rather than read into memory first
+	with profiler.stage('decompile', table=table['name']):
+		dsl = load_table(table['key'], cache_dir) if table['key'] else None
+		if dsl != None: return dsl
+		dsl = decompile(table['aml'], iasl_bin, not lean)
+		error = cache.store(table['key'], {'dsl': 'table.dsl'}, cache_dir, buffers={'table.dsl': dsl}) if table['key'] else None
+		if error: log(error)
+		return dsl
+
+def store_state(key: str, ctx: DsdtContext, cache_dir: str = None) -> str or None:
+	# Stores the namespace of ctx, returning why it couldn't if so. The DSL doesn't go into the pickle but into a file
+	# of its own, written straight from its buffer (usually the mmap of the .dsl) and mapped back by load_state()
+	state = ctx.get_state()
+	if not isinstance(ctx.lines, DslLines): return cache.store(key, state, cache_dir)
+	lines = DslLines(b'', ctx.lines.offsets)
+	state.update(lines=lines, code=DslCode(lines, ctx.code.hex))
+	return cache.store(key, state, cache_dir, buffers={'namespace.dsl': ctx.lines.data})
+
+def load_state(key: str, cache_dir: str = None) -> dict or None:
+	# The namespace stored by store_state(), None if there's none
+	state = cache.load(key, cache_dir)
+	if state == None or not isinstance(state['lines'], DslLines): return state
+	data = cache.load_file(key, 'namespace.dsl', cache_dir)
+	if data == None: return None # Evicted meanwhile
+	state['lines'].data = data # Shared with state['code']
+	return state
 
-	# dsdt.load() - dsl part
-	dsdt_dsl = os.path.join(tmp_dir, 'DSDT.dsl')
+def load_context(dsdt: str, iasl_bin: str, native: bool = False, use_cache: bool = True, log: callable = print, cache_dir: str = None, lean: bool = True, ssdts: list = None, read: callable = None, stream: bool = False) -> DsdtContext or None:
+	# Builds the context of the DSDT at the given path, merged with the given SSDTs, through the cache if possible.
+	# Tables are read from the filesystem, unless a read(path) -> bytes is given (e.g. to read them out of an archive).
+	# With stream, the DSDT is scanned while being decompiled rather than once decompiled, see decompile_stream()
+	ctx = DsdtContext()
+	ctx.iasl_bin = iasl_bin
+	mode = 'native' if native else 'iasl-lean' if lean else 'iasl'
 	
-	dsdt_fo = open(dsdt_dsl, 'r')
-	dsdt = dsdt_fo.read()
+	# dsdt.load() - aml part
+	tables = []
+	for path in [dsdt] + list(ssdts or []):
+		if read:
+			aml = read(path)
+		else:
+			with open(path, 'rb') as f:
+				aml = f.read()
+		# Fingerprinted one by one, so an OEM table shared by many reports is only ever decompiled once
+		key = cache.get_key(aml, None if native else iasl_bin, f'table-{mode}') if use_cache and not native else None
+		tables.append({'name': os.path.basename(path), 'path': path, 'aml': aml, 'key': key})
 
-	global dsdt_lines
-	dsdt_lines = dsdt.split('\n')
+	key = cache.get_key('|'.join(cache.get_key(x['aml']) for x in tables).encode(), None if native else iasl_bin, mode) if use_cache else None
+	with profiler.stage('cache_load'):
+		state = load_state(key, cache_dir) if key else None
+	names = dsdt + (f' and {len(tables)-1} SSDTs' if len(tables) > 1 else '')
+	if state:
+		log(f'Loading {names} from cache...')
+		ctx.set_state(state)
+	elif native:
+		log(f'Parsing {names}...')
+		start = 0
+		for x in tables:
+			x['start'] = start
+			start += len(x['aml'])
+		if not ctx.load_aml(b''.join(x['aml'] for x in tables), log, tables):
+			if not iasl_bin or not os.path.exists(iasl_bin): return None
+			log('Decompiling it with iasl instead...')
+			return load_context(dsdt, iasl_bin, False, use_cache, log, cache_dir, lean, ssdts, read, stream)
+	elif stream:
+		log(f'Decompiling {names}...')
+		# The SSDTs get decompiled in the background as below, meanwhile the DSDT is scanned as it comes out of iasl
+		with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(len(tables)-1, os.cpu_count() or 1))) as pool:
+			futures = [pool.submit(decompile_table, x, iasl_bin, lean, cache_dir, log) for x in tables[1:]]
+			if not ctx.load_dsl(DslStream(stream_tables(tables, futures, iasl_bin, lean, cache_dir, log)), lean, None, tables): return None
+	else:
+		log(f'Decompiling {names}...')
+		# Each table is its own iasl process - all of them run at once
+		with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(tables), os.cpu_count() or 1)) as pool:
+			futures = [pool.submit(decompile_table, x, iasl_bin, lean, cache_dir, log) for x in tables]
+		dsls = []
+		for x,future in zip(tables, futures):
+			try:
+				dsls.append(future.result())
+			except subprocess.CalledProcessError:
+				if x['path'] == dsdt: raise
+				log(f'Unable to decompile {x["name"]}, skipping it')
+				x['aml'] = None
+		tables = [x for x in tables if x['aml'] != None]
+		# dsdt.load() - dsl part
+		tables[0]['start'] = 0
+		if len(tables) == 1:
+			dsl = dsls[0] # Left mapped
+		else:
+			dsls = [bytes(x).rstrip(b'\n') + b'\n' for x in dsls]
+			start = 0
+			for x,table in zip(dsls, tables):
+				table['start'] = start
+				start += x.count(b'\n')
+			dsl = b''.join(dsls)
+		if not ctx.load_dsl(dsl, lean, None, tables): return None
+	if key and not state:
+		with profiler.stage('cache_store'):
+			error = store_state(key, ctx, cache_dir)
+		if error: log(error)
+	ctx.cache_key = key
+	return ctx
 
-	global dsdt_scope
-	dsdt_scope = [(line,index) for index,line in enumerate(dsdt_lines) if any(x in line for x in ('Processor (','Scope (','Device (','Method (','Name (')) if not is_hex(line)]
-		
-	#Unfortunately continue statement cannot be used inside a list comprehension for whatever reason...
-	starting_indexes = []
-	for index,scope in enumerate(dsdt_scope):
-		if not scope[0].strip().startswith(('Processor (','Device (','Method (','Name (')): continue
-		# Got a device - add its index
-		starting_indexes.append(index)
+def clear_results(results_folder: str) -> None:
+	# Removes what an earlier run wrote into results_folder - the SSDTs of every generator and the log - and nothing else,
+	# it may well be a folder of the user's
+	os.makedirs(results_folder, exist_ok=True)
+	for name in [f'{x["name"]}{y}' for x in generators for y in ('.dsl', '.aml')] + ['GTools.log']:
+		path = os.path.join(results_folder, name)
+		if os.path.isfile(path): os.remove(path)
 
+def generate_ssdts(ctx: DsdtContext, iasl_bin: str, results_folder: str, jobs: int = None, log: callable = print, emitter: bool = False, crosscheck: bool = False, only: list = None, skip: list = None) -> dict:
+	# Generates and compiles the selected SSDTs into results_folder, returning whether each one succeeded
+	selected = select_generators(only, skip)
+	clear_results(results_folder)
 
-	if not len(starting_indexes): return None
-	global dsdt_paths
-	dsdt_paths = sorted([get_path_starting_at(x) for x in starting_indexes])
+	# The namespace is read-only from here on. The facts the selected generators need are all
+	# started at once, each generator then only waits for its own ones (get_fact() blocks until
+	# a fact being computed is ready).
+	results = {}
+	needs = sorted(set(x for generator in selected for x in generator['needs']))
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs or os.cpu_count() or 1)) as pool:
+		for fact in needs:
+			pool.submit(ctx.get_fact, fact)
+		futures = [pool.submit(run_generator, x['name'], x['func'], ctx, results_folder, emitter, crosscheck) for x in selected]
+		generated = [x.result() for x in futures]
 
-	write_ssdt('SSDT-EC', fake_ec(), iasl_bin, results_folder)
-	write_ssdt('SSDT-PLUG', plugin_type(), iasl_bin, results_folder)
-	write_ssdt('SSDT-PMC', ssdt_pmc(), iasl_bin, results_folder)
-	write_ssdt('SSDT-AWAC', ssdt_awac(), iasl_bin, results_folder)
-	write_ssdt('SSDT-USB-Reset', ssdt_rhub(), iasl_bin, results_folder)
+	# Whatever is left to compile goes through a single iasl run
+	dsl_path = lambda name: os.path.join(results_folder, f'{name}.dsl')
+	with profiler.stage('compile'):
+		errors = compile_ssdts([dsl_path(x['name']) for x,(status,output,aml) in zip(selected, generated) if status == None], iasl_bin)
+	for generator,(status,output,aml) in zip(selected, generated):
+		if status == None:
+			output.append('Compiling...')
+			status = check_compiled_ssdt(generator['name'], errors[dsl_path(generator['name'])], aml, results_folder, output.append)
+		results[generator['name']] = status
+		log('\n'.join(output))
+	return results
 
-	shutil.rmtree(tmp_dir)
-	dsdt_raw_fo.close()
-	dsdt_fo.close()
+def main(args: dict) -> dict or None:
+	results_folder = args.get('results_folder', None) or os.path.join(os.getcwd(), 'SSDTs')
+	select_generators(args.get('only', None), args.get('skip', None)) # Fail on unknown names before decompiling anything
+	ssdts = find_ssdts(os.path.dirname(os.path.abspath(args['dsdt']))) if args.get('ssdts', True) else []
+	ctx = load_context(args['dsdt'], args['iasl_bin'], args.get('native', False), args.get('cache', True), print, None, args.get('lean', True), ssdts, None, args.get('stream', False))
+	if ctx == None: return None
+	return generate_ssdts(ctx, args['iasl_bin'], results_folder, args.get('jobs', None), print, args.get('emitter', False), args.get('crosscheck', False), args.get('only', None), args.get('skip', None))
 
 # The parser is only called if this script is called as a script/executable (via command line) but not when imported by another script
 if __name__=='__main__':
 	parser = argparse.ArgumentParser(description=f'Generates SSDTs starting from a DSDT. Version {version}.', prog='mkssdt.py')
 	parser.add_argument('--dsdt', help='Path of DSDT.aml file', metavar='DSDT.dsl', type=str)
 	parser.add_argument('--iasl-bin', help='Full path of the iasl binary.', metavar='iasl_path', type=str)
+	parser.add_argument('--native', action='store_true', help='Parses the DSDT.aml directly instead of decompiling it with iasl.')
+	parser.add_argument('--full-listing', dest='lean', action='store_false', help='Decompiles the DSDT with its hex listing right away, rather than only when needed.')
+	parser.add_argument('--no-cache', dest='cache', action='store_false', help='Neither reads nor writes the DSDT cache.')
+	parser.add_argument('--jobs', help='How many SSDTs to generate at once. Defaults to the number of CPUs.', metavar='N', type=int)
+	parser.add_argument('--aml-emitter', dest='emitter', action='store_true', help='Builds the SSDTs with the built-in AML emitter, using iasl only for what it doesn\'t support.')
+	parser.add_argument('--aml-crosscheck', dest='crosscheck', action='store_true', help='With --aml-emitter, compiles with iasl as well and reports any difference.')
+	parser.add_argument('--dsdt-only', dest='ssdts', action='store_false', help='Ignores the SSDT*.aml tables next to the DSDT.')
+	parser.add_argument('--stream-decompile', dest='stream', action='store_true', help='Scans the DSDT while iasl decompiles it, through a FIFO rather than a .dsl file.')
+	parser.add_argument('--only', help='Comma separated list of the only SSDTs to generate, e.g. SSDT-PLUG,SSDT-EC.', metavar='SSDTs', type=lambda x: x.split(','))
+	parser.add_argument('--skip', help='Comma separated list of SSDTs not to generate.', metavar='SSDTs', type=lambda x: x.split(','))
 	args = parser.parse_args()
 	main(vars(args))
 	sys.exit(0)
@@ -0,0 +1,216 @@
+'''
+Compares the ACPI namespace of two DSDTs (or two SysReports): added, removed and changed objects and _HIDs,
+and which of the generated SSDTs they affect. Every namespace subtree is hashed, so identical ones are skipped
+as a whole - a BIOS update usually only touches a handful of devices.
+'''
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+try:
+	from modules import analysis, mkssdt, sysreport
+except ImportError: # Called from within modules/
+	import analysis, mkssdt, sysreport
+
+def _digest(*parts) -> bytes:
+	return hashlib.blake2b(b'\0'.join(x if isinstance(x, bytes) else str(x).encode() for x in parts), digest_size=16).digest()
+
+def get_code(ctx: mkssdt.DsdtContext) -> list:
+	# Comment-stripped code of every line, '' for the hex listing ones - decoded once for the whole tree
+	code = [''] * len(ctx.code)
+	for index,line,x in ctx.code.items():
+		code[index] = x.strip()
+	return code
+
+def get_extents(ctx: mkssdt.DsdtContext, code: list) -> list:
+	'''
+	(first, last, entry) of every object - lines of the DSL (last included), or bytes of the AML when parsed natively.
+	Devices, Methods and Processors span up to their closing brace, Names up to their closing parenthesis.
+	'''
+	extents = []
+	for entry in ctx.paths:
+		start = entry[1]
+		if ctx.native:
+			extents.append((start, ctx.native[start]['end'] - 1, entry))
+			continue
+		if entry[2] != 'Name':
+			opening = ctx.next_open[start]
+			extents.append((start, ctx.spans.get(opening, start) if opening != -1 else start, entry))
+			continue
+		# Package () and Buffer () values go on over several lines
+		end, depth = start, 0
+		for end in range(start, len(code)):
+			line = code[end]
+			depth += line.count('(') + line.count('{') - line.count(')') - line.count('}')
+			if depth <= 0: break
+		extents.append((start, end, entry))
+	return sorted(extents, key=lambda x: (x[0], -x[1]))
+
+def get_content(ctx: mkssdt.DsdtContext, code: list, first: int, last: int) -> bytes:
+	# What lies between first and last (included) - comment-stripped code, or raw AML
+	if first > last: return b''
+	if ctx.native: return ctx.raw[first:last+1]
+	return '\n'.join(x for x in code[first:last+1] if x).encode()
+
+def build_tree(ctx: mkssdt.DsdtContext) -> dict:
+	'''
+	Hashes the namespace into {path: {'type', 'own', 'hash', 'children'}}, paths being upper case.
+	own is the hash of the object's own definition (its children left out), hash the one of its whole subtree.
+	Scopes that aren't objects themselves (\\, \\_SB...) are there too, with a None type. size counts the objects beneath.
+	'''
+	code = get_code(ctx) if not ctx.native else None
+	tree = {'\\': {'type': None, 'own': [], 'children': set()}}
+	def node(path: str) -> dict:
+		if path not in tree:
+			parent = path.rsplit('.', 1)[0] if '.' in path else '\\'
+			tree[path] = {'type': None, 'own': [], 'children': set()}
+			node(parent)['children'].add(path)
+		return tree[path]
+	# Own definitions, walking the objects in order: each one's children are cut out of its content
+	stack = [] # [last, entry, parts, cursor] of the objects being walked through
+	def close(item: list) -> None:
+		last, entry, parts, cursor = item
+		parts.append(get_content(ctx, code, cursor, last))
+		target = node(entry[0].upper())
+		target['type'] = entry[2]
+		target['own'].append(_digest(entry[2], *parts))
+	for first, last, entry in get_extents(ctx, code):
+		while stack and stack[-1][0] < first:
+			close(stack.pop())
+		if stack:
+			parent = stack[-1]
+			last = min(last, parent[0])
+			parent[2].append(get_content(ctx, code, parent[3], first - 1))
+			parent[3] = last + 1
+		stack.append([last, entry, [], first])
+	while stack:
+		close(stack.pop())
+	# Then every subtree, deepest first - a path defined more than once (If/Else...) gets all its definitions
+	for path in sorted(tree, key=lambda x: -x.count('.') - (x != '\\')):
+		x = tree[path]
+		x['own'] = x['own'][0] if len(x['own']) == 1 else _digest(*sorted(x['own']))
+		x['hash'] = _digest(x['type'], x['own'], *sorted(f'{y}:{tree[y]["hash"].hex()}' for y in x['children']))
+		x['size'] = sum(1 + tree[y]['size'] for y in x['children'])
+	return tree
+
+def get_hids(ctx: mkssdt.DsdtContext) -> set:
+	# (HID, device path) of every _HID/_CID
+	return set((hid, x[0].upper()) for hid,devices in ctx.get_hid_index().items() for x in devices)
+
+def _normalize(value):
+	# Facts with the line/offset of each object left out, those move whenever anything before them does
+	if isinstance(value, mkssdt.NamespaceEntry): return (value[0], value[2])
+	if isinstance(value, dict): return {x: _normalize(y) for x,y in value.items() if x != 'index'}
+	if isinstance(value, (list, tuple)): return [_normalize(x) for x in value]
+	return value
+
+def get_affected(old: mkssdt.DsdtContext, new: mkssdt.DsdtContext, only: list = None, skip: list = None) -> dict:
+	'''
+	{SSDT: reasons} of the SSDTs that would come out differently - the platform facts they need that changed,
+	and/or their source itself. Generators are cheap next to decompiling, so each one is simply run on both.
+	'''
+	affected = {}
+	for generator in mkssdt.select_generators(only, skip):
+		reasons = [f'fact {x} changed' for x in generator['needs'] if _normalize(old.get_fact(x)) != _normalize(new.get_fact(x))]
+		outputs = []
+		for ctx in (old, new):
+			try:
+				outputs.append(generator['func'](ctx, lambda *x: None))
+			except Exception as e:
+				outputs.append(f'{type(e).__name__}: {e}')
+		if outputs[0] != outputs[1]:
+			reasons.append('not generated anymore' if not outputs[1] else 'newly generated' if not outputs[0] else 'source differs')
+		if reasons: affected[generator['name']] = reasons
+	return affected
+
+def diff(old: mkssdt.DsdtContext, new: mkssdt.DsdtContext, only: list = None, skip: list = None) -> dict:
+	'''
+	Returns {'added', 'removed', 'changed': [{'path', 'type'}], 'hids': {'added', 'removed': [{'hid', 'path'}]}, 'affected': {SSDT: reasons}, 'skipped'}.
+	A whole added/removed subtree is only reported through its topmost objects. skipped counts the objects
+	within identical subtrees, which were never looked at.
+	'''
+	a, b = build_tree(old), build_tree(new)
+	result = {'added': [], 'removed': [], 'changed': [], 'skipped': 0}
+	def tops(tree: dict, path: str, into: list) -> None:
+		# The topmost objects of a subtree - scopes alone don't count
+		if tree[path]['type'] != None: into.append({'path': path, 'type': tree[path]['type']})
+		else:
+			for x in sorted(tree[path]['children']): tops(tree, x, into)
+	pending = ['\\']
+	while pending:
+		path = pending.pop()
+		x, y = a[path], b[path]
+		if x['hash'] == y['hash']:
+			result['skipped'] += x['size'] + (path != '\\')
+			continue
+		if x['own'] != y['own'] or x['type'] != y['type']:
+			result['changed'].append({'path': path, 'type': y['type'] or x['type']})
+		for child in sorted(x['children'] - y['children']): tops(a, child, result['removed'])
+		for child in sorted(y['children'] - x['children']): tops(b, child, result['added'])
+		pending.extend(sorted(x['children'] & y['children'], reverse=True))
+	for key in ('added', 'removed', 'changed'):
+		result[key].sort(key=lambda x: x['path'])
+	hids_a, hids_b = get_hids(old), get_hids(new)
+	result['hids'] = {'added': [{'hid': x, 'path': y} for x,y in sorted(hids_b - hids_a)], 'removed': [{'hid': x, 'path': y} for x,y in sorted(hids_a - hids_b)]}
+	result['affected'] = get_affected(old, new, only, skip)
+	return result
+
+def load(path: str, iasl_bin: str, options: dict) -> mkssdt.DsdtContext:
+	# A DSDT.aml on its own, or a SysReport (folder or archive) along with its SSDTs
+	if os.path.isfile(path) and not sysreport.is_archive(path):
+		ctx = mkssdt.load_context(path, iasl_bin, options.get('native', False), options.get('cache', True), lambda *x: None)
+		if ctx == None: raise ValueError(f'No objects found into {path}')
+		return ctx
+	report = analysis.Analysis(path, iasl_bin, os.devnull, options)
+	try:
+		return report.load()
+	finally:
+		report.close()
+
+def print_diff(result: dict) -> None:
+	for key,sign in (('removed', '-'), ('added', '+'), ('changed', '~')):
+		print(f'\n{key.capitalize()} objects: {len(result[key])}')
+		for x in result[key]:
+			print(f' {sign} {x["path"]} ({x["type"]})')
+	for key,sign in (('removed', '-'), ('added', '+')):
+		print(f'\n{key.capitalize()} _HIDs/_CIDs: {len(result["hids"][key])}')
+		for x in result['hids'][key]:
+			print(f' {sign} {x["hid"]} on {x["path"]}')
+	print(f'\n{result["skipped"]} objects in unchanged subtrees skipped.')
+	print('\nSSDTs to regenerate: ' + (', '.join(result['affected']) if result['affected'] else 'none, the ones generated earlier are still valid'))
+	for x,reasons in result['affected'].items():
+		print(f' - {x}: {", ".join(reasons)}')
+
+def main(argv: list, iasl_dir: str = None) -> int:
+	parser = argparse.ArgumentParser(description='Compares the ACPI namespace of two DSDTs or SysReports, telling which SSDTs need regenerating.', prog='GTools.py diff')
+	parser.add_argument('old', help='DSDT.aml, or SysReport folder/archive, before the change (e.g. a BIOS update).', type=str)
+	parser.add_argument('new', help='DSDT.aml, or SysReport folder/archive, after it.', type=str)
+	parser.add_argument('--json', action='store_true', help='Prints the differences as JSON.')
+	parser.add_argument('--iasl-bin', default='iasl-stable', help='Changes the default used iasl binary.', metavar='iasl_binary', type=str)
+	parser.add_argument('--native-aml', action='store_true', help='Parses the AML directly instead of decompiling it with iasl.')
+	parser.add_argument('--dsdt-only', action='store_true', help='Only looks into DSDT.aml, ignoring the OEM SSDTs of the SysReports.')
+	parser.add_argument('--no-cache', action='store_true', help='Neither reads nor writes the decompiled DSDTs cache.')
+	parser.add_argument('--only', help='Comma separated list of the only SSDTs to check.', metavar='SSDTs', type=lambda x: x.split(','))
+	parser.add_argument('--skip', help='Comma separated list of SSDTs not to check.', metavar='SSDTs', type=lambda x: x.split(','))
+	args = parser.parse_args(argv)
+
+	iasl_bin = args.iasl_bin if os.path.exists(args.iasl_bin) or not iasl_dir else os.path.join(iasl_dir, args.iasl_bin)
+	options = {'native': args.native_aml, 'cache': not args.no_cache, 'ssdts': not args.dsdt_only}
+	try:
+		mkssdt.select_generators(args.only, args.skip)
+		if not args.native_aml and not os.path.exists(iasl_bin):
+			raise FileNotFoundError(f'iasl binary not found: {iasl_bin} (--native-aml doesn\'t need it)')
+		for x in (args.old, args.new):
+			if not os.path.exists(x): raise FileNotFoundError(f'{x} doesn\'t exist')
+		# Both sides are decompiled at once
+		with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+			old, new = [x.result() for x in [pool.submit(load, x, iasl_bin, options) for x in (args.old, args.new)]]
+		result = diff(old, new, args.only, args.skip)
+	except Exception as e:
+		print(json.dumps({'error': str(e)}, indent=2) if args.json else f'Unable to compare: {e}')
+		return 2
+	print(json.dumps(result, indent=2)) if args.json else print_diff(result)
+	# Same as diff(1) - 0 when nothing changed, 1 otherwise
+	return 1 if any(result[x] for x in ('added', 'removed', 'changed')) or any(result['hids'].values()) or result['affected'] else 0
@@ -0,0 +1,150 @@
+'''
+Records where the time of a run goes: wall time, CPU time and peak memory of each stage, and of each subprocess
+launched (iasl). Stages can be printed as a table, exported as a Chrome trace (chrome://tracing, Perfetto),
+and their Python side profiled with cProfile. Nothing is recorded until enable() is called.
+'''
+
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import subprocess
+import sys
+import threading
+import time
+try:
+	import resource
+except ImportError: # Not available on Windows
+	resource = None
+
+enabled = False
+events = []         # Every stage and subprocess recorded so far, see stage() and run()
+profile_stats = None # pstats.Stats gathering every cProfile run, when enabled
+_lock = threading.Lock()
+_local = threading.local()
+
+def enable(cprofile: bool = False) -> None:
+	# Starts recording from scratch - with cProfile on top if asked to
+	global enabled, events, profile_stats
+	enabled, events = True, []
+	profile_stats = pstats.Stats(stream=io.StringIO()) if cprofile else None
+
+def get_peak_rss() -> int or None:
+	# Peak resident set size of this process so far, in bytes - None where it can't be known
+	if resource == None: return None
+	return _to_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+def _to_bytes(maxrss: int) -> int:
+	return maxrss if sys.platform == 'darwin' else maxrss * 1024 # Bytes on macOS, KiB elsewhere
+
+def _record(event: dict) -> None:
+	with _lock:
+		events.append(event)
+
+@contextlib.contextmanager
+def stage(name: str, **args):
+	'''
+	Records the wall time and the CPU time (of the calling thread) spent within, along with the peak memory
+	once done. args are attached to the event - e.g. the table being decompiled. Stages can be nested.
+	'''
+	if not enabled:
+		yield
+		return
+	# Only the outermost stage of each thread is handed to cProfile, which can't be nested
+	depth = getattr(_local, 'depth', 0)
+	profile = cProfile.Profile() if profile_stats != None and depth == 0 else None
+	_local.depth = depth + 1
+	start, cpu = time.perf_counter(), time.thread_time()
+	if profile:
+		try:
+			profile.enable()
+		except ValueError: # Python 3.12+ only allows one at a time, whatever the thread - that one sees every thread anyway
+			profile = None
+	try:
+		yield
+	finally:
+		if profile: profile.disable()
+		_local.depth = depth
+		_record({'name': name, 'cat': 'stage', 'start': start, 'wall': time.perf_counter() - start, 'cpu': time.thread_time() - cpu,
+			'rss': get_peak_rss(), 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+		if profile:
+			with _lock:
+				profile_stats.add(profile)
+
+def start(args: list, capture: bool = False) -> subprocess.Popen:
+	# Launches a subprocess without waiting for it, see wait() - stderr goes along with stdout, captured or discarded
+	process = subprocess.Popen(args, stdout=subprocess.PIPE if capture else subprocess.DEVNULL, stderr=subprocess.STDOUT)
+	process.started = time.perf_counter()
+	return process
+
+def wait(process: subprocess.Popen, name: str = None) -> int:
+	'''
+	Waits for a subprocess launched through start(), returning its return code. Where os.wait4() is available,
+	it reaps the process itself to get its resource usage.
+	'''
+	usage = None
+	if hasattr(os, 'wait4'):
+		pid, status, usage = os.wait4(process.pid, 0)
+		process.returncode = os.waitstatus_to_exitcode(status)
+	else:
+		process.wait()
+	if enabled:
+		_record({'name': name or os.path.basename(process.args[0]), 'cat': 'subprocess', 'start': process.started, 'wall': time.perf_counter() - process.started,
+			'cpu': usage.ru_utime + usage.ru_stime if usage else None, 'rss': _to_bytes(usage.ru_maxrss) if usage else None,
+			'pid': os.getpid(), 'tid': process.pid, 'args': {'args': ' '.join(str(x) for x in process.args), 'returncode': process.returncode}})
+	return process.returncode
+
+def run(args: list, name: str = None, capture: bool = False) -> tuple:
+	'''Runs a subprocess like subprocess.run() does, stderr going along with stdout - returns (return code, output if capture)'''
+	process = start(args, capture)
+	output = process.stdout.read() if capture else b''
+	returncode = wait(process, name)
+	if capture: process.stdout.close()
+	return (returncode, output)
+
+def summarize(recorded: list = None) -> list:
+	# [(category, name, count, wall, cpu, peak rss)] of the recorded events, grouped by name, in order of appearance
+	rows = {}
+	for x in recorded if recorded != None else events:
+		row = rows.setdefault((x['cat'], x['name']), [x['cat'], x['name'], 0, 0, None, None])
+		row[2] += 1
+		row[3] += x['wall']
+		if x['cpu'] != None: row[4] = (row[4] or 0) + x['cpu']
+		if x['rss'] != None: row[5] = max(row[5] or 0, x['rss'])
+	return [tuple(x) for x in rows.values()]
+
+def print_summary(recorded: list = None) -> None:
+	'''Prints the time and memory taken by each stage, then by each subprocess - CPU time of a stage is the one of its own thread'''
+	rows = summarize(recorded)
+	width = max([len(x[1]) for x in rows] + [len('Subprocess')])
+	ms = lambda x: '-' if x == None else f'{x * 1000:.1f} ms'
+	mb = lambda x: '-' if x == None else f'{x / (1024 * 1024):.0f} MB'
+	for cat,title in (('stage', 'Stage'), ('subprocess', 'Subprocess')):
+		print(f'\n{title.ljust(width)}  Count        Wall         CPU  Peak RSS')
+		for x in rows:
+			if x[0] == cat: print(f'{x[1].ljust(width)}  {str(x[2]).rjust(5)}  {ms(x[3]).rjust(10)}  {ms(x[4]).rjust(10)}  {mb(x[5]).rjust(8)}')
+
+def write_trace(path: str, recorded: list = None) -> None:
+	'''
+	Writes the recorded events in the Chrome trace event format - subprocesses get a row of their own, named after their pid.
+	Events may come from several processes (batch workers): their clock is the same system-wide monotonic one.
+	'''
+	recorded = recorded if recorded != None else events
+	base = min((x['start'] for x in recorded), default=0)
+	trace = []
+	for x in recorded:
+		args = dict(x['args'], cpu_ms=None if x['cpu'] == None else round(x['cpu'] * 1000, 3), peak_rss=x['rss'])
+		trace.append({'name': x['name'], 'cat': x['cat'], 'ph': 'X', 'ts': round((x['start'] - base) * 1e6), 'dur': round(x['wall'] * 1e6), 'pid': x['pid'], 'tid': x['tid'], 'args': args})
+	with open(path, 'w') as f:
+		json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+def dump_cprofile(path: str, restrict: str = 'mkssdt', count: int = 20) -> None:
+	'''Writes the gathered cProfile stats (pstats format) and prints the top functions of restrict, by cumulative time'''
+	if profile_stats == None or not profile_stats.stats: return
+	profile_stats.dump_stats(path)
+	stream = io.StringIO()
+	profile_stats.stream = stream
+	profile_stats.sort_stats('cumulative').print_stats(restrict, count)
+	print(stream.getvalue())
@@ -0,0 +1,79 @@
+'''Answers namespace lookups about a SysReport straight out of its cached namespace index, as JSON'''
+
+import argparse
+import json
+import os
+import sys
+import time
+try:
+	from modules import analysis, mkssdt
+except ImportError: # Called from within modules/
+	import analysis, mkssdt
+
+def describe(ctx, entry) -> dict:
+	# JSON friendly view of a NamespaceEntry - index is a line of the decompiled DSL, or a byte offset of the AML when parsed natively
+	return {'path': entry[0], 'type': entry[2], 'table': ctx.get_table(entry[1]), 'offset' if ctx.native else 'line': entry[1]}
+
+def run_query(ctx, path: str = None, obj_type: str = None, hid: str = None, children: str = None) -> dict:
+	'''
+	Looks up, with the same semantics as the SSDT generators:
+	- path: objects whose path ends with it (or is it, if absolute), of obj_type if given, of any type otherwise
+	- hid: devices having it as _HID/_CID
+	- children: objects right under the devices matching it, of obj_type if given
+	Returns {lookup: [objects]} for every lookup asked for.
+	'''
+	results = {}
+	if path != None:
+		types = [obj_type] if obj_type else sorted(ctx.index['type'])
+		results['path'] = [describe(ctx, x) for x in sorted(x for y in types for x in ctx.get_path_of_type(y, path))]
+	if hid != None:
+		results['hid'] = [describe(ctx, x) for x in ctx.get_device_paths_with_hid(hid)]
+	if children != None:
+		devices = [x[0] for x in ctx.get_device_paths(children)] if not children.startswith('\\') else [children]
+		results['children'] = [describe(ctx, x) for device in devices for x in ctx.get_child_paths(device, obj_type)]
+	return results
+
+def query(sr_path: str, iasl_bin: str, options: dict, lookups: dict) -> dict:
+	# Loads the report namespace (from the cache, unless it has never been seen) and runs the lookups on it
+	start = time.perf_counter()
+	report = analysis.Analysis(sr_path, iasl_bin, os.devnull, options)
+	try:
+		ctx = report.load()
+		hids = 'hid' in ctx.index
+		results = run_query(ctx, **lookups)
+		# The _HID index takes a pass over the DSL to build, it's kept for the next queries
+		if not hids and 'hid' in ctx.index and ctx.cache_key:
+			error = mkssdt.store_state(ctx.cache_key, ctx, options.get('cache_dir', None))
+			# stdout only ever gets the JSON
+			if error: print(error, file=sys.stderr)
+		tables = [x['name'] for x in ctx.tables]
+	finally:
+		report.close()
+	return {'report': report.sr_path, 'tables': tables, 'results': results, 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+def main(argv: list, iasl_dir: str = None) -> int:
+	parser = argparse.ArgumentParser(description='Looks objects up in the ACPI namespace of a SysReport, printing them as JSON.', prog='GTools.py query')
+	parser.add_argument('SysReport', help='SysReport folder full path, or a zip/tar archive of it.', type=str)
+	parser.add_argument('--path', help='Objects whose path ends with it, e.g. XHC1 or XHC1._STA - an absolute path only matches itself.', metavar='path', type=str)
+	parser.add_argument('--type', dest='obj_type', help='Only objects of this type (Device, Method, Name, Processor...), for --path and --children.', metavar='type', type=str)
+	parser.add_argument('--hid', help='Devices with this _HID/_CID, e.g. PNP0C09.', metavar='HID', type=str)
+	parser.add_argument('--children', help='Objects right under the devices matching it.', metavar='device', type=str)
+	parser.add_argument('--iasl-bin', default='iasl-stable', help='iasl binary the namespace was decompiled with.', metavar='iasl_binary', type=str)
+	parser.add_argument('--native-aml', action='store_true', help='Parses the AML directly instead of decompiling it with iasl.')
+	parser.add_argument('--dsdt-only', action='store_true', help='Only looks into DSDT.aml, ignoring the OEM SSDTs of the SysReport.')
+	parser.add_argument('--no-cache', action='store_true', help='Neither reads nor writes the decompiled DSDTs cache.')
+	args = parser.parse_args(argv)
+	if args.path == None and args.hid == None and args.children == None:
+		parser.error('at least one of --path, --hid or --children is required')
+
+	iasl_bin = args.iasl_bin if os.path.exists(args.iasl_bin) or not iasl_dir else os.path.join(iasl_dir, args.iasl_bin)
+	options = {'native': args.native_aml, 'cache': not args.no_cache, 'ssdts': not args.dsdt_only}
+	try:
+		if not args.native_aml and not os.path.exists(iasl_bin):
+			raise FileNotFoundError(f'iasl binary not found: {iasl_bin} (--native-aml doesn\'t need it)')
+		result = query(args.SysReport, iasl_bin, options, {'path': args.path, 'obj_type': args.obj_type, 'hid': args.hid, 'children': args.children})
+	except Exception as e:
+		print(json.dumps({'report': os.path.abspath(args.SysReport), 'error': str(e)}, indent=2))
+		return 1
+	print(json.dumps(result, indent=2))
+	return 0
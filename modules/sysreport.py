@@ -0,0 +1,102 @@
+'''Gives access to the files of a SysReport, be it a folder or a zip/tar archive that never gets extracted'''
+
+import os
+import tarfile
+import zipfile
+
+archive_suffixes = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+def is_archive(path: str) -> bool:
+	return path.lower().endswith(archive_suffixes) and os.path.isfile(path)
+
+def get_name(path: str) -> str:
+	# Name of the report, without the archive suffix
+	name = os.path.basename(os.path.normpath(path))
+	for x in archive_suffixes:
+		if name.lower().endswith(x): return name[:-len(x)]
+	return name
+
+class FolderReport:
+	'''
+	A SysReport on disk. Paths are relative to the report root (the folder holding SysReport/), '/' separated.
+	'''
+
+	def __init__(self, path: str) -> None:
+		self.path = os.path.abspath(path)
+
+	def get_path(self, relpath: str) -> str:
+		return os.path.join(self.path, *relpath.split('/')) if relpath else self.path
+
+	def exists(self, relpath: str) -> bool:
+		return os.path.exists(self.get_path(relpath))
+
+	def isfile(self, relpath: str) -> bool:
+		return os.path.isfile(self.get_path(relpath))
+
+	def listdir(self, relpath: str = '') -> list:
+		return os.listdir(self.get_path(relpath))
+
+	def open(self, relpath: str):
+		return open(self.get_path(relpath), 'rb')
+
+	def read(self, relpath: str) -> bytes:
+		with self.open(relpath) as f:
+			return f.read()
+
+	def close(self) -> None:
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.close()
+
+class ArchiveReport(FolderReport):
+	'''
+	A SysReport packed into a zip or tar archive. Only the member list is read upfront - the members
+	themselves are decompressed when asked for, straight into memory.
+	The report may sit at the archive root or within a folder, wherever SysReport/ is.
+	'''
+
+	def __init__(self, path: str) -> None:
+		self.path = os.path.abspath(path)
+		if zipfile.is_zipfile(self.path):
+			self.archive = zipfile.ZipFile(self.path)
+			members = {x.filename.rstrip('/'): x for x in self.archive.infolist() if not x.is_dir()}
+		else:
+			self.archive = tarfile.open(self.path, 'r:*')
+			members = {x.name.rstrip('/'): x for x in self.archive.getmembers() if x.isfile()}
+		members = {x[2:] if x.startswith('./') else x: y for x,y in members.items()}
+		# The report root is whatever comes before the shallowest SysReport/ folder
+		roots = sorted((x[:x.find('/SysReport/') + 1] for x in members if x.startswith('SysReport/') or '/SysReport/' in x), key=lambda x: x.count('/'))
+		root = roots[0] if roots else ''
+		self.members = {x[len(root):]: y for x,y in members.items() if x.startswith(root)}
+		# Archives don't always list folders, they're derived from the members instead
+		self.folders = {''}
+		for x in self.members:
+			parts = x.split('/')
+			self.folders.update('/'.join(parts[:i]) for i in range(1, len(parts)))
+
+	def exists(self, relpath: str) -> bool:
+		return relpath in self.members or relpath in self.folders
+
+	def isfile(self, relpath: str) -> bool:
+		return relpath in self.members
+
+	def listdir(self, relpath: str = '') -> list:
+		if relpath not in self.folders: raise FileNotFoundError(f'No such folder in {self.path}: {relpath}')
+		prefix = f'{relpath}/' if relpath else ''
+		return sorted({x[len(prefix):].split('/')[0] for x in list(self.members) + list(self.folders) if x.startswith(prefix) and x != prefix and x != relpath})
+
+	def open(self, relpath: str):
+		if relpath not in self.members: raise FileNotFoundError(f'No such file in {self.path}: {relpath}')
+		if isinstance(self.archive, zipfile.ZipFile):
+			return self.archive.open(self.members[relpath])
+		return self.archive.extractfile(self.members[relpath])
+
+	def close(self) -> None:
+		self.archive.close()
+
+def open_report(path: str) -> FolderReport:
+	return ArchiveReport(path) if is_archive(path) else FolderReport(path)
@@ -0,0 +1,332 @@
+'''
+Watches a drop directory for SysReports (folders or archives) and processes each one once it's done being written.
+Changes are waited for through inotify on Linux, by polling the directory elsewhere. A report is only picked up
+after staying untouched for a while, then handed to a pool of long-lived workers - iasl identity and caches stay warm
+from one report to the next. Results go into <report>.gtools/ and the status into <report>.gtools.json, next to it.
+'''
+
+import argparse
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import ctypes
+import ctypes.util
+import datetime
+import errno
+import json
+import os
+import queue
+import signal
+import struct
+import sys
+import threading
+import time
+try:
+	from modules import analysis, cache, mkssdt
+except ImportError: # Called from within modules/
+	import analysis, cache, mkssdt
+
+results_suffix = '.gtools'
+partial_suffixes = ('.part', '.partial', '.tmp', '.crdownload', '.download') # Still being downloaded/copied, renamed once done
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, length of the name that follows
+
+class Inotify:
+	'''inotify(7) through ctypes, watching a whole folder tree - folders created within get watched as they appear'''
+	mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+	def __init__(self) -> None:
+		if not sys.platform.startswith('linux'): raise OSError(errno.ENOSYS, 'inotify is Linux only')
+		self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+		self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+		if self.fd < 0: raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+		self.watches = {}
+
+	def add(self, path: str) -> None:
+		if path.endswith(results_suffix): return
+		for root, dirs, files in os.walk(path):
+			# Our own results aren't worth waking up for
+			dirs[:] = [x for x in dirs if not x.endswith(results_suffix)]
+			wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), self.mask)
+			if wd < 0:
+				error = ctypes.get_errno()
+				if error in (errno.ENOENT, errno.ENOTDIR): continue # Gone meanwhile
+				raise OSError(error, f'Unable to watch {root}: {os.strerror(error)}')
+			self.watches[wd] = root
+
+	def read(self) -> list or None:
+		'''Blocks until something changes, returning the paths it happened to - None if events were lost (queue overflow)'''
+		data = os.read(self.fd, 64 * 1024)
+		paths, offset, overflow = [], 0, False
+		while offset < len(data):
+			wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+			name = data[offset+EVENT_HEADER.size:offset+EVENT_HEADER.size+length].rstrip(b'\0')
+			offset += EVENT_HEADER.size + length
+			if mask & IN_Q_OVERFLOW:
+				overflow = True
+				continue
+			if mask & IN_IGNORED:
+				self.watches.pop(wd, None)
+				continue
+			if wd not in self.watches: continue
+			path = os.path.join(self.watches[wd], os.fsdecode(name)) if name else self.watches[wd]
+			if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO): self.add(path)
+			paths.append(path)
+		return None if overflow else paths
+
+	def close(self) -> None:
+		os.close(self.fd)
+
+def is_candidate(path: str) -> bool:
+	# Hidden and partial files, and whatever we wrote ourselves, are never reports
+	name = os.path.basename(path)
+	if name.startswith('.') or name.endswith((results_suffix, f'{results_suffix}.json')) or name.lower().endswith(partial_suffixes): return False
+	return analysis.is_report(path)
+
+def get_signature(path: str) -> tuple or None:
+	'''(files, total size, latest mtime) of a report - it keeps changing for as long as the report is being written'''
+	try:
+		if not os.path.isdir(path):
+			st = os.stat(path)
+			return (1, st.st_size, st.st_mtime_ns)
+		files, size, latest = 0, 0, os.stat(path).st_mtime_ns
+		for root, dirs, names in os.walk(path):
+			latest = max(latest, os.stat(root).st_mtime_ns)
+			for x in names:
+				st = os.stat(os.path.join(root, x))
+				files, size, latest = files + 1, size + st.st_size, max(latest, st.st_mtime_ns)
+		return (files, size, latest)
+	except OSError: # Gone meanwhile
+		return None
+
+def get_results_folder(path: str) -> str:
+	return path + results_suffix
+
+def get_status_path(path: str) -> str:
+	return f'{path}{results_suffix}.json'
+
+def read_status(path: str) -> dict:
+	try:
+		with open(get_status_path(path)) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+def write_status(path: str, **fields) -> dict:
+	# Updates the status of a report - written aside and renamed over, so that it's never seen half written
+	status = dict(read_status(path), **fields)
+	status_path = get_status_path(path)
+	temp = os.path.join(os.path.dirname(status_path), f'.{os.path.basename(status_path)}.{os.getpid()}')
+	with open(temp, 'w') as f:
+		json.dump(status, f, indent=2)
+	os.replace(temp, status_path)
+	return status
+
+def now() -> str:
+	return datetime.datetime.now().isoformat(timespec='seconds')
+
+def warm_up(iasl_bin: str) -> None:
+	# Runs once in each worker, which then handles report after report
+	signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is for the watcher, which lets running reports finish
+	if iasl_bin and os.path.exists(iasl_bin): cache.iasl_identity(iasl_bin)
+
+def process(path: str, iasl_bin: str, options: dict, signature: tuple) -> dict:
+	# Worker side - analyses a single report, keeping its status up to date
+	write_status(path, state='running', started=now(), pid=os.getpid())
+	summary = analysis.process_report(path, iasl_bin, get_results_folder(path), options)
+	write_status(path, state='failed' if summary['error'] else 'done', finished=now(), ssdts=summary['ssdts'], mat=summary['mat'],
+		cfg_lock=summary['cfg_lock'], store=summary['store'], peak_rss=summary['peak_rss'], error=summary['error'])
+	return summary
+
+class Watcher:
+	'''
+	Keeps track of every report of the drop directory:
+	- pending: {path: (signature, since)} changed lately, waiting to settle
+	- ready: [(path, signature)] settled, waiting for a worker - at most twice as many as the workers are handed to the pool at once
+	- running: {future: (path, signature, pool)} handed to the pool
+	- seen: {path: signature} processed already, only picked up again if it changes
+	- failed: paths whose last processing failed
+	A report whose status file says it was processed with the same signature (say, before a restart) isn't processed again.
+	'''
+
+	def __init__(self, drop: str, iasl_bin: str, options: dict, workers: int = None, settle: float = 5, poll_interval: float = 2, polling: bool = False, log: callable = None) -> None:
+		self.drop = os.path.abspath(drop)
+		self.iasl_bin = iasl_bin
+		self.options = options
+		self.workers = workers or os.cpu_count() or 1
+		self.settle = settle
+		self.poll_interval = poll_interval
+		self.log = log or (lambda *x: print(f'[{time.strftime("%H:%M:%S")}]', *x, flush=True))
+		self.pending, self.ready, self.running, self.seen, self.failed = {}, collections.deque(), {}, {}, set()
+		self.events = queue.Queue() # Changed paths (None to rescan everything) and completed futures, see wait()
+		self.inotify = None
+		if not polling:
+			try:
+				self.inotify = Inotify()
+				self.inotify.add(self.drop)
+				threading.Thread(target=self.read_events, daemon=True).start()
+			except OSError as e:
+				self.log(f'inotify unavailable ({e}), polling every {poll_interval}s instead')
+				self.inotify = None
+		self.pool = self.new_pool()
+
+	def new_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+		return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up, initargs=(self.iasl_bin,))
+
+	def read_events(self) -> None:
+		while True:
+			paths = self.inotify.read()
+			for x in paths if paths != None else [None]:
+				self.events.put(x)
+
+	def get_entry(self, path: str) -> str or None:
+		# The drop directory entry a changed path belongs to
+		relpath = os.path.relpath(path, self.drop)
+		if relpath == '.' or relpath.startswith('..'): return None
+		return os.path.join(self.drop, relpath.split(os.sep)[0])
+
+	def scan(self, entries: set = None) -> None:
+		'''Looks again at the given entries of the drop directory (all of them if None), then queues those that settled'''
+		current = time.monotonic()
+		if entries == None:
+			entries = set(os.path.join(self.drop, x) for x in os.listdir(self.drop))
+			# Whatever disappeared is forgotten - it gets processed again if it ever comes back
+			for x in [x for x in list(self.pending) + list(self.seen) if x not in entries]:
+				self.pending.pop(x, None)
+				self.seen.pop(x, None)
+		busy = set(x[0] for x in self.ready) | set(x[0] for x in self.running.values())
+		for path in entries | set(self.pending):
+			if not os.path.exists(path): self.seen.pop(path, None)
+			if path in busy or not is_candidate(path):
+				self.pending.pop(path, None)
+				continue
+			signature = get_signature(path)
+			if signature == None or self.seen.get(path) == signature:
+				self.pending.pop(path, None)
+				continue
+			status = read_status(path)
+			if status.get('state') in ('done', 'failed') and status.get('signature') == list(signature):
+				self.seen[path] = signature
+				continue
+			if path not in self.pending or self.pending[path][0] != signature:
+				self.pending[path] = (signature, current)
+		for path,(signature,since) in list(self.pending.items()):
+			if current - since < self.settle: continue
+			del self.pending[path]
+			self.ready.append((path, signature))
+			write_status(path, report=path, state='queued', signature=list(signature), queued=now(), results=get_results_folder(path), started=None, finished=None, error=None)
+			self.log(f'{os.path.basename(path)}: queued')
+
+	def submit(self) -> None:
+		while self.ready and len(self.running) < self.workers * 2:
+			path, signature = self.ready.popleft()
+			future = self.pool.submit(process, path, self.iasl_bin, self.options, signature)
+			self.running[future] = (path, signature, self.pool)
+			future.add_done_callback(self.events.put)
+
+	def collect(self) -> list:
+		# Returns the reports done with - they may well have changed meanwhile
+		finished = []
+		for future in [x for x in self.running if x.done()]:
+			path, signature, pool = self.running.pop(future)
+			if future.cancelled(): continue # Left queued, for the next run
+			self.seen[path] = signature
+			finished.append(path)
+			try:
+				summary = future.result()
+			except Exception as e: # The worker itself died
+				write_status(path, state='failed', finished=now(), error=str(e))
+				self.failed.add(path)
+				self.log(f'{os.path.basename(path)}: failed - {e}')
+				# Every report of a broken pool fails at once, it only needs replacing once
+				if isinstance(e, concurrent.futures.process.BrokenProcessPool) and pool is self.pool: self.pool = self.new_pool()
+				continue
+			self.failed.add(path) if summary['error'] else self.failed.discard(path)
+			ssdts = ', '.join(summary['ssdts']) or 'no SSDTs'
+			self.log(f'{os.path.basename(path)}: ' + (f'failed - {summary["error"]}' if summary['error'] else f'done, {ssdts}' + (' (result store)' if summary['store'] == 'hit' else '')))
+		return finished
+
+	def wait(self) -> set or None:
+		'''Waits for changes, a settle delay to run out or a report to complete - returns the changed entries, None for all of them'''
+		current = time.monotonic()
+		deadlines = [since + self.settle - current for signature,since in self.pending.values()]
+		timeout = max(0, min(deadlines)) if deadlines else None
+		if self.inotify == None: timeout = self.poll_interval if timeout == None else min(timeout, self.poll_interval)
+		entries, everything = set(), self.inotify == None
+		try:
+			item = self.events.get(timeout=timeout)
+			while True:
+				if item == None: everything = True
+				elif isinstance(item, str) and self.get_entry(item): entries.add(self.get_entry(item))
+				item = self.events.get_nowait()
+		except queue.Empty:
+			pass
+		return None if everything else entries
+
+	def run(self, once: bool = False) -> None:
+		'''Processes reports as they come - with once, only those already there, returning when they're done'''
+		self.log(f'Watching {self.drop} ' + ('through inotify' if self.inotify else f'every {self.poll_interval}s') + f', processing up to {self.workers} at once')
+		try:
+			self.scan()
+			while True:
+				finished = self.collect()
+				if finished: self.scan(set(finished))
+				self.submit()
+				if once and not self.pending and not self.ready and not self.running: break
+				self.scan(self.wait())
+		finally:
+			if self.running: self.log(f'Waiting for {len(self.running)} reports being processed...')
+			self.pool.shutdown(wait=True, cancel_futures=True)
+			self.collect()
+			if self.inotify: self.inotify.close()
+
+def main(argv: list, iasl_dir: str = None) -> int:
+	parser = argparse.ArgumentParser(description='Watches a drop directory, processing the SysReports (folders or archives) put into it.', prog='GTools.py watch')
+	parser.add_argument('folder', help='Drop directory to watch.', type=str)
+	parser.add_argument('--workers', help='How many SysReports to process at once. Defaults to the number of CPUs.', metavar='N', type=int)
+	parser.add_argument('--settle', default=5, help='Seconds a SysReport has to stay untouched before being processed (default: 5).', metavar='seconds', type=float)
+	parser.add_argument('--poll-interval', default=2, help='Seconds between two looks at the folder when polling (default: 2).', metavar='seconds', type=float)
+	parser.add_argument('--polling', action='store_true', help='Polls the folder even where inotify is available.')
+	parser.add_argument('--once', action='store_true', help='Only processes the SysReports already there, then exits - with status 1 if any of them failed.')
+	parser.add_argument('--iasl-bin', default='iasl-stable', help='Changes the default used iasl binary.', metavar='iasl_binary', type=str)
+	parser.add_argument('--native-aml', action='store_true', help='Parses DSDT.aml directly instead of decompiling it with iasl.')
+	parser.add_argument('--stream-decompile', action='store_true', help='Scans DSDT.aml while iasl decompiles it, through a FIFO rather than a .dsl file.')
+	parser.add_argument('--aml-emitter', action='store_true', help='Builds the SSDTs with the built-in AML emitter, using iasl only for what it doesn\'t support.')
+	parser.add_argument('--dsdt-only', action='store_true', help='Only looks into DSDT.aml, ignoring the OEM SSDTs of the SysReports.')
+	parser.add_argument('--no-cache', action='store_true', help='Neither reads nor writes the cache of decompiled DSDTs and generated SSDTs.')
+	parser.add_argument('--only', help='Comma separated list of the only SSDTs to generate.', metavar='SSDTs', type=lambda x: x.split(','))
+	parser.add_argument('--skip', help='Comma separated list of SSDTs not to generate.', metavar='SSDTs', type=lambda x: x.split(','))
+	args = parser.parse_args(argv)
+
+	iasl_bin = args.iasl_bin if os.path.exists(args.iasl_bin) or not iasl_dir else os.path.join(iasl_dir, args.iasl_bin)
+	try:
+		mkssdt.select_generators(args.only, args.skip)
+		if not os.path.exists(iasl_bin):
+			raise FileNotFoundError(f'iasl binary not found: {iasl_bin}')
+		if not os.path.isdir(args.folder):
+			raise FileNotFoundError(f'{args.folder} isn\'t a folder')
+	except (ValueError, FileNotFoundError) as e:
+		print(f'{e}. Exiting.')
+		return 1
+	# Each report already runs in its own process, keep a single SSDT per report at a time
+	options = {'native': args.native_aml, 'cache': not args.no_cache, 'lean': True, 'jobs': 1, 'emitter': args.aml_emitter, 'ssdts': not args.dsdt_only, 'stream': args.stream_decompile, 'only': args.only, 'skip': args.skip}
+	# Stopped the same way by a service manager as by Ctrl+C
+	signal.signal(signal.SIGTERM, signal.default_int_handler)
+	watcher = Watcher(args.folder, iasl_bin, options, args.workers, args.settle, args.poll_interval, args.polling)
+	try:
+		watcher.run(args.once)
+	except KeyboardInterrupt:
+		print('Stopped.')
+	return 1 if args.once and watcher.failed else 0
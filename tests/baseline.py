@@ -0,0 +1,68 @@
+'''
+The namespace lookups as mkssdt first did them - linear scans, and a backward walk over the scope for every object -
+taking the DSL lines rather than module globals. Only there to check the indexed ones against, see test_mkssdt.py
+'''
+
+def is_hex(line: str) -> bool:
+	return ':' in line.split('//')[0]
+
+def get_line(line: str) -> str:
+	line = line.split('//')[0]
+	return line.split(':')[1] if ':' in line else line
+
+def _normalize_types(line: str) -> str:
+	return line.replace('Name','Scope').replace('Processor','Scope').replace('Device','Scope').replace('Method','Scope')
+
+def get_dsdt_scope(dsdt_lines: list) -> list:
+	return [(line,index) for index,line in enumerate(dsdt_lines) if any(x in line for x in ('Processor (','Scope (','Device (','Method (','Name (')) if not is_hex(line)]
+
+def get_path_starting_at(dsdt_scope: list, starting_index: int = 0) -> tuple:
+	pad = None
+	path = []
+	obj_type = next((x for x in ('Processor','Method','Scope','Device','Name') if f'{x} (' in dsdt_scope[starting_index][0]),'Unknown Type')
+	for scope,original_index in dsdt_scope[starting_index::-1]:
+		new_pad = _normalize_types(scope).split('Scope (')[0]
+		if pad == None or new_pad < pad:
+			pad = new_pad
+			obj = _normalize_types(scope).split('Scope (')[1].split(')')[0].split(',')[0]
+			path.append(obj)
+			if obj in ('_SB','_SB_','_PR','_PR_') or obj.startswith(('\\','_SB.','_SB_.','_PR.','_PR_.')): break
+	path = path[::-1]
+	if len(path) and path[0] == '\\': path.pop(0)
+	if any(('^' in x for x in path)):
+		new_path = []
+		for x in path:
+			if x.count('^'):
+				del new_path[-1*x.count('^'):]
+			new_path.append(x.replace('^',''))
+		path = new_path
+	path = '.'.join(path)
+	path = f'\\{path}' if path[0] != '\\' else path
+	return (path, dsdt_scope[starting_index][1], obj_type)
+
+def get_dsdt_paths(dsdt_lines: list) -> list:
+	dsdt_scope = get_dsdt_scope(dsdt_lines)
+	starting_indexes = [index for index,scope in enumerate(dsdt_scope) if scope[0].strip().startswith(('Processor (','Device (','Method (','Name ('))]
+	return sorted([get_path_starting_at(dsdt_scope, x) for x in starting_indexes])
+
+def get_path_of_type(dsdt_paths: list, obj_type: str = 'Device', obj: str = 'HPET') -> list:
+	return sorted([path for path in dsdt_paths if path[2].lower() == obj_type.lower() and path[0].upper().endswith(obj.upper())])
+
+def get_scope(dsdt_lines: list, starting_index: int = 0, add_hex: bool = False, strip_comments: bool = False) -> list:
+	brackets = None
+	scope = []
+	for line in dsdt_lines[starting_index:]:
+		if is_hex(line):
+			if add_hex:
+				scope.append(line)
+			continue
+		line = get_line(line) if strip_comments else line
+		scope.append(line)
+		if brackets == None:
+			if line.count('{'):
+				brackets = line.count('{')
+			continue
+		brackets = brackets + line.count('{') - line.count('}')
+		if brackets <= 0:
+			return scope
+	return scope
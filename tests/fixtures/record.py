@@ -0,0 +1,40 @@
+'''
+Writes the SSDT fixtures the emitter is tested against - the source of every generated SSDT, built out of
+a fixed synthetic DSDT, and the AML iasl compiles it into. Run it again whenever a template changes, e.g.
+python3 tests/fixtures/record.py --iasl-bin utils/iasl/iasl
+'''
+
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'benchmarks'))
+from modules import mkssdt
+import synthetic
+
+fixtures_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ssdt')
+# Smallest synthetic DSDT every generator finds something in
+objects, seed = 100, 2
+
+def get_sources() -> dict:
+	# {SSDT name: source} of every generator, out of the fixture DSDT
+	ctx = mkssdt.DsdtContext()
+	ctx.load_dsl(synthetic.generate_dsl(objects=objects, seed=seed))
+	return {x['name']: x['func'](ctx, lambda *y: None) for x in mkssdt.generators}
+
+if __name__=='__main__':
+	parser = argparse.ArgumentParser(description='Writes the SSDT fixtures the emitter is tested against.', prog='record.py')
+	parser.add_argument('--iasl-bin', help='iasl the AML is compiled with. The AML is left as it is if not given.', metavar='file', type=str)
+	args = parser.parse_args()
+	os.makedirs(fixtures_path, exist_ok=True)
+	paths = []
+	for name, source in get_sources().items():
+		if not source:
+			print(f'{name} not generated, the fixture DSDT needs a look')
+			continue
+		paths.append(os.path.join(fixtures_path, f'{name}.dsl'))
+		with open(paths[-1], 'w') as f:
+			f.write(source)
+	if args.iasl_bin:
+		for x,y in mkssdt.compile_ssdts(paths, os.path.abspath(args.iasl_bin)).items():
+			print(f'{os.path.basename(x)}: {"compiled" if y == None else y}')
@@ -0,0 +1,58 @@
+'''
+Checks the AML the emitter builds for every generated SSDT against what iasl builds out of the same source,
+and the encodings the ACPI specification pins down byte for byte.
+The fixtures are written by tests/fixtures/record.py - e.g. python3 -m pytest tests
+'''
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'))
+from modules import amlemitter, mkssdt
+import record
+
+class TestEmitter(unittest.TestCase):
+	def read_fixture(self, name: str, extension: str) -> bytes or None:
+		path = os.path.join(record.fixtures_path, f'{name}{extension}')
+		if not os.path.exists(path): return None
+		with open(path, 'rb') as f:
+			return f.read()
+
+	def test_sources(self):
+		# The fixtures have to follow the templates, or the AML below says nothing about them
+		for name, source in record.get_sources().items():
+			with self.subTest(ssdt=name):
+				self.assertTrue(source, f'{name} not generated out of the fixture DSDT')
+				self.assertEqual(self.read_fixture(name, '.dsl'), source.encode(), f'{name}.dsl is stale, run tests/fixtures/record.py')
+
+	def test_compile(self):
+		for x in mkssdt.generators:
+			with self.subTest(ssdt=x['name']):
+				dsl, aml = self.read_fixture(x['name'], '.dsl'), self.read_fixture(x['name'], '.aml')
+				self.assertIsNotNone(dsl, f'{x["name"]}.dsl missing, run tests/fixtures/record.py')
+				self.assertIsNotNone(aml, f'{x["name"]}.aml missing, run tests/fixtures/record.py --iasl-bin <iasl>')
+				self.assertTrue(amlemitter.same_aml(amlemitter.compile_dsl(dsl.decode()), aml), f'{x["name"]} differs from what iasl builds')
+
+	def test_pkg_length(self):
+		# Up to 63 bytes fit the lead byte, past that its high bits count the bytes following it - the length counting them all
+		for size, length in ((0, b'\x01'), (62, b'\x3F'), (63, b'\x41\x04'), (0xFFD, b'\x4F\xFF'), (0xFFE, b'\x81\x00\x01'), (0xFFFFC, b'\x8F\xFF\xFF'), (0xFFFFD, b'\xC1\x00\x00\x01')):
+			with self.subTest(size=size):
+				self.assertEqual(amlemitter.pkg_length(bytes(size)), length + bytes(size))
+
+	def test_resource_template(self):
+		# The RTC0 resources of SSDT-AWAC: IO (Decode16) and IRQNoFlags small descriptors, then the end tag
+		aml = amlemitter.compile_dsl('''DefinitionBlock ("", "SSDT", 2, "CORP", "RTC", 0x00000000)
+{
+	Name (_CRS, ResourceTemplate ()
+	{
+		IO (Decode16, 0x0070, 0x0070, 0x01, 0x08, )
+		IRQNoFlags () {8}
+	})
+}''')
+		resources = b'\x47\x01\x70\x00\x70\x00\x01\x08' + b'\x22\x00\x01' + b'\x79\x00'
+		self.assertEqual(aml[36:], b'\x08_CRS' + b'\x11\x10\x0A\x0D' + resources)
+		self.assertEqual(sum(aml) & 0xFF, 0)
+
+if __name__=='__main__':
+	unittest.main()
@@ -0,0 +1,139 @@
+'''
+Walks hand-built AML - encoded here byte by byte, the emitter is left out of it - checking the namespace amlparser gets out of it
+'''
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from modules import amlparser, mkssdt
+import synthetic
+
+stub_iasl = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'stub_iasl.py')
+
+def pkg(body: bytes) -> bytes:
+	# PkgLength followed by body, the length counting its own bytes
+	for count in range(4):
+		total = len(body) + count + 1
+		if not count and total <= 0x3F: return bytes((total,)) + body
+		if count and total < 1 << (4 + 8*count):
+			return bytes(((count << 6) | (total & 0x0F),)) + (total >> 4).to_bytes(count, 'little') + body
+	raise ValueError('Package too long')
+
+def name(path: str) -> bytes:
+	# NameString out of a dotted path, \ and ^ prefixes included
+	prefix = path[:len(path) - len(path.lstrip('\\^'))]
+	segments = [x.ljust(4, '_').encode() for x in path[len(prefix):].split('.') if x]
+	body = segments[0] if len(segments) == 1 else b'\x2E' + b''.join(segments) if len(segments) == 2 else bytes((0x2F, len(segments))) + b''.join(segments)
+	return prefix.encode() + body
+
+def eisa_id(hid: str) -> bytes:
+	vendor = sum((ord(x) - 0x40) << y for x,y in zip(hid[:3], (10, 5, 0)))
+	return b'\x0C' + bytes((vendor >> 8, vendor & 0xFF, int(hid[3:5], 16), int(hid[5:7], 16)))
+
+def string(value: str) -> bytes:
+	return b'\x0D' + value.encode() + b'\x00'
+
+def scope(path: str, *body: bytes) -> bytes:
+	return b'\x10' + pkg(name(path) + b''.join(body))
+
+def device(path: str, *body: bytes) -> bytes:
+	return b'\x5B\x82' + pkg(name(path) + b''.join(body))
+
+def processor(path: str, proc_id: int, *body: bytes) -> bytes:
+	return b'\x5B\x83' + pkg(name(path) + struct.pack('<BIB', proc_id, 0x410, 6) + b''.join(body))
+
+def method(path: str, args: int, *body: bytes) -> bytes:
+	return b'\x14' + pkg(name(path) + bytes((args,)) + b''.join(body))
+
+def name_op(path: str, value: bytes) -> bytes:
+	return b'\x08' + name(path) + value
+
+def package(*elements: bytes) -> bytes:
+	return b'\x12' + pkg(bytes((len(elements),)) + b''.join(elements))
+
+def table(*body: bytes, signature: bytes = b'DSDT') -> bytes:
+	data = b''.join(body)
+	return struct.pack('<4sIBB6s8sI4sI', signature, 36 + len(data), 2, 0, b'GTOOLS', b'PARSER  ', 1, b'INTL', 0x20200925) + data
+
+class TestParser(unittest.TestCase):
+	def test_namespace(self):
+		aml = table(
+			scope('\\_PR', processor('CPU0', 1), processor('CPU1', 2)),
+			scope('\\_SB',
+				device('PCI0',
+					name_op('_HID', eisa_id('PNP0A08')),
+					name_op('_CID', package(eisa_id('PNP0A03'), string('PNP0C02'))),
+					device('LPCB',
+						name_op('_ADR', b'\x0C\x00\x00\x1F\x00'),
+						device('EC0',
+							method('_HID', 0, b'\xA4' + eisa_id('PNP0C09')),
+							method('_STA', 0, b'\xA4\x0A\x0F'))))),
+			scope('\\_SB.PCI0.LPCB', device('^^AWAC', name_op('_HID', string('ACPI000E')))))
+		records = amlparser.parse_aml(aml)
+		self.assertEqual([(x['path'], x['type']) for x in records], [('\\_PR.CPU0', 'Processor'), ('\\_PR.CPU1', 'Processor'),
+			('\\_SB.PCI0', 'Device'), ('\\_SB.PCI0._HID', 'Name'), ('\\_SB.PCI0._CID', 'Name'), ('\\_SB.PCI0.LPCB', 'Device'),
+			('\\_SB.PCI0.LPCB._ADR', 'Name'), ('\\_SB.PCI0.LPCB.EC0', 'Device'), ('\\_SB.PCI0.LPCB.EC0._HID', 'Method'),
+			('\\_SB.PCI0.LPCB.EC0._STA', 'Method'), ('\\_SB.AWAC', 'Device'), ('\\_SB.AWAC._HID', 'Name')])
+		hids = {x['path']: x['hid'] for x in records if x['hid']}
+		self.assertEqual(hids, {'\\_SB.PCI0': ['PNP0A08', 'PNP0A03', 'PNP0C02'], '\\_SB.PCI0.LPCB.EC0': ['PNP0C09'], '\\_SB.AWAC': ['ACPI000E']})
+		adr = next(x for x in records if x['path'] == '\\_SB.PCI0.LPCB._ADR')
+		self.assertEqual(adr['value'], (0x001F0000, 0x0C))
+		# Objects span their own bytes
+		ec = next(x for x in records if x['path'] == '\\_SB.PCI0.LPCB.EC0')
+		self.assertEqual(aml[ec['start']:ec['start']+2], b'\x5B\x82')
+		self.assertIn(b'_STA', aml[ec['start']:ec['end']])
+
+	def test_forward_method(self):
+		# FOO is called before its definition - only the second walk knows it takes two arguments
+		aml = table(scope('\\_SB',
+			device('DEV1', b'\xA0' + pkg(name('FOO') + b'\x01\x01' + name_op('BAR', b'\x01'))),
+			device('DEV2'),
+			method('FOO', 2, b'\xA4\x68')))
+		errors = []
+		paths = [x['path'] for x in amlparser.parse_aml(aml, errors)]
+		self.assertEqual(errors, [])
+		self.assertEqual(paths, ['\\_SB.DEV1', '\\_SB.DEV1.BAR', '\\_SB.DEV2', '\\_SB.FOO'])
+
+	def test_errors(self):
+		# A block that can't be walked is skipped and recorded, the rest of the table still gets walked
+		aml = table(scope('\\_SB', device('BAD', name_op('_ADR', b'\x00'), b'\x02\x02'), device('GOOD')))
+		errors = []
+		paths = [x['path'] for x in amlparser.parse_aml(aml, errors)]
+		self.assertEqual(paths, ['\\_SB.BAD', '\\_SB.BAD._ADR', '\\_SB.GOOD'])
+		self.assertEqual([(x['scope'], x['offset']) for x in errors], [('\\_SB.BAD', aml.index(b'\x02\x02'))])
+		# Not so if it's the table's own block
+		with self.assertRaises(amlparser.AmlError):
+			amlparser.parse_aml(table(device('DEV1'), b'\x02', device('DEV2')))
+
+	def test_load_aml(self):
+		output = []
+		ctx = mkssdt.DsdtContext()
+		self.assertTrue(ctx.load_aml(table(scope('\\_SB', device('BAD', b'\x02'), device('GOOD'))), output.append))
+		self.assertEqual([x[0] for x in ctx.paths], ['\\_SB.BAD', '\\_SB.GOOD'])
+		self.assertEqual(len(output), 1)
+		self.assertIn('\\_SB.BAD', output[0])
+
+	def test_fallback(self):
+		# Whatever the walker can't parse gets decompiled instead - the stub iasl turns these tables back into their DSL
+		folder = tempfile.mkdtemp()
+		try:
+			path = os.path.join(folder, 'DSDT.aml')
+			with open(path, 'wb') as f:
+				f.write(synthetic.wrap_aml(synthetic.generate_dsl(objects=100)))
+			output = []
+			ctx = mkssdt.load_context(path, stub_iasl, native=True, use_cache=False, log=output.append)
+			self.assertIsNotNone(ctx)
+			self.assertFalse(ctx.native)
+			self.assertTrue(ctx.get_device_paths('LPCB'))
+			self.assertIn('Decompiling it with iasl instead...', output)
+			self.assertIsNone(mkssdt.load_context(path, os.path.join(folder, 'iasl'), native=True, use_cache=False, log=output.append))
+		finally:
+			shutil.rmtree(folder)
+
+if __name__=='__main__':
+	unittest.main()
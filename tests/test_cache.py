@@ -0,0 +1,56 @@
+'''Checks the cache entries get written, evicted past the size limit, and that write errors are handed back rather than printed'''
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import cache
+
+class TestCache(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.cache_dir = os.path.join(self.folder, 'cache')
+		self.max_cache_size, self.get_entries = cache.max_cache_size, cache.get_entries
+		self.scans = 0
+		def get_entries(*args):
+			self.scans += 1
+			return self.get_entries(*args)
+		cache.get_entries = get_entries
+
+	def tearDown(self):
+		cache.max_cache_size, cache.get_entries = self.max_cache_size, self.get_entries
+		cache.clear(self.cache_dir)
+		shutil.rmtree(self.folder)
+
+	def test_store(self):
+		self.assertIsNone(cache.store('a', {'dsl': b'x'}, self.cache_dir))
+		self.assertEqual(cache.load('a', self.cache_dir), {'dsl': b'x'})
+
+	def test_error(self):
+		# A file where the folder should be - nothing printed, the error comes back instead
+		with open(os.path.join(self.folder, 'file'), 'w') as f:
+			f.write('')
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			error = cache.store('a', {'dsl': b'x'}, os.path.join(self.folder, 'file'))
+		self.assertTrue(error.startswith('Unable to write the cache entry'))
+		self.assertEqual(output.getvalue(), '')
+
+	def test_evict(self):
+		cache.max_cache_size = 4096
+		for i in range(8):
+			self.assertIsNone(cache.store(f'{i}', {'dsl': bytes(1000)}, self.cache_dir))
+			os.utime(os.path.join(self.cache_dir, f'{i}'), (i, i))
+		# Looked through once to begin with, then only when past the limit
+		self.assertLess(self.scans, 8)
+		entries = sorted(os.listdir(self.cache_dir))
+		self.assertLessEqual(sum(x[1] for x in self.get_entries(self.cache_dir)), 4096)
+		self.assertIn('7', entries)
+		self.assertNotIn('0', entries)
+
+if __name__=='__main__':
+	unittest.main()
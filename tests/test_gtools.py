@@ -0,0 +1,35 @@
+'''Checks a SysReport named like a subcommand gets processed as a SysReport'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import GTools
+
+class TestSubcommand(unittest.TestCase):
+	def setUp(self):
+		self.cwd = os.getcwd()
+		self.folder = tempfile.mkdtemp()
+		os.chdir(self.folder)
+
+	def tearDown(self):
+		os.chdir(self.cwd)
+		shutil.rmtree(self.folder)
+
+	def test_subcommand(self):
+		for name in ('query', 'diff', 'watch'):
+			self.assertEqual(GTools.get_subcommand(['GTools.py', name, 'SysReport']), name)
+		self.assertIsNone(GTools.get_subcommand(['GTools.py']))
+		self.assertIsNone(GTools.get_subcommand(['GTools.py', 'SysReport']))
+
+	def test_sysreport(self):
+		os.mkdir('query')
+		open('diff', 'w').close()
+		self.assertIsNone(GTools.get_subcommand(['GTools.py', 'query']))
+		self.assertIsNone(GTools.get_subcommand(['GTools.py', 'diff', '--batch']))
+		self.assertEqual(GTools.get_subcommand(['GTools.py', 'watch', 'query']), 'watch')
+
+if __name__=='__main__':
+	unittest.main()
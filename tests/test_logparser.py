@@ -0,0 +1,62 @@
+'''Checks every fact comes out of a single pass over the OpenCore log, mapped or read whole, the last match winning'''
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import logparser
+
+log = b'''00:000 00:000 OC: OpenCore DBG-090-2023-03-06 is loading in Optional mode (0/0)...
+00:120 00:010 OCABC: MAT support is 1
+00:130 00:010 OCCPU: EIST CFG Lock 1
+00:200 00:070 OCSMB: Current SMBIOS: Acidanthera model iMac20,1
+00:210 00:010 OC: Loading Apple Secure Boot with Disabled (level 1)
+05:000 04:790 OCB: Should boot from 1. macOS Ventura (T:2|F:0|G:0|E:0|DEF:0)
+07:000 02:000 OCABC: MAT support is 0
+07:100 00:100 OCB: Should boot from 3. Windows (T:1|F:0|G:0|E:0|DEF:0)
+'''
+
+expected = {'mat': '0', 'cfg_lock': '1', 'oc_version': 'DBG-090-2023-03-06', 'smbios': 'iMac20,1', 'secureboot': 'Disabled', 'booted_os': 'Windows'}
+
+class TestLogParser(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.path = os.path.join(self.folder, 'opencore-2023-03-06-000000.txt')
+		with open(self.path, 'wb') as f:
+			f.write(log)
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_mapped(self):
+		# Opened by name, the log gets mapped
+		self.assertEqual(logparser.scan_log(self.path), expected)
+
+	def test_read(self):
+		# An archive member has no file of its own, it gets read whole
+		archive = os.path.join(self.folder, 'SysReport.zip')
+		with zipfile.ZipFile(archive, 'w') as f:
+			f.write(self.path, 'SysReport/opencore.txt')
+		with zipfile.ZipFile(archive) as f, f.open('SysReport/opencore.txt') as member:
+			self.assertEqual(logparser.scan_log(member), expected)
+		self.assertEqual(logparser.scan_log(io.BytesIO(log)), expected)
+
+	def test_some_facts(self):
+		self.assertEqual(logparser.scan_log(self.path, ['cfg_lock', 'mat']), {'cfg_lock': '1', 'mat': '0'})
+		self.assertFalse(logparser.get_mat_support_status(self.path))
+		self.assertTrue(logparser.cfg_lock_status(self.path))
+
+	def test_missing(self):
+		with open(self.path, 'wb') as f:
+			f.write(b'00:000 00:000 OCABC: MAT support is 1\n')
+		self.assertEqual(logparser.scan_log(self.path), dict(dict.fromkeys(expected), mat='1'))
+		# Empty files can't be mapped
+		open(self.path, 'wb').close()
+		self.assertEqual(logparser.scan_log(self.path), dict.fromkeys(expected))
+
+if __name__=='__main__':
+	unittest.main()
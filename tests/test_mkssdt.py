@@ -0,0 +1,194 @@
+'''
+Checks the indexed namespace lookups of mkssdt against the linear scans and backward walks they replace (see baseline.py),
+on synthetic DSDTs - caret paths, \\_SB/\\_PR scopes, several tables merged into one DSL, with and without the hex listing
+'''
+
+import mmap
+import os
+import sys
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from modules import cache, mkssdt
+import baseline
+import synthetic
+
+# An OEM SSDT as iasl decompiles it, reaching into the DSDT through absolute paths
+ssdt = '''/*
+ * Intel ACPI Component Architecture
+ */
+DefinitionBlock ("", "SSDT", 2, "GTOOLS", "CpuSsdt", 0x00003000)
+{
+    External (_SB_.PCI0.LPCB, DeviceObj)
+    Scope (\\_PR)
+    {
+        Processor (CPU8, 0x09, 0x00000410, 0x06) {}
+        Method (CPPC, 0, NotSerialized)
+        {
+            Return (Zero)
+        }
+    }
+    Scope (\\_SB.PCI0.LPCB)
+    {
+        Device (EC0)
+        {
+            Name (_HID, EisaId ("PNP0C09") /* Embedded Controller Device */)  // _HID: Hardware ID
+            Method (_STA, 0, NotSerialized)  // _STA: Status
+            {
+                Return (0x0F)
+            }
+            Device (^^SBUS)
+            {
+                Name (_ADR, 0x001F0003)  // _ADR: Address
+            }
+            Scope (\\_GPE)
+            {
+                Method (_L6F, 0, NotSerialized)  // _Lxx: Level-Triggered GPE
+                {
+                    Notify (\\_SB.PCI0.LPCB.EC0, 0x80) // Status Change
+                }
+            }
+        }
+    }
+    Scope (\\)
+    {
+        Name (OSYS, 0x07DF)
+    }
+    Scope (_SB_.PCI0)
+    {
+        Name (^GPRW, One)
+    }
+}
+'''
+
+queries = [('Device', ''), ('Device', 'RHUB'), ('Device', '.LPCB'), ('Device', 'EC0'), ('Device', '\\_SB.PCI0.XHC1'),
+	('Device', '\\_SB_.PCI0.SBUS'), ('Device', 'PCI0.LPCB.EC0'), ('Method', '_STA'), ('Method', 'CPPC'), ('Method', 'TA'),
+	('Name', '_ADR'), ('Name', 'OSYS'), ('Name', '\\GPRW'), ('Name', '_SB.GPRW'), ('Processor', ''), ('Processor', 'CPU0'), ('Scope', '_SB')]
+
+class TestNamespace(unittest.TestCase):
+	def get_dsls(self):
+		# (description, DSL, tables, listing) of every case, tables being None for a lone DSDT
+		for seed in range(4):
+			for listing in (False, True):
+				dsdt = synthetic.generate_dsl(objects=300, seed=seed, listing=listing)
+				yield (f'seed {seed}' + (', listing' if listing else ''), dsdt, None, listing)
+				other = synthetic.add_listing(ssdt) if listing else ssdt
+				start = dsdt.rstrip('\n').count('\n') + 1
+				yield (f'seed {seed}, merged' + (', listing' if listing else ''), dsdt.rstrip('\n') + '\n' + other, [{'name': 'DSDT.aml', 'start': 0, 'aml': None}, {'name': 'SSDT-1.aml', 'start': start, 'aml': None}], listing)
+
+	def get_context(self, dsl: str, tables: list, listing: bool = False) -> mkssdt.DsdtContext:
+		ctx = mkssdt.DsdtContext()
+		self.assertTrue(ctx.load_dsl(dsl, lean=not listing, tables=tables))
+		return ctx
+
+	def test_paths(self):
+		for name, dsl, tables, listing in self.get_dsls():
+			with self.subTest(dsl=name):
+				ctx = self.get_context(dsl, tables, listing)
+				paths = baseline.get_dsdt_paths(dsl.split('\n'))
+				self.assertEqual([tuple(x) for x in ctx.paths], paths)
+				# Walking backwards from any object still gives what the single pass did
+				dsdt_scope = baseline.get_dsdt_scope(dsl.split('\n'))
+				objects = [i for i,x in enumerate(dsdt_scope) if x[0].strip().startswith(('Processor (','Device (','Method (','Name ('))]
+				for i in objects[::7]:
+					self.assertEqual(ctx.get_path_starting_at(i), baseline.get_path_starting_at(dsdt_scope, i))
+
+	def test_carets_and_absolute_scopes(self):
+		ctx = self.get_context(ssdt, None)
+		paths = {x[0] for x in ctx.paths}
+		self.assertLessEqual({'\\_PR.CPU8', '\\_PR.CPPC', '\\_SB.PCI0.LPCB.EC0', '\\_SB.PCI0.LPCB.EC0._HID', '\\_GPE._L6F', '\\OSYS'}, paths)
+		self.assertEqual(sorted(paths), [x[0] for x in baseline.get_dsdt_paths(ssdt.split('\n'))])
+
+	def test_path_of_type(self):
+		for name, dsl, tables, listing in self.get_dsls():
+			ctx = self.get_context(dsl, tables, listing)
+			paths = baseline.get_dsdt_paths(dsl.split('\n'))
+			# Every object looked up by its own name and full path as well
+			for obj_type, obj in queries + [(x[2], x[0].split('.')[-1]) for x in paths[::11]] + [(x[2], x[0]) for x in paths[::13]]:
+				with self.subTest(dsl=name, obj_type=obj_type, obj=obj):
+					self.assertEqual([tuple(x) for x in ctx.get_path_of_type(obj_type, obj)], baseline.get_path_of_type(paths, obj_type, obj))
+
+	def test_scope(self):
+		for name, dsl, tables, listing in self.get_dsls():
+			ctx = self.get_context(dsl, tables, listing)
+			lines = dsl.split('\n')
+			starts = [x[1] for x in ctx.paths][::5] + [0, len(lines)-1]
+			for add_hex in (False, True) if listing else (False,):
+				for strip_comments in (False, True):
+					with self.subTest(dsl=name, add_hex=add_hex, strip_comments=strip_comments):
+						for x in starts:
+							self.assertEqual(ctx.get_scope(x, add_hex, strip_comments), baseline.get_scope(lines, x, add_hex, strip_comments))
+
+class TestHidIndex(unittest.TestCase):
+	def test_method_hid(self):
+		# Strings after a Method (_HID) body belong to no _HID, and a _CID right after it is a definition of its own
+		dsl = '''DefinitionBlock ("", "DSDT", 2, "GTOOLS", "HID", 0x00000001)
+{
+    Scope (_SB)
+    {
+        Device (DEV1)
+        {
+            Method (_HID, 0, NotSerialized)  // _HID: Hardware ID
+            {
+                If (OSYS)
+                {
+                    Return ("ACPI000E")
+                }
+                Return (EisaId ("PNP0C09") /* Embedded Controller Device */)
+            }
+            Name (_UID, "SOMEUID")  // _UID: Unique ID
+            Name (_STR, Unicode ("Some device"))  // _STR: Description String
+            Name (_CID, "PNP0C02")  // _CID: Compatible ID
+        }
+        Device (DEV2)
+        {
+            Method (_HID, 0, NotSerialized) { Return ("ACPI0007") }
+            Name (_DDN, "SOMEDDN")  // _DDN: DOS Device Name
+        }
+        Device (DEV3)
+        {
+            Name (_HID, "INT33A1")  // _HID: Hardware ID
+            Name (_UID, "OTHERUID")  // _UID: Unique ID
+        }
+    }
+}
+'''
+		ctx = mkssdt.DsdtContext()
+		self.assertTrue(ctx.load_dsl(dsl, lean=True))
+		hids = {x: [y[0] for y in z] for x,z in ctx.get_hid_index().items()}
+		self.assertEqual(hids, {'ACPI000E': ['\\_SB.DEV1'], 'PNP0C09': ['\\_SB.DEV1'], 'PNP0C02': ['\\_SB.DEV1'],
+			'ACPI0007': ['\\_SB.DEV2'], 'INT33A1': ['\\_SB.DEV3']})
+
+class TestState(unittest.TestCase):
+	def test_store(self):
+		# The DSL goes next to the pickle rather than into it, and comes back mapped
+		folder = tempfile.mkdtemp()
+		try:
+			path = os.path.join(folder, 'DSDT.dsl')
+			with open(path, 'wb') as f:
+				f.write(synthetic.generate_dsl(objects=300).encode())
+			with open(path, 'rb') as f:
+				dsl = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			ctx = mkssdt.DsdtContext()
+			self.assertTrue(ctx.load_dsl(dsl, lean=True))
+			self.assertIsNone(mkssdt.store_state('key', ctx, folder))
+			with open(os.path.join(folder, 'key', 'namespace.pickle'), 'rb') as f:
+				self.assertNotIn(b'Synthetic DSDT', f.read())
+			state = mkssdt.load_state('key', folder)
+			self.assertIsInstance(state['lines'].data, mmap.mmap)
+			self.assertIs(state['code'].lines, state['lines'])
+			loaded = mkssdt.DsdtContext()
+			loaded.set_state(state)
+			self.assertEqual(list(loaded.lines), list(ctx.lines))
+			self.assertEqual(loaded.paths, ctx.paths)
+			self.assertEqual(loaded.get_scope(ctx.get_device_paths('LPCB')[0][1]), ctx.get_scope(ctx.get_device_paths('LPCB')[0][1]))
+			# Gone along with its DSL
+			os.remove(os.path.join(folder, 'key', 'namespace.dsl'))
+			self.assertIsNone(mkssdt.load_state('key', folder))
+		finally:
+			cache.clear(folder)
+
+if __name__=='__main__':
+	unittest.main()
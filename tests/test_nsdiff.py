@@ -0,0 +1,91 @@
+'''Checks nsdiff reports the added, removed and changed objects and _HIDs, skipping the subtrees left as they were'''
+
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import mkssdt, nsdiff
+
+old = '''DefinitionBlock ("", "DSDT", 2, "GTOOLS", "DIFF", 0x00000001)
+{
+    Scope (_SB)
+    {
+        Device (PCI0)
+        {
+            Name (_HID, EisaId ("PNP0A08") /* PCI Express Bus */)  // _HID: Hardware ID
+            Device (LPCB)
+            {
+                Name (_ADR, 0x001F0000)  // _ADR: Address
+                Device (EC0)
+                {
+                    Name (_HID, EisaId ("PNP0C09") /* Embedded Controller Device */)  // _HID: Hardware ID
+                    Method (_STA, 0, NotSerialized)  // _STA: Status
+                    {
+                        Return (0x0F)
+                    }
+                }
+                Device (TIMR)
+                {
+                    Name (_HID, EisaId ("PNP0100") /* PC-class System Timer */)  // _HID: Hardware ID
+                }
+            }
+            Device (XHC1)
+            {
+                Name (_ADR, 0x00140000)  // _ADR: Address
+                Device (RHUB)
+                {
+                    Name (_ADR, Zero)  // _ADR: Address
+                }
+            }
+        }
+    }
+}
+'''
+
+# The BIOS update: TIMR swapped for AWAC, a different EC0._STA
+new = old.replace('Return (0x0F)', 'Return (0x0B)').replace('''                Device (TIMR)
+                {
+                    Name (_HID, EisaId ("PNP0100") /* PC-class System Timer */)  // _HID: Hardware ID
+                }
+''', '''                Device (AWAC)
+                {
+                    Name (_HID, "ACPI000E")  // _HID: Hardware ID
+                }
+''')
+
+class TestDiff(unittest.TestCase):
+	def get_context(self, dsl: str) -> mkssdt.DsdtContext:
+		ctx = mkssdt.DsdtContext()
+		self.assertTrue(ctx.load_dsl(dsl, lean=True))
+		return ctx
+
+	def test_diff(self):
+		result = nsdiff.diff(self.get_context(old), self.get_context(new))
+		# Only the topmost object of an added/removed subtree, and EC0 itself didn't change, its _STA did
+		self.assertEqual(result['added'], [{'path': '\\_SB.PCI0.LPCB.AWAC', 'type': 'Device'}])
+		self.assertEqual(result['removed'], [{'path': '\\_SB.PCI0.LPCB.TIMR', 'type': 'Device'}])
+		self.assertEqual(result['changed'], [{'path': '\\_SB.PCI0.LPCB.EC0._STA', 'type': 'Method'}])
+		self.assertEqual(result['hids'], {'added': [{'hid': 'ACPI000E', 'path': '\\_SB.PCI0.LPCB.AWAC'}], 'removed': [{'hid': 'PNP0100', 'path': '\\_SB.PCI0.LPCB.TIMR'}]})
+		self.assertIn('SSDT-AWAC', result['affected'])
+
+	def test_skipped(self):
+		# PCI0._HID, LPCB._ADR, EC0._HID and the whole of XHC1 (XHC1, its _ADR, RHUB and its _ADR) are never looked into
+		tree = nsdiff.build_tree(self.get_context(old))
+		self.assertEqual(tree['\\_SB.PCI0.XHC1']['size'], 3)
+		self.assertEqual(nsdiff.diff(self.get_context(old), self.get_context(new))['skipped'], 7)
+		# Nor is anything when both are the same
+		result = nsdiff.diff(self.get_context(old), self.get_context(old))
+		self.assertEqual((result['added'], result['removed'], result['changed'], result['affected']), ([], [], [], {}))
+		self.assertEqual(result['skipped'], len(tree) - 1)
+
+	def test_hashes(self):
+		# A change shows in the hash of every subtree above it, but only in the own hash of its object
+		a, b = nsdiff.build_tree(self.get_context(old)), nsdiff.build_tree(self.get_context(new))
+		for path in ('\\', '\\_SB', '\\_SB.PCI0', '\\_SB.PCI0.LPCB', '\\_SB.PCI0.LPCB.EC0', '\\_SB.PCI0.LPCB.EC0._STA'):
+			self.assertNotEqual(a[path]['hash'], b[path]['hash'])
+		self.assertEqual(a['\\_SB.PCI0.LPCB.EC0']['own'], b['\\_SB.PCI0.LPCB.EC0']['own'])
+		self.assertNotEqual(a['\\_SB.PCI0.LPCB.EC0._STA']['own'], b['\\_SB.PCI0.LPCB.EC0._STA']['own'])
+		self.assertEqual(a['\\_SB.PCI0.XHC1']['hash'], b['\\_SB.PCI0.XHC1']['hash'])
+
+if __name__=='__main__':
+	unittest.main()
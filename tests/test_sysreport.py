@@ -0,0 +1,95 @@
+'''Checks archived SysReports read the same as extracted ones, wherever the report sits within the archive'''
+
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import sysreport
+
+files = {'SysReport/ACPI/DSDT.aml': b'DSDT', 'SysReport/ACPI/SSDT-1.aml': b'SSDT', 'SysReport/SysLog/opencore-2023.txt': b'OC: log\n', 'SysReport/Config/config.plist': b'<plist/>', 'notes.txt': b'notes'}
+
+class TestSysReport(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.report = os.path.join(self.folder, 'Report')
+		for x,data in files.items():
+			path = os.path.join(self.report, *x.split('/'))
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			with open(path, 'wb') as f:
+				f.write(data)
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def pack(self, name: str, prefix: str, folders: bool = False) -> str:
+		# Every file of the report under prefix, along with its folders if asked for
+		path = os.path.join(self.folder, name)
+		if name.endswith('.zip'):
+			with zipfile.ZipFile(path, 'w') as f:
+				if folders:
+					for x in sorted({'/'.join(x.split('/')[:i]) for x in files for i in range(1, x.count('/') + 1)}):
+						f.writestr(f'{prefix}{x}/', b'')
+				for x,data in files.items():
+					f.writestr(prefix + x, data)
+		else:
+			with tarfile.open(path, 'w:gz' if name.endswith('.gz') else 'w') as f:
+				f.add(self.report, prefix.rstrip('/') or '.')
+		return path
+
+	def check(self, report: sysreport.FolderReport) -> None:
+		folder = sysreport.FolderReport(self.report)
+		for relpath in ('', 'SysReport', 'SysReport/ACPI', 'SysReport/SysLog'):
+			self.assertEqual(sorted(report.listdir(relpath)), sorted(folder.listdir(relpath)))
+		for x,data in files.items():
+			self.assertTrue(report.isfile(x))
+			self.assertEqual(report.read(x), data)
+		self.assertTrue(report.exists('SysReport/ACPI'))
+		self.assertFalse(report.isfile('SysReport/ACPI'))
+		self.assertFalse(report.exists('SysReport/ACPI/DSDT.dsl'))
+		with self.assertRaises(FileNotFoundError):
+			report.listdir('SysReport/Missing')
+		with self.assertRaises(FileNotFoundError):
+			report.read('SysReport/ACPI/DSDT.dsl')
+
+	def test_folder(self):
+		with sysreport.open_report(self.report) as report:
+			self.assertNotIsInstance(report, sysreport.ArchiveReport)
+			self.assertEqual(report.read('SysReport/ACPI/DSDT.aml'), b'DSDT')
+
+	def test_zip(self):
+		for name, prefix, folders in (('Root.zip', '', False), ('Nested.zip', 'Report/', True), ('Deep.ZIP', 'a/b/Report/', False)):
+			with self.subTest(archive=name), sysreport.open_report(self.pack(name, prefix, folders)) as report:
+				self.assertIsInstance(report, sysreport.ArchiveReport)
+				self.check(report)
+
+	def test_tar(self):
+		# tar adds ./ in front of every member when packing the current folder
+		for name, prefix in (('Root.tar', ''), ('Nested.tar.gz', 'Report/')):
+			with self.subTest(archive=name), sysreport.open_report(self.pack(name, prefix)) as report:
+				self.assertIsInstance(report, sysreport.ArchiveReport)
+				self.check(report)
+
+	def test_root(self):
+		# The shallowest SysReport/ is the report, whatever else the archive holds
+		path = os.path.join(self.folder, 'Extra.zip')
+		with zipfile.ZipFile(path, 'w') as f:
+			f.writestr('Report/Backup/Old/SysReport/ACPI/DSDT.aml', b'OLD')
+			for x,data in files.items():
+				f.writestr('Report/' + x, data)
+		with sysreport.open_report(path) as report:
+			self.assertEqual(report.read('SysReport/ACPI/DSDT.aml'), b'DSDT')
+			self.assertEqual(report.listdir(), ['Backup', 'SysReport', 'notes.txt'])
+
+	def test_names(self):
+		archive = self.pack('Report.tar.gz', '')
+		self.assertTrue(sysreport.is_archive(archive))
+		self.assertFalse(sysreport.is_archive(self.report))
+		self.assertFalse(sysreport.is_archive(os.path.join(self.folder, 'Missing.zip')))
+		self.assertEqual([sysreport.get_name(x) for x in (archive, self.report + os.sep, 'Report.TGZ', 'Report.v2')], ['Report', 'Report', 'Report', 'Report.v2'])
+
+if __name__=='__main__':
+	unittest.main()
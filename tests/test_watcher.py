@@ -0,0 +1,127 @@
+'''Checks the watcher waits for reports to settle, keeps their status files, and what watch --once exits with'''
+
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from modules import watcher
+import synthetic
+
+stub_iasl = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'stub_iasl.py')
+
+class TestWatcher(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.drop = os.path.join(self.folder, 'drop')
+		os.mkdir(self.drop)
+		self.output = []
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def add_report(self, name: str, dsdt: bool = True) -> str:
+		path = os.path.join(self.drop, name)
+		os.makedirs(os.path.join(path, 'SysReport', 'ACPI'))
+		if dsdt:
+			with open(os.path.join(path, 'SysReport', 'ACPI', 'DSDT.aml'), 'wb') as f:
+				f.write(synthetic.wrap_aml(synthetic.generate_dsl(objects=100)))
+		return path
+
+	def get_watcher(self, **kwargs) -> watcher.Watcher:
+		w = watcher.Watcher(self.drop, stub_iasl, {'cache': False}, 1, log=self.output.append, **kwargs)
+		self.addCleanup(w.pool.shutdown)
+		return w
+
+	def test_candidates(self):
+		report = self.add_report('Report')
+		for name in ('.Hidden.zip', 'Report.zip.part', 'Report.tar.crdownload', 'Report.gtools', 'Report.gtools.json', 'Folder'):
+			os.mkdir(os.path.join(self.drop, name)) if '.' not in name[1:] else open(os.path.join(self.drop, name), 'w').close()
+		open(os.path.join(self.drop, 'Report.zip'), 'w').close()
+		self.assertEqual(sorted(x for x in os.listdir(self.drop) if watcher.is_candidate(os.path.join(self.drop, x))), ['Report', 'Report.zip'])
+		self.assertTrue(watcher.is_candidate(report))
+
+	def test_settle(self):
+		w = self.get_watcher(settle=60, polling=True)
+		path = self.add_report('Report')
+		w.scan()
+		# Not touched for long enough yet - neither queued nor given a status
+		self.assertEqual(list(w.pending), [path])
+		self.assertFalse(w.ready)
+		self.assertEqual(watcher.read_status(path), {})
+		signature, since = w.pending[path]
+		# Still being written, the wait starts over
+		w.pending[path] = (signature, since - 59)
+		with open(os.path.join(path, 'SysReport', 'ACPI', 'SSDT-1.aml'), 'wb') as f:
+			f.write(b'SSDT')
+		w.scan({path})
+		self.assertNotEqual(w.pending[path][0], signature)
+		self.assertGreaterEqual(w.pending[path][1], since)
+		self.assertFalse(w.ready)
+		# Untouched since
+		signature, since = w.pending[path]
+		w.pending[path] = (signature, since - 60)
+		w.scan(set())
+		self.assertEqual(list(w.ready), [(path, signature)])
+		self.assertFalse(w.pending)
+		status = watcher.read_status(path)
+		self.assertEqual((status['state'], status['signature'], status['results']), ('queued', list(signature), path + '.gtools'))
+		self.assertEqual(self.output[-1], 'Report: queued')
+
+	def test_status(self):
+		path = self.add_report('Report')
+		self.assertEqual(watcher.read_status(path), {})
+		watcher.write_status(path, state='queued', error=None)
+		self.assertEqual(watcher.write_status(path, state='done'), {'state': 'done', 'error': None})
+		# Written aside then renamed, nothing left behind
+		self.assertEqual(sorted(os.listdir(self.drop)), ['Report', 'Report.gtools.json'])
+		# Processed already as it is, say before a restart - only picked up again once it changes
+		signature = watcher.get_signature(path)
+		watcher.write_status(path, signature=list(signature))
+		w = self.get_watcher(settle=0, polling=True)
+		w.scan()
+		self.assertEqual((w.seen, w.pending, list(w.ready)), ({path: signature}, {}, []))
+		time.sleep(0.01)
+		with open(os.path.join(path, 'SysReport', 'ACPI', 'DSDT.aml'), 'ab') as f:
+			f.write(b'\0')
+		w.scan()
+		self.assertEqual(list(w.ready), [(path, watcher.get_signature(path))])
+
+	@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is Linux only')
+	def test_inotify(self):
+		w = self.get_watcher(settle=60)
+		self.assertIsNotNone(w.inotify)
+		path = self.add_report('Report')
+		# The report folder the change happened in, however deep
+		entries = set()
+		deadline = time.monotonic() + 5
+		while not entries and time.monotonic() < deadline:
+			entries |= w.wait()
+		self.assertEqual(entries, {path})
+
+	def run_once(self) -> int:
+		handler = signal.getsignal(signal.SIGTERM)
+		try:
+			return watcher.main([self.drop, '--once', '--polling', '--settle', '0', '--poll-interval', '0.1', '--workers', '1', '--no-cache', '--iasl-bin', stub_iasl])
+		finally:
+			signal.signal(signal.SIGTERM, handler)
+
+	def test_once(self):
+		self.assertEqual(self.run_once(), 0)
+		good = self.add_report('Good')
+		self.assertEqual(self.run_once(), 0)
+		status = watcher.read_status(good)
+		self.assertEqual((status['state'], status['error'], status['signature']), ('done', None, list(watcher.get_signature(good))))
+		self.assertTrue(os.path.isdir(good + '.gtools'))
+		# Any failed report gives 1
+		bad = self.add_report('Bad', dsdt=False)
+		self.assertEqual(self.run_once(), 1)
+		self.assertEqual(watcher.read_status(bad)['state'], 'failed')
+		self.assertIn('No DSDT.aml', watcher.read_status(bad)['error'])
+
+if __name__=='__main__':
+	unittest.main()